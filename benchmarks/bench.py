@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Benchmarks of the hot paths
+# :Created:   sab 17 ott 2026 21:40:26 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+"""Measure the latency of the hot paths of the package.
+
+The benchmarks cover the compilation of statements, the JSON codecs, the
+round-trips of the functions against a live PostgreSQL server and the paging
+of a ``AsyncpgProxiedQuery``: those needing the server are skipped when it is
+not reachable.
+
+Each benchmark is executed for a few rounds, of as many iterations as needed
+to last a fraction of ``--min-time`` seconds each, and the time of the single
+operation in the best, median and mean round is saved into a JSON file,
+together with the versions of the relevant packages. Passing a previous
+outcome with ``--compare`` prints how each timing changed.
+
+The connection to the server is configured by the same environment variables
+used by the test suite, ``PG_HOST``, ``POSTGRES_USER`` and
+``POSTGRES_PASSWORD``: a ``sasyncpg_bench`` database is created and then
+dropped at the end.
+"""
+
+import argparse
+import asyncio
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from functools import partial
+import json
+import os
+import platform
+from statistics import mean, median
+import sys
+from time import perf_counter, strftime
+
+import asyncpg
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+from metapensiero.sqlalchemy.asyncpg import (Connection, compile, fetchall, fetchone,
+                                             execute, register_custom_codecs, scalar)
+from metapensiero.sqlalchemy.asyncpg.funcs import (_dialect, cache_compilation,
+                                                   compiled_cache)
+from metapensiero.sqlalchemy.asyncpg.proxy import AsyncpgProxiedQuery
+from metapensiero.sqlalchemy.asyncpg.types import JSON_BACKENDS, json_codecs
+
+
+ROUNDS = 5
+"The number of measured rounds of each benchmark."
+
+ROWS = 1000
+"The number of records in the table used by the database benchmarks."
+
+
+metadata = sa.MetaData()
+
+items = sa.Table('items', metadata,
+                 sa.Column('id', sa.Integer, primary_key=True),
+                 sa.Column('name', sa.String(50), nullable=False),
+                 sa.Column('price', sa.Numeric(10, 2)),
+                 sa.Column('created', sa.DateTime(timezone=True)),
+                 sa.Column('details', JSONB))
+
+tags = sa.Table('tags', metadata,
+                sa.Column('item_id', sa.Integer, sa.ForeignKey('items.id')),
+                sa.Column('tag', sa.String(20)))
+
+wide = sa.Table('wide', metadata,
+                *[sa.Column('c%03d' % i, sa.Integer) for i in range(200)])
+
+
+def _document(n=20):
+    return {
+        'name': 'Item %d' % n,
+        'price': Decimal('12.34'),
+        'created': datetime(2026, 10, 17, 12, 30, tzinfo=timezone.utc),
+        'valid': date(2027, 1, 1),
+        'tags': ['tag%d' % i for i in range(n)],
+        'attributes': {'key%d' % i: i * 1.5 for i in range(n)},
+    }
+
+
+# Compilation
+
+def _simple():
+    return sa.select([items.c.id, items.c.name]).where(items.c.id == 1)
+
+
+def _complex():
+    alltags = tags.alias('alltags')
+    ntags = sa.select([sa.func.count()]) \
+              .where(alltags.c.item_id == items.c.id) \
+              .as_scalar().label('ntags')
+    return sa.select([items.c.id, items.c.name, items.c.price, ntags]) \
+             .select_from(items.outerjoin(tags, tags.c.item_id == items.c.id)) \
+             .where(items.c.price.between(sa.bindparam('min'), sa.bindparam('max'))) \
+             .where(items.c.name.like('Item%')) \
+             .where(tags.c.tag.in_(['a', 'b', 'c'])) \
+             .group_by(items.c.id) \
+             .order_by(items.c.name.desc()) \
+             .limit(25).offset(50)
+
+
+def _wide():
+    return wide.insert().values({c.name: 1 for c in wide.c})
+
+
+def _in_list(count=1000):
+    return sa.select([items.c.id]).where(items.c.id.in_(list(range(count))))
+
+
+def _uncached(stmt, named_args=None):
+    def run():
+        compiled_cache.clear()
+        compile(stmt, named_args=named_args)
+    return run
+
+
+def _cached(stmt, named_args=None):
+    stmt = cache_compilation(stmt)
+
+    def run():
+        compile(stmt, named_args=named_args)
+    return run
+
+
+def compile_benchmarks():
+    args = {'min': 1, 'max': 100}
+    return [
+        ('compile.simple', _uncached(_simple())),
+        ('compile.simple.cached', _cached(_simple())),
+        ('compile.complex', _uncached(_complex(), args)),
+        ('compile.complex.cached', _cached(_complex(), args)),
+        ('compile.wide', _uncached(_wide())),
+        ('compile.in_list', _uncached(_in_list())),
+    ] + [
+        # The cost of the placeholders, growing with their number
+        ('compile.in_list.%d' % count, _uncached(_in_list(count)))
+        for count in (10, 100, 2000)
+    ]
+
+
+# Codecs
+
+def codec_benchmarks():
+    document = _document()
+    benchmarks = []
+    for backend in JSON_BACKENDS:
+        try:
+            encode, decode, jsonb_encode, jsonb_decode = json_codecs(backend)
+        except ImportError:
+            print('Skipping the %s codecs, not installed' % backend, file=sys.stderr)
+            continue
+        encoded = encode(document)
+        binary = jsonb_encode(document)
+        benchmarks.extend([
+            ('codec.%s.json_encode' % backend, partial(encode, document)),
+            ('codec.%s.json_decode' % backend, partial(decode, encoded)),
+            ('codec.%s.jsonb_encode' % backend, partial(jsonb_encode, document)),
+            ('codec.%s.jsonb_decode' % backend, partial(jsonb_decode, binary)),
+        ])
+    return benchmarks
+
+
+# Database
+
+def database_benchmarks(apgc):
+    byid = sa.select([items.c.name]).where(items.c.id == sa.bindparam('id'))
+    page = sa.select([items]).order_by(items.c.id).limit(100)
+    details = sa.select([items.c.details]).order_by(items.c.id).limit(100)
+    update = items.update() \
+                  .where(items.c.id == sa.bindparam('key')) \
+                  .values(price=sa.bindparam('price'))
+    proxy = AsyncpgProxiedQuery(sa.select([items]))
+    connection = Connection(apgc)
+
+    return [
+        ('db.scalar', lambda: scalar(apgc, byid, named_args={'id': 1})),
+        ('db.fetchone', lambda: fetchone(apgc, byid, named_args={'id': 1})),
+        ('db.fetchall', lambda: fetchall(apgc, page)),
+        ('db.fetchall.jsonb', lambda: fetchall(apgc, details)),
+        ('db.fetchall.jsonb.raw', lambda: fetchall(apgc, details, raw_json=True)),
+        ('db.execute', lambda: execute(apgc, update,
+                                       named_args={'key': 1, 'price': Decimal('1.00')})),
+        ('proxy.page', lambda: proxy(connection, start=100, limit=25,
+                                     sorters='[{"property":"name"}]')),
+        ('proxy.page.count', lambda: proxy(connection, start=100, limit=25,
+                                           result='rows', count='count')),
+    ]
+
+
+async def setup_database(dsn_args):
+    try:
+        adminconn = await asyncpg.connect(database='postgres', **dsn_args)
+    except (OSError, asyncpg.PostgresError) as e:
+        print('Skipping the database benchmarks: %s' % e, file=sys.stderr)
+        return None, None
+
+    await adminconn.execute('DROP DATABASE IF EXISTS sasyncpg_bench')
+    await adminconn.execute('CREATE DATABASE sasyncpg_bench')
+    apgc = await asyncpg.connect(database='sasyncpg_bench', **dsn_args)
+    await apgc.execute('CREATE EXTENSION hstore')
+    await register_custom_codecs(apgc)
+    for table in metadata.sorted_tables:
+        await apgc.execute(str(sa.schema.CreateTable(table).compile(dialect=_dialect)))
+    await apgc.copy_records_to_table(
+        'items', columns=('id', 'name', 'price', 'created', 'details'),
+        records=[(i, 'Item %d' % i, Decimal(i) / 4, datetime.now(timezone.utc),
+                  _document(i % 10))
+                 for i in range(1, ROWS + 1)])
+    await apgc.execute('ANALYZE')
+    return adminconn, apgc
+
+
+async def teardown_database(adminconn, apgc):
+    await apgc.close()
+    await adminconn.execute('DROP DATABASE sasyncpg_bench')
+    await adminconn.close()
+
+
+# Runner
+
+async def measure(function, min_time):
+    """Execute `function` repeatedly, returning the timings of the single
+    operation, one for each round.
+    """
+
+    is_async = asyncio.iscoroutinefunction(function)
+
+    async def run(iterations):
+        start = perf_counter()
+        if is_async:
+            for i in range(iterations):
+                await function()
+        else:
+            for i in range(iterations):
+                result = function()
+                if asyncio.iscoroutine(result):
+                    await result
+        return perf_counter() - start
+
+    # Calibrate the number of iterations so that each round lasts about
+    # min_time/ROUNDS seconds
+    iterations = 1
+    while True:
+        elapsed = await run(iterations)
+        if elapsed >= min_time / ROUNDS / 10:
+            break
+        iterations *= 10
+    iterations = max(1, int(iterations * min_time / ROUNDS / elapsed))
+
+    return iterations, [await run(iterations) / iterations for r in range(ROUNDS)]
+
+
+async def run_benchmarks(options):
+    benchmarks = compile_benchmarks() + codec_benchmarks()
+
+    dsn_args = {}
+    for var, arg in (('PG_HOST', 'host'),
+                     ('POSTGRES_USER', 'user'),
+                     ('POSTGRES_PASSWORD', 'password')):
+        if var in os.environ:
+            dsn_args[arg] = os.environ[var]
+
+    adminconn = apgc = None
+    if not options.no_database:
+        adminconn, apgc = await setup_database(dsn_args)
+        if apgc is not None:
+            benchmarks += database_benchmarks(apgc)
+
+    results = {}
+    try:
+        for name, function in benchmarks:
+            if options.filter and not any(f in name for f in options.filter):
+                continue
+            iterations, timings = await measure(function, options.min_time)
+            results[name] = {
+                'iterations': iterations,
+                'min': min(timings),
+                'median': median(timings),
+                'mean': mean(timings),
+                'ops': 1 / median(timings),
+            }
+            print('%-24s %12.2f µs %12.0f ops/s' % (
+                name, results[name]['median'] * 1e6, results[name]['ops']))
+    finally:
+        if apgc is not None:
+            server_version = '.'.join(map(str, apgc.get_server_version()[:2]))
+            await teardown_database(adminconn, apgc)
+        else:
+            server_version = None
+
+    return {
+        'timestamp': strftime('%Y-%m-%dT%H:%M:%S'),
+        'versions': {
+            'python': platform.python_version(),
+            'sqlalchemy': sa.__version__,
+            'asyncpg': asyncpg.__version__,
+            'postgresql': server_version,
+            'package': _package_version(),
+        },
+        'benchmarks': results,
+    }
+
+
+def _package_version():
+    try:
+        from pkg_resources import get_distribution
+        return get_distribution('metapensiero.sqlalchemy.asyncpg').version
+    except Exception:  # pragma: nocover
+        return None
+
+
+def compare(results, previous):
+    "Print the change of each median timing with respect to a `previous` outcome."
+
+    print('\n%-24s %12s %12s %8s' % ('benchmark', 'before', 'after', 'change'))
+    for name, result in sorted(results['benchmarks'].items()):
+        before = previous['benchmarks'].get(name)
+        if before is None:
+            continue
+        change = (result['median'] - before['median']) / before['median'] * 100
+        print('%-24s %9.2f µs %9.2f µs %+7.1f%%' % (
+            name, before['median'] * 1e6, result['median'] * 1e6, change))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-o', '--output', default=None,
+                        help='The JSON file where the results are saved, by default'
+                        ' benchmark-<timestamp>.json')
+    parser.add_argument('-c', '--compare', default=None, metavar='JSON',
+                        help='Compare the results with those in the given file')
+    parser.add_argument('-k', '--filter', action='append',
+                        help='Execute only the benchmarks whose name contains the given'
+                        ' string, may be repeated')
+    parser.add_argument('-t', '--min-time', type=float, default=1.0,
+                        help='The minimum duration of each benchmark, in seconds')
+    parser.add_argument('--no-database', action='store_true',
+                        help='Skip the benchmarks that need a PostgreSQL server')
+    options = parser.parse_args(args)
+
+    results = asyncio.get_event_loop().run_until_complete(run_benchmarks(options))
+
+    output = options.output or strftime('benchmark-%Y%m%d-%H%M%S.json')
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('\nResults saved in %s' % output)
+
+    if options.compare:
+        with open(options.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -53,6 +53,15 @@ setup(
         'sqlalchemy',
     ],
     extras_require={
+        'numpy': [
+            'numpy',
+        ],
+        'orjson': [
+            'orjson',
+        ],
+        'ujson': [
+            'ujson',
+        ],
         'dev': [
             'metapensiero.tool.bump-version',
             'pytest',
@@ -6,24 +6,43 @@
 # :Copyright: © 2017 Lele Gaifax
 #
 
+from .columnar import fetch_columns
 from .connection import Connection
-from .funcs import (UnexpectedResultError, compile, execute, fetchall,
-                    fetchone, prepare, scalar)
-from .types import Interval, Range, json_decode, json_encode, register_custom_codecs
+from .database import Database
+from .funcs import (UnexpectedResultError, cache_compilation, compile, copy_records,
+                    execute, executemany, fetch_batches, fetchall, fetchone,
+                    iterate, prepare, scalar)
+from .hooks import hooks
+from .replication import ReplicatedDatabase
+from .stats import statistics
+from .types import (Interval, Range, RawJSON, json_decode, json_encode, raw_json,
+                    register_custom_codecs)
 
 
 __all__ = (
     'Connection',
+    'Database',
     'Interval',
     'Range',
+    'RawJSON',
+    'ReplicatedDatabase',
     'UnexpectedResultError',
+    'cache_compilation',
     'compile',
+    'copy_records',
     'execute',
+    'executemany',
+    'fetch_batches',
+    'fetch_columns',
     'fetchall',
     'fetchone',
+    'hooks',
+    'iterate',
     'json_decode',
     'json_encode',
     'prepare',
+    'raw_json',
     'register_custom_codecs',
     'scalar',
+    'statistics',
 )
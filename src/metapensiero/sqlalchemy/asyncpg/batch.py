@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Batches of statements
+# :Created:   sab 17 ott 2026 20:31:09 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+from asyncio import get_event_loop
+import logging
+
+from asyncpg.exceptions import InternalClientError
+from sqlalchemy.sql.selectable import SelectBase
+
+from .funcs import _compile, _dialect, fetchall, fetchone, scalar
+
+
+logger = logging.getLogger(__name__)
+
+
+_FUNCTIONS = {'fetchall': fetchall, 'fetchone': fetchone, 'scalar': scalar}
+
+
+class _Item:
+    "A single statement of a batch."
+
+    __slots__ = ('kind', 'stmt', 'pos_args', 'named_args', 'entry', 'keys', 'future')
+
+    def __init__(self, kind, stmt, pos_args, named_args):
+        if not isinstance(stmt, SelectBase):
+            raise ValueError('Only SQLAlchemy SELECTs can be batched')
+        self.kind = kind
+        self.stmt = stmt
+        self.pos_args = pos_args
+        self.named_args = named_args
+        self.entry = _compile(stmt, _dialect)
+        result_columns = self.entry.compiled._result_columns
+        self.keys = [keyname for keyname, _, _, _ in result_columns]
+        self.future = get_event_loop().create_future()
+
+    def result(self, records):
+        "Shape the list of `records`, each a tuple, as the kind of the item."
+
+        if self.kind == 'fetchall':
+            keys = self.keys
+            return [dict(zip(keys, record)) for record in records]
+        elif not records:
+            return None
+        elif self.kind == 'fetchone':
+            return dict(zip(self.keys, records[0]))
+        else:
+            return records[0][0]
+
+
+class Batch:
+    r"""Collect several ``SELECT``\ s and execute them in a single round-trip.
+
+    :param connection: a :class:`~.connection.Connection` instance
+
+    Each of :meth:`fetchall()`, :meth:`fetchone()` and :meth:`scalar()`
+    appends a statement to the batch and returns a future, that gets the
+    result of that statement when the batch is executed, either explicitly
+    by :meth:`execute()` or at the end of the ``async with`` block:
+
+    .. code-block:: python
+
+       async with connection.batch() as batch:
+           user = batch.fetchone(user_query, named_args={'id': user_id})
+           count = batch.scalar(count_query)
+           news = batch.fetchall(news_query)
+       user = await user
+
+    All the statements are combined into a single one, each becoming a
+    subquery that aggregates its records in an array, so that the whole batch
+    costs a single round-trip, whatever the number of statements. This
+    implies that:
+
+    1. only SQLAlchemy ``SELECT``\ s can be batched, since the names of their
+       columns are needed to rebuild the records
+
+    2. the records are returned as plain dictionaries, as asyncpg does not
+       allow to build its ``Record``\ s
+
+    3. the order of the records is the one specified by the statement, as
+       PostgreSQL aggregates them in the order they are produced by the
+       subquery
+
+    asyncpg cannot decode some types, for example ranges, when they are
+    within an anonymous record: in that case the statements are transparently
+    executed one at a time.
+    """
+
+    __slots__ = ('connection', 'items', 'executed')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.items = []
+        self.executed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.execute()
+        else:
+            self._cancel()
+
+    def _append(self, kind, stmt, pos_args, named_args):
+        if self.executed:
+            raise RuntimeError('The batch has already been executed')
+        item = _Item(kind, stmt, pos_args, named_args)
+        self.items.append(item)
+        return item.future
+
+    def _cancel(self):
+        for item in self.items:
+            if not item.future.done():
+                item.future.cancel()
+
+    def fetchall(self, stmt, pos_args=None, named_args=None):
+        """Append `stmt` to the batch.
+
+        :return: a future, that will get the list of records
+        """
+
+        return self._append('fetchall', stmt, pos_args, named_args)
+
+    def fetchone(self, stmt, pos_args=None, named_args=None):
+        """Append `stmt` to the batch.
+
+        :return: a future, that will get the first record or ``None``
+        """
+
+        return self._append('fetchone', stmt, pos_args, named_args)
+
+    def scalar(self, stmt, pos_args=None, named_args=None):
+        """Append `stmt` to the batch.
+
+        :return: a future, that will get the value of the first column of the
+                 first record, or ``None``
+        """
+
+        return self._append('scalar', stmt, pos_args, named_args)
+
+    def compile(self):
+        """Combine the statements of the batch into a single one.
+
+        :return: a tuple of two items, the SQL and its positional arguments
+        """
+
+        subqueries = []
+        args = []
+        for i, item in enumerate(self.items):
+            sql = item.entry.compiled.renumbered(len(args))
+            item_args = item.entry.params(item.named_args)
+            if item.kind != 'fetchall':
+                sql = 'SELECT * FROM (%s) AS _batched LIMIT 1' % sql
+            subqueries.append('(SELECT array_agg(_batched) FROM (%s) AS _batched) AS r%d'
+                              % (sql, i))
+            args.extend(item_args)
+        return 'SELECT ' + ', '.join(subqueries), args
+
+    async def execute(self):
+        """Execute the batch, setting the result of each future.
+
+        :return: the list of the results, in order
+        """
+
+        if self.executed:
+            raise RuntimeError('The batch has already been executed')
+        self.executed = True
+
+        items = self.items
+        if not items:
+            return []
+
+        sql, args = self.compile()
+        runner = self.connection._runner
+        try:
+            try:
+                record = await fetchone(runner, sql, args)
+            except InternalClientError as e:
+                logger.debug('Cannot execute the batch in a single round-trip: %s', e)
+                results = [await self._execute_item(runner, item) for item in items]
+            else:
+                results = [item.result(records or ())
+                           for item, records in zip(items, record)]
+        except BaseException:
+            self._cancel()
+            raise
+
+        for item, result in zip(items, results):
+            item.future.set_result(result)
+        return results
+
+    async def _execute_item(self, runner, item):
+        result = await _FUNCTIONS[item.kind](runner, item.stmt, item.pos_args,
+                                             item.named_args)
+        if item.kind == 'fetchall':
+            return [dict(record) for record in result]
+        elif item.kind == 'fetchone' and result is not None:
+            return dict(result)
+        else:
+            return result
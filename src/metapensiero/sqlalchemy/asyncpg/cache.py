@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Simple caches
+# :Created:   sab 17 ott 2026 10:12:31 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+from collections import OrderedDict
+from time import monotonic
+
+
+class LRUCache:
+    """A size-bounded mapping that discards the least recently used items.
+
+    :param size: the maximum number of items, ``0`` to disable the cache
+    :param ttl: either ``None`` or the number of seconds after which an item
+                expires
+
+    Beside the items, the instance keeps track of the number of `hits`,
+    `misses` and `evictions`, to ease the tuning of its `size`. A lookup of
+    an expired item counts as a miss.
+    """
+
+    __slots__ = ('_items', '_expires', '_size', 'ttl', 'hits', 'misses', 'evictions')
+
+    def __init__(self, size, ttl=None):
+        self._items = OrderedDict()
+        self._expires = {}
+        self._size = size
+        self.ttl = ttl
+        self.hits = self.misses = self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def size(self):
+        "The maximum number of items, ``0`` to disable the cache."
+
+        return self._size
+
+    @size.setter
+    def size(self, size):
+        self._size = size
+        self._evict()
+
+    def _evict(self):
+        items = self._items
+        while len(items) > max(self._size, 0):
+            key, _ = items.popitem(last=False)
+            self._expires.pop(key, None)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        """Return the value associated with `key`, or `default` if missing.
+
+        A successful lookup marks the item as the most recently used one.
+        """
+
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        expires = self._expires.get(key)
+        if expires is not None and expires < monotonic():
+            self.pop(key)
+            self.misses += 1
+            return default
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        """Associate `value` to `key`, evicting older items when needed.
+
+        The item expires after `ttl` seconds, by default the `ttl` of the
+        cache.
+        """
+
+        if self._size > 0:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if ttl is None:
+                ttl = self.ttl
+            if ttl is not None:
+                self._expires[key] = monotonic() + ttl
+            else:
+                self._expires.pop(key, None)
+            self._evict()
+
+    def pop(self, key, default=None):
+        "Remove `key` from the cache, returning its value or `default`."
+
+        self._expires.pop(key, None)
+        return self._items.pop(key, default)
+
+    def clear(self):
+        "Remove all the items, resetting the counters too."
+
+        self._items.clear()
+        self._expires.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        "Return a dictionary with the current counters."
+
+        return {
+            'size': self._size,
+            'length': len(self._items),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
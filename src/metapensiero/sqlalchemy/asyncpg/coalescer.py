@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Deduplication of concurrent requests
+# :Created:   sab 17 ott 2026 18:20:44 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+from asyncio import CancelledError, get_event_loop, shield
+
+
+class _Abandoned(Exception):
+    "Set on the shared outcome when the request computing it gets cancelled."
+
+
+class Coalescer:
+    """Share the execution of identical concurrent requests.
+
+    While a request identified by a given key is running, any other request
+    with the same key simply waits for its outcome, instead of being executed
+    again.
+
+    When the request that is actually running gets cancelled, for example
+    because its client went away, the waiting ones are not: they try again,
+    one of them taking its place.
+
+    The instance keeps track of the total number of `calls` and of the
+    `coalesced` ones.
+    """
+
+    __slots__ = ('_inflight', 'calls', 'coalesced')
+
+    def __init__(self):
+        self._inflight = {}
+        self.calls = self.coalesced = 0
+
+    async def run(self, key, compute):
+        """Return the outcome of `compute`, or of an in-flight request with the
+        same `key`.
+
+        :param key: any hashable value
+        :param compute: a function returning an awaitable
+        """
+
+        self.calls += 1
+        inflight = self._inflight.get(key)
+        while inflight is not None:
+            self.coalesced += 1
+            try:
+                return await shield(inflight)
+            except _Abandoned:
+                self.coalesced -= 1
+                inflight = self._inflight.get(key)
+
+        future = self._inflight[key] = get_event_loop().create_future()
+        try:
+            result = await compute()
+        except CancelledError:
+            # Wake up the waiting requests, that will try again
+            future.set_exception(_Abandoned())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Avoid the "exception was never retrieved" warning when nobody
+            # is waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._inflight[key]
+        return result
+
+    def stats(self):
+        "Return a dictionary with the current counters."
+
+        return {
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'inflight': len(self._inflight),
+        }
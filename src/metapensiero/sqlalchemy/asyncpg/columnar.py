@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Columnar results
+# :Created:   sab 17 ott 2026 12:02:47 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+from array import array
+from datetime import date, datetime, timezone
+
+from sqlalchemy.schema import Column
+from sqlalchemy.types import Boolean, Date, DateTime, Float, Integer
+
+from .funcs import _compile, _dialect, fetch_batches
+
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_EPOCH = datetime(1970, 1, 1)
+_UTC_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _days(value):
+    return value.toordinal() - _EPOCH_ORDINAL
+
+
+def _microseconds(value):
+    delta = value - (_EPOCH if value.tzinfo is None else _UTC_EPOCH)
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+class _ColumnBuilder:
+    "Accumulate the values of a single column, batch after batch."
+
+    __slots__ = ('name', 'nullable', 'typecode', 'dtype', 'convert', 'values', 'mask')
+
+    def __init__(self, name, type, nullable, numpy):
+        self.name = name
+        self.nullable = nullable
+        # The typecode of the array, the NumPy dtype and the function that
+        # converts each value to the array item
+        if isinstance(type, Integer):
+            kind = ('q', 'int64', None)
+        elif isinstance(type, Float):
+            kind = ('d', 'float64', None)
+        elif isinstance(type, Boolean):
+            kind = ('b', 'bool', None)
+        elif isinstance(type, DateTime) and numpy is not None:
+            kind = ('q', 'datetime64[us]', _microseconds)
+        elif isinstance(type, Date) and numpy is not None:
+            kind = ('q', 'datetime64[D]', _days)
+        else:
+            kind = (None, object, None)
+        self.typecode, self.dtype, self.convert = kind
+        self.values = array(self.typecode) if self.typecode is not None else []
+        self.mask = None
+
+    def extend(self, values):
+        if self.typecode is None:
+            self.values.extend(values)
+            return
+
+        convert = self.convert
+        if None in values:
+            if self.mask is None:
+                self.mask = array('b', bytes(len(self.values)))
+            self.mask.extend(v is None for v in values)
+            if convert is None:
+                values = [0 if v is None else v for v in values]
+            else:
+                values = [0 if v is None else convert(v) for v in values]
+        else:
+            if self.mask is not None:
+                self.mask.extend(bytes(len(values)))
+            if convert is not None:
+                values = [convert(v) for v in values]
+        self.values.extend(values)
+
+    def result(self, numpy):
+        values = self.values
+        mask = self.mask
+
+        if self.typecode is None:
+            if numpy is None:
+                return values
+            result = numpy.empty(len(values), dtype=object)
+            result[:] = values
+            if self.nullable or None in values:
+                mask = [v is None for v in values]
+        elif numpy is None:
+            if mask is None:
+                return values
+            # There is no way to carry the NULLs in an array
+            return [None if m else v for v, m in zip(values.tolist(), mask)]
+        elif self.convert is not None:
+            result = numpy.frombuffer(values, dtype='int64').view(self.dtype)
+        elif self.dtype == 'bool':
+            result = numpy.frombuffer(values, dtype='int8').astype(bool)
+        else:
+            result = numpy.frombuffer(values, dtype=self.dtype)
+
+        if mask is not None or self.nullable:
+            result = numpy.ma.masked_array(
+                result, mask=(numpy.zeros(len(result), dtype=bool) if mask is None
+                              else numpy.array(mask, dtype=bool)))
+        return result
+
+
+def _column_builders(stmt, names, numpy):
+    if isinstance(stmt, str):
+        return [_ColumnBuilder(name, None, True, numpy) for name in names]
+
+    result_columns = _compile(stmt, _dialect).compiled._result_columns
+    if names is None:
+        names = [keyname for keyname, _, _, _ in result_columns]
+    builders = []
+    for name, (_, _, objects, type) in zip(names, result_columns):
+        nullable = any(o.nullable for o in objects if isinstance(o, Column))
+        builders.append(_ColumnBuilder(name, type, nullable, numpy))
+    return builders
+
+
+async def fetch_columns(apgconn, stmt, pos_args=None, named_args=None, batch_size=10000,
+                        **kwargs):
+    r"""Execute the given statement on a asyncpg connection and return its
+    result as a set of columns.
+
+    :param apgconn: an asyncpg Connection__ instance
+    :param stmt: any SQLAlchemy core statement or a raw SQL instruction
+    :param pos_args: a possibly empty sequence of positional arguments
+    :param named_args: a possibly empty mapping of named arguments
+    :param batch_size: the number of records fetched at a time
+    :param \*\*kwargs: any valid :func:`.fetch_batches` keyword argument
+    :return: a dictionary, mapping each column name to its values
+
+    The records are fetched thru :func:`.fetch_batches` and their values are
+    accumulated column by column, without keeping the records around.
+
+    When NumPy__ is available each column is returned as an array, with a
+    dtype selected on the SQLAlchemy type of the selected column: ``int64``
+    for integers, ``float64`` for floats, ``bool`` for booleans,
+    ``datetime64[D]`` for dates, ``datetime64[us]`` for timestamps, where
+    timezone aware ones are expressed in UTC, and ``object`` for everything
+    else. Nullable columns, and any column actually containing a ``NULL``,
+    are returned as `masked arrays`__.
+
+    Without NumPy, integers, floats and booleans are returned as
+    :class:`array.array` instances if they do not contain ``NULL``\ s, and
+    everything else as plain lists.
+
+    When `stmt` is a raw SQL instruction its column types are unknown, and all
+    of them are handled as ``object``\ s.
+
+    __ https://magicstack.github.io/asyncpg/devel/api/index.html#connection
+    __ http://www.numpy.org/
+    __ https://docs.scipy.org/doc/numpy/reference/maskedarray.html
+    """
+
+    try:
+        import numpy
+    except ImportError:  # pragma: nocover
+        numpy = None
+
+    builders = None
+    async for batch in fetch_batches(apgconn, stmt, pos_args, named_args, batch_size,
+                                     **kwargs):
+        if builders is None:
+            builders = _column_builders(stmt, batch[0].keys(), numpy)
+        for builder, values in zip(builders, zip(*batch)):
+            builder.extend(values)
+
+    if builders is None:
+        if isinstance(stmt, str):
+            return {}
+        builders = _column_builders(stmt, None, numpy)
+
+    return {builder.name: builder.result(numpy) for builder in builders}
@@ -6,21 +6,183 @@
 # :Copyright: © 2017 Lele Gaifax
 #
 
-from .funcs import compile, execute, fetchall, fetchone, prepare, scalar
+from asyncpg.exceptions import InvalidCachedStatementError, OutdatedSchemaCacheError
+
+from .batch import Batch
+from .cache import LRUCache
+from .columnar import fetch_columns
+from .funcs import (compile, copy_records, execute, executemany, fetch_batches,
+                    fetchall, fetchone, iterate, prepare, scalar)
+
+
+class PreparedStatementsCache(LRUCache):
+    r"""A :class:`~.cache.LRUCache` of asyncpg `PreparedStatement`__\ s.
+
+    Beside the usual counters it tracks the number of `invalidations`, that is
+    the prepared statements discarded due to schema changes.
+
+    __ https://magicstack.github.io/asyncpg/current/api/index.html\
+       #asyncpg.prepared_stmt.PreparedStatement
+    """
+
+    __slots__ = ('invalidations',)
+
+    def __init__(self, size):
+        super().__init__(size)
+        self.invalidations = 0
+
+    def clear(self):
+        super().clear()
+        self.invalidations = 0
+
+    def stats(self):
+        stats = super().stats()
+        stats['invalidations'] = self.invalidations
+        return stats
+
+
+class _PreparingConnection:
+    """Wrapper around an asyncpg connection that executes the statements thru
+    a cache of prepared statements.
+
+    This exposes the subset of the asyncpg connection API used by the
+    :mod:`.funcs` functions, delegating anything else to the wrapped one.
+    """
+
+    __slots__ = ('apgc', 'statements')
+
+    def __init__(self, apgconnection, size):
+        self.apgc = apgconnection
+        self.statements = PreparedStatementsCache(size)
+
+    def __getattr__(self, name):
+        return getattr(self.apgc, name)
+
+    async def _run(self, method, sql, args, kwargs):
+        statements = self.statements
+        stmt = statements.get(sql)
+        if stmt is None:
+            stmt = await self.apgc.prepare(sql)
+            statements.set(sql, stmt)
+        try:
+            return stmt, await getattr(stmt, method)(*args, **kwargs)
+        except (InvalidCachedStatementError, OutdatedSchemaCacheError):
+            statements.pop(sql)
+            statements.invalidations += 1
+            # Within a transaction the error is fatal, as it is already aborted
+            if self.apgc.is_in_transaction():
+                raise
+            stmt = await self.apgc.prepare(sql)
+            statements.set(sql, stmt)
+            return stmt, await getattr(stmt, method)(*args, **kwargs)
+
+    async def execute(self, sql, *args, **kwargs):
+        # Without arguments asyncpg uses the simple query protocol, that allows
+        # multiple statements in a single script
+        if not args:
+            return await self.apgc.execute(sql, **kwargs)
+        stmt, result = await self._run('fetch', sql, args, kwargs)
+        return stmt.get_statusmsg()
+
+    async def fetch(self, sql, *args, **kwargs):
+        return (await self._run('fetch', sql, args, kwargs))[1]
+
+    async def fetchrow(self, sql, *args, **kwargs):
+        return (await self._run('fetchrow', sql, args, kwargs))[1]
+
+    async def fetchval(self, sql, *args, **kwargs):
+        return (await self._run('fetchval', sql, args, kwargs))[1]
 
 
 class Connection:
     """Class wrapper to low level functions.
 
     :param apgconnection: an AsyncPG Connection__ instance
+    :param prepared_statements_cache_size: when greater than zero, the maximum
+                                           number of prepared statements kept
+                                           by the instance
+    :param coalescer: either ``None`` or a :class:`~.coalescer.Coalescer`
+                      instance, usually shared by several instances
+
+    When `prepared_statements_cache_size` is given, the statements executed
+    with :meth:`execute()`, :meth:`fetchall()`, :meth:`fetchone()` and
+    :meth:`scalar()` are explicitly prepared and kept in a
+    :class:`PreparedStatementsCache`, accessible as
+    :attr:`prepared_statements`, so that they are parsed and planned just once
+    for the lifetime of the instance. Prepared statements invalidated by a
+    schema change are automatically discarded and, outside of an explicit
+    transaction, transparently prepared again.
+
+    .. note:: asyncpg invalidates prepared statements when the connection is
+              released back to its pool, so the cache lives as long as the
+              instance.
+
+    When a `coalescer` is given, a :meth:`fetchall()`, :meth:`fetchone()` or
+    :meth:`scalar()` identical to another one still running, that is with the
+    same SQL and the same arguments, does not hit the database but waits for
+    the outcome of the latter, possibly issued by a different instance: the
+    result is shared, so it must be treated as immutable. This does not
+    happen within an explicit transaction, to preserve its consistency.
 
     __ https://magicstack.github.io/asyncpg/current/api/index.html#connection
     """
 
-    __slots__ = ('apgc',)
+    __slots__ = ('apgc', 'coalescer', '_runner')
 
-    def __init__(self, apgconnection):
+    def __init__(self, apgconnection, prepared_statements_cache_size=0, coalescer=None):
         self.apgc = apgconnection
+        self.coalescer = coalescer
+        if prepared_statements_cache_size > 0:
+            self._runner = _PreparingConnection(apgconnection,
+                                                prepared_statements_cache_size)
+        else:
+            self._runner = apgconnection
+
+    @property
+    def prepared_statements(self):
+        """The :class:`PreparedStatementsCache`, or ``None`` when the instance
+        does not use prepared statements.
+        """
+
+        runner = self._runner
+        return runner.statements if runner is not self.apgc else None
+
+    async def _read(self, function, stmt, pos_args, named_args, raw_json):
+        if self.coalescer is None or self.apgc.is_in_transaction():
+            return await function(self._runner, stmt, pos_args, named_args,
+                                  raw_json=raw_json)
+
+        sql, args = compile(stmt, pos_args, named_args)
+        key = (function, sql, args, raw_json)
+        try:
+            hash(key)
+        except TypeError:
+            # Some argument is not hashable, for example a list
+            return await function(self._runner, sql, args, raw_json=raw_json)
+        return await self.coalescer.run(
+            key, lambda: function(self._runner, sql, args, raw_json=raw_json))
+
+    def batch(self):
+        """Return a new :class:`~.batch.Batch` of statements.
+
+        Typically used in an ``async with`` statement:
+
+        .. code-block:: python
+
+           async with dbc.batch() as batch:
+               user = batch.fetchone(stmt1)
+               count = batch.scalar(stmt2)
+           print((await user)['name'], await count)
+        """
+
+        return Batch(self)
+
+    async def copy_records(self, table, records, columns=None):
+        """Invoke :func:`~.funcs.copy_records()` forwarding the arguments,
+        returning its result.
+        """
+
+        return await copy_records(self.apgc, table, records, columns)
 
     def cursor(self, stmt, pos_args=None, named_args=None, **kwargs):
         """Return a `Cursor`__ instance on given `stmt`.
@@ -42,22 +204,53 @@ class Connection:
         returning its result.
         """
 
-        return await execute(self.apgc, stmt, pos_args, named_args,
+        return await execute(self._runner, stmt, pos_args, named_args,
                              expected_result=expected_result)
 
-    async def fetchall(self, stmt, pos_args=None, named_args=None):
+    async def executemany(self, stmt, rows):
+        """Invoke :func:`~.funcs.executemany()` forwarding the arguments,
+        returning its result.
+        """
+
+        return await executemany(self._runner, stmt, rows)
+
+    def fetch_batches(self, stmt, pos_args=None, named_args=None, batch_size=1000,
+                      keyset=None):
+        """Invoke :func:`~.funcs.fetch_batches()` forwarding the arguments,
+        returning its result.
+        """
+
+        return fetch_batches(self._runner, stmt, pos_args, named_args, batch_size,
+                             keyset)
+
+    async def fetch_columns(self, stmt, pos_args=None, named_args=None,
+                            batch_size=10000):
+        """Invoke :func:`~.columnar.fetch_columns()` forwarding the arguments,
+        returning its result.
+        """
+
+        return await fetch_columns(self._runner, stmt, pos_args, named_args, batch_size)
+
+    async def fetchall(self, stmt, pos_args=None, named_args=None, raw_json=False):
         """Invoke :func:`~.funcs.fetchall()` forwarding the arguments,
         returning its result.
         """
 
-        return await fetchall(self.apgc, stmt, pos_args, named_args)
+        return await self._read(fetchall, stmt, pos_args, named_args, raw_json)
 
-    async def fetchone(self, stmt, pos_args=None, named_args=None):
+    async def fetchone(self, stmt, pos_args=None, named_args=None, raw_json=False):
         """Invoke :func:`~.funcs.fetchone()` forwarding the arguments,
         returning its result.
         """
 
-        return await fetchone(self.apgc, stmt, pos_args, named_args)
+        return await self._read(fetchone, stmt, pos_args, named_args, raw_json)
+
+    def iterate(self, stmt, pos_args=None, named_args=None, prefetch=None):
+        """Invoke :func:`~.funcs.iterate()` forwarding the arguments,
+        returning its result.
+        """
+
+        return iterate(self.apgc, stmt, pos_args, named_args, prefetch)
 
     async def prepare(self, stmt, **kwargs):
         """Invoke :func:`~.funcs.prepare()` forwarding the arguments,
@@ -66,12 +259,12 @@ class Connection:
 
         return await prepare(self.apgc, stmt, **kwargs)
 
-    async def scalar(self, stmt, pos_args=None, named_args=None):
+    async def scalar(self, stmt, pos_args=None, named_args=None, raw_json=False):
         """Invoke :func:`~.funcs.scalar()` forwarding the arguments,
         returning its result.
         """
 
-        return await scalar(self.apgc, stmt, pos_args, named_args)
+        return await self._read(scalar, stmt, pos_args, named_args, raw_json)
 
     def transaction(self):
         """Start an explicit transaction and return it.
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Pool-aware interface
+# :Created:   sab 17 ott 2026 18:52:03 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+from asyncpg import create_pool
+
+from .connection import Connection
+from .types import register_custom_codecs
+
+
+class _Transaction:
+    """Asynchronous context manager that acquires a connection from the pool
+    and starts a transaction on it, yielding a :class:`.Connection`.
+    """
+
+    __slots__ = ('database', 'kwargs', 'acquisition', 'transaction')
+
+    def __init__(self, database, kwargs):
+        self.database = database
+        self.kwargs = kwargs
+        self.acquisition = None
+        self.transaction = None
+
+    async def __aenter__(self):
+        self.acquisition = self.database._acquire()
+        apgc = await self.acquisition.__aenter__()
+        try:
+            self.transaction = apgc.transaction(**self.kwargs)
+            await self.transaction.__aenter__()
+        except BaseException as e:
+            await self.acquisition.__aexit__(type(e), e, e.__traceback__)
+            raise
+        return self.database._connection(apgc)
+
+    async def __aexit__(self, *exc):
+        try:
+            await self.transaction.__aexit__(*exc)
+        finally:
+            await self.acquisition.__aexit__(*exc)
+
+
+class Database:
+    """Class wrapper to low level functions, on top of a pool of connections.
+
+    :param pool: an asyncpg Pool__ instance
+    :param coalescer: either ``None`` or a :class:`~.coalescer.Coalescer`
+                      instance
+
+    This exposes the same API of the :class:`.Connection` class, but each
+    statement is executed on a connection acquired from the `pool` just for
+    its duration, so that connections are kept busy only while the database
+    is actually working. The iterators returned by :meth:`iterate()`,
+    :meth:`cursor()` and :meth:`fetch_batches()` hold their connection
+    until they are exhausted or closed.
+
+    When several statements must be executed on the same connection, use
+    :meth:`transaction()`:
+
+    .. code-block:: python
+
+       async with db.transaction() as conn:
+           await conn.execute(stmt1)
+           await conn.execute(stmt2)
+
+    __ https://magicstack.github.io/asyncpg/current/api/index.html\
+       #connection-pools
+    """
+
+    __slots__ = ('pool', 'coalescer')
+
+    def __init__(self, pool, coalescer=None):
+        self.pool = pool
+        self.coalescer = coalescer
+
+    @classmethod
+    async def create(cls, dsn=None, *, init=None, coalescer=None, json_backend='nssjson',
+                     **kwargs):
+        r"""Create a new pool of connections and return an instance wrapping it.
+
+        :param dsn: the connection arguments in the `libpq connection URI
+                    format`__
+        :param init: an optional coroutine function, called on each new
+                     connection after :func:`~.types.register_custom_codecs`
+        :param coalescer: either ``None`` or a :class:`~.coalescer.Coalescer`
+                          instance
+        :param json_backend: the name of one of the
+                             :data:`~.types.JSON_BACKENDS`
+        :param \*\*kwargs: any valid `create_pool()`__ keyword argument
+
+        __ https://www.postgresql.org/docs/current/libpq-connect.html#LIBPQ-CONNSTRING
+        __ https://magicstack.github.io/asyncpg/current/api/index.html\
+           #asyncpg.pool.create_pool
+        """
+
+        pool = await cls._create_pool(dsn, init, json_backend, kwargs)
+        return cls(pool, coalescer)
+
+    @staticmethod
+    async def _create_pool(dsn, init, json_backend, kwargs):
+        async def setup_connection(apgc):
+            await register_custom_codecs(apgc, json_backend)
+            if init is not None:
+                await init(apgc)
+
+        return await create_pool(dsn, init=setup_connection, **kwargs)
+
+    async def close(self):
+        "Gracefully close the pool."
+
+        await self.pool.close()
+
+    def _acquire(self, stmt=None, readonly=False):
+        "Acquire a connection to execute `stmt`, possibly with a `readonly` method."
+
+        return self.pool.acquire()
+
+    def _connection(self, apgc):
+        return Connection(apgc, coalescer=self.coalescer)
+
+    async def _run(self, method, stmt, *args, readonly=False, **kwargs):
+        async with self._acquire(stmt, readonly) as apgc:
+            return await getattr(self._connection(apgc), method)(stmt, *args, **kwargs)
+
+    async def copy_records(self, table, records, columns=None):
+        "Execute :meth:`.Connection.copy_records()` on a pooled connection."
+
+        return await self._run('copy_records', table, records, columns)
+
+    def cursor(self, stmt, pos_args=None, named_args=None, prefetch=None):
+        """Alias of :meth:`iterate()`.
+
+        Since a cursor requires a transaction, its records are yielded by an
+        asynchronous generator that holds a connection until its end.
+        """
+
+        return self.iterate(stmt, pos_args, named_args, prefetch)
+
+    async def execute(self, stmt, pos_args=None, named_args=None, expected_result=None):
+        "Execute :meth:`.Connection.execute()` on a pooled connection."
+
+        return await self._run('execute', stmt, pos_args, named_args,
+                               expected_result=expected_result)
+
+    async def executemany(self, stmt, rows):
+        "Execute :meth:`.Connection.executemany()` on a pooled connection."
+
+        return await self._run('executemany', stmt, rows)
+
+    async def fetch_batches(self, stmt, pos_args=None, named_args=None, batch_size=1000,
+                            keyset=None):
+        "Execute :meth:`.Connection.fetch_batches()` on a pooled connection."
+
+        async with self._acquire(stmt, True) as apgc:
+            batches = self._connection(apgc).fetch_batches(stmt, pos_args, named_args,
+                                                           batch_size, keyset)
+            try:
+                async for batch in batches:
+                    yield batch
+            finally:
+                await batches.aclose()
+
+    async def fetch_columns(self, stmt, pos_args=None, named_args=None,
+                            batch_size=10000):
+        "Execute :meth:`.Connection.fetch_columns()` on a pooled connection."
+
+        return await self._run('fetch_columns', stmt, pos_args, named_args, batch_size,
+                               readonly=True)
+
+    async def fetchall(self, stmt, pos_args=None, named_args=None, raw_json=False):
+        "Execute :meth:`.Connection.fetchall()` on a pooled connection."
+
+        return await self._run('fetchall', stmt, pos_args, named_args, raw_json,
+                               readonly=True)
+
+    async def fetchone(self, stmt, pos_args=None, named_args=None, raw_json=False):
+        "Execute :meth:`.Connection.fetchone()` on a pooled connection."
+
+        return await self._run('fetchone', stmt, pos_args, named_args, raw_json,
+                               readonly=True)
+
+    async def iterate(self, stmt, pos_args=None, named_args=None, prefetch=None):
+        "Execute :meth:`.Connection.iterate()` on a pooled connection."
+
+        async with self._acquire(stmt, True) as apgc:
+            records = self._connection(apgc).iterate(stmt, pos_args, named_args, prefetch)
+            try:
+                async for record in records:
+                    yield record
+            finally:
+                await records.aclose()
+
+    async def scalar(self, stmt, pos_args=None, named_args=None, raw_json=False):
+        "Execute :meth:`.Connection.scalar()` on a pooled connection."
+
+        return await self._run('scalar', stmt, pos_args, named_args, raw_json,
+                               readonly=True)
+
+    def transaction(self, **kwargs):
+        r"""Acquire a connection and start a transaction on it.
+
+        :param \*\*kwargs: any valid `transaction()`__ keyword argument, for
+                           example ``isolation='serializable'``
+        :return: an asynchronous context manager, yielding a
+                 :class:`.Connection`
+
+        __ https://magicstack.github.io/asyncpg/current/api/index.html\
+           #asyncpg.connection.Connection.transaction
+        """
+
+        return _Transaction(self, kwargs)
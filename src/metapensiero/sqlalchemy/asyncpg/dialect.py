@@ -6,11 +6,13 @@
 # :Copyright: © 2016, 2017 Lele Gaifax
 #
 
-import re
-
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql.base import PGCompiler
 from sqlalchemy.dialects.postgresql.psycopg2 import (PGCompiler_psycopg2,
                                                      PGDialect_psycopg2)
 from sqlalchemy.sql import compiler
+from sqlalchemy.sql.elements import BindParameter, ClauseList, Grouping
+from sqlalchemy.sql.expression import bindparam
 from sqlalchemy.types import NullType
 
 
@@ -22,24 +24,125 @@ class PGCompiler_asyncpg(PGCompiler_psycopg2):
     compatible with asyncpg.
 
     This solves https://github.com/MagicStack/asyncpg/issues/32.
+
+    An *expanding* ``IN`` predicate, that is one built like
+    ``column.in_(bindparam('ids', expanding=True))``, is rendered as
+    ``column = ANY($1::INTEGER[])``, passing the whole list as a single array
+    parameter. When the dialect's :attr:`~PGDialect_asyncpg.in_as_any` is
+    true, the same happens for ``IN`` predicates with a literal list of
+    values.
     """
 
+    def _array_bindparam(self, binary):
+        """Return a single bind parameter with all the values of the ``IN`` list
+        of `binary`, or ``None`` when it cannot be expressed as an array.
+        """
+
+        right = binary.right
+        if isinstance(right, BindParameter):
+            if not right.expanding:
+                return None
+            type = right.type
+            if isinstance(type, (NullType, ARRAY)):
+                return None
+            array = right._clone()
+            array.expanding = False
+            array.type = ARRAY(type)
+            return array
+
+        if not self.dialect.in_as_any or not isinstance(right, Grouping):
+            return None
+        clauses = right.element
+        if not isinstance(clauses, ClauseList):
+            return None
+        clauses = clauses.clauses
+        type = clauses[0].type
+        # Beware that the ANY() of a multidimensional array compares each
+        # single scalar, so a list of arrays must be kept as is
+        if isinstance(type, (NullType, ARRAY)) or type._has_bind_expression:
+            return None
+        values = []
+        for clause in clauses:
+            if (not isinstance(clause, BindParameter) or clause.callable is not None
+                    or clause.required or clause.type is not type):
+                return None
+            values.append(clause.value)
+        return bindparam(None, values, type_=ARRAY(type), unique=True)
+
+    def visit_bindparam(self, bindparam, **kw):
+        # Since SQLAlchemy 1.3 the psycopg2 compiler appends a cast to the
+        # ARRAY parameters: skip it, as _apply_numbered_params() adds one to
+        # every parameter
+        return PGCompiler.visit_bindparam(self, bindparam, **kw)
+
+    def visit_in_op_binary(self, binary, operator, **kw):
+        array = self._array_bindparam(binary)
+        if array is None:
+            return self._generate_generic_binary(binary, compiler.OPERATORS[operator],
+                                                 **kw)
+        return '%s = ANY (%s)' % (self.process(binary.left, **kw),
+                                  self.process(array, **kw))
+
+    def visit_notin_op_binary(self, binary, operator, **kw):
+        array = self._array_bindparam(binary)
+        if array is None:
+            return self._generate_generic_binary(binary, compiler.OPERATORS[operator],
+                                                 **kw)
+        return '%s <> ALL (%s)' % (self.process(binary.left, **kw),
+                                   self.process(array, **kw))
+
     def _apply_numbered_params(self):
-        idx = 0
+        fragments = self.string.split('[_POSITION]')
+        # The offsets of the numbers of the placeholders, see renumbered()
+        self._placeholders = placeholders = []
+        if len(fragments) == 1:
+            return
+
+        binds = self.binds
+        render_type = self.dialect.type_compiler.process
+        # Statements with many parameters, like a long IN list or a multi-row
+        # VALUES, usually share a few type instances: render each cast once
+        casts = {}
+        parts = [fragments[0]]
+        append = parts.append
+        offset = len(fragments[0])
+        for idx, (name, fragment) in enumerate(zip(self.positiontup, fragments[1:]), 1):
+            type = binds[name].type
+            cast = casts.get(id(type))
+            if cast is None:
+                if isinstance(type, NullType):
+                    cast = ''
+                else:
+                    cast = '::' + render_type(type)
+                casts[id(type)] = cast
+            number = str(idx)
+            placeholders.append(offset)
+            offset += len(number) + len(cast) + len(fragment)
+            append(number)
+            append(cast)
+            append(fragment)
+        self.string = ''.join(parts)
 
-        def replace(match, _names=self.positiontup, _binds=self.binds,
-                    _render_type=self.dialect.type_compiler.process):
-            nonlocal idx
-            name = _names[idx]
-            idx += 1
-            param = _binds[name]
-            type = param.type
-            if isinstance(type, NullType):
-                return str(idx)
-            else:
-                return '%s::%s' % (idx, _render_type(type))
+    def renumbered(self, shift):
+        """Return the SQL with the numbers of the placeholders increased by
+        `shift`.
 
-        self.string = re.sub(r'\[_POSITION\]', replace, self.string)
+        Only the placeholders emitted by the compiler are touched, leaving
+        alone any ``$n`` within string literals.
+        """
+
+        string = self.string
+        if not shift or not self._placeholders:
+            return string
+        parts = []
+        append = parts.append
+        start = 0
+        for idx, offset in enumerate(self._placeholders, 1):
+            append(string[start:offset])
+            append(str(idx + shift))
+            start = offset + len(str(idx))
+        append(string[start:])
+        return ''.join(parts)
 
 
 class PGDialect_asyncpg(PGDialect_psycopg2):
@@ -47,13 +150,40 @@ class PGDialect_asyncpg(PGDialect_psycopg2):
 
     In particular it uses a variant of the ``numeric`` `paramstyle`, to
     produce placeholders like ``$1::INTEGER``, ``$2::VARCHAR`` and so on.
+
+    :param in_as_any: when given, overrides the class level :attr:`in_as_any`
     """
 
     statement_compiler = PGCompiler_asyncpg
 
-    def __init__(self, *args, **kwargs):
+    in_as_any = False
+    """Whether ``column.in_([1, 2, 3])`` shall be compiled as ``column =
+    ANY($1::INTEGER[])``, with a single array parameter, instead of ``column IN
+    ($1::INTEGER, $2::INTEGER, $3::INTEGER)``.
+
+    This keeps the SQL text stable whatever the number of values, so that
+    PostgreSQL does not have to parse a huge statement and the same prepared
+    statement is reused. Lists containing other expressions than plain
+    values, or values of differing types, are not affected.
+
+    .. note:: Since the outcome of the compilation is cached, when the setting
+              is changed on a dialect already in use its cache must be
+              cleared: for example
+
+              .. code-block:: python
+
+                 from metapensiero.sqlalchemy.asyncpg.dialect import PGDialect_asyncpg
+                 from metapensiero.sqlalchemy.asyncpg.funcs import compiled_cache
+
+                 PGDialect_asyncpg.in_as_any = True
+                 compiled_cache.clear()
+    """
+
+    def __init__(self, *args, in_as_any=None, **kwargs):
         kwargs['paramstyle'] = 'numeric'
         super().__init__(*args, **kwargs)
+        if in_as_any is not None:
+            self.in_as_any = in_as_any
         self.implicit_returning = True
         self.supports_native_enum = True
         self.supports_smallserial = True
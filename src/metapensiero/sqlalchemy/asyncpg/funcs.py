@@ -6,28 +6,74 @@
 # :Copyright: © 2016, 2017 Lele Gaifax
 #
 
+from asyncio import get_event_loop
+from collections.abc import Mapping
 import logging
+import re
+from threading import Lock
 from time import perf_counter
 
+from sqlalchemy import bindparam, tuple_
+from sqlalchemy.sql.elements import Label
+
+from .cache import LRUCache
 from .dialect import PGDialect_asyncpg
+from .hooks import ExecutionContext, hooks
+from .stats import statistics
+from .types import _RawJSONDecoding
 
 
 SLOW_QUERY_THRESHOLD = 2.0
 "Warn about SQL statements that take more than this amount of seconds."
 
+COMPILED_CACHE_SIZE = 100
+"Maximum number of compiled statements kept by :data:`compiled_cache`."
+
+compiled_cache = LRUCache(COMPILED_CACHE_SIZE)
+"""The cache of compiled SQLAlchemy statements used by :func:`compile`.
+
+Only the statements marked by :func:`cache_compilation` are kept here. This
+is a :class:`~.cache.LRUCache` instance: change its ``size`` to tune it,
+setting it to ``0`` to disable the caching altogether, and inspect its
+``stats()`` to see how well it's doing.
+"""
+
+PRETTIFIED_CACHE_SIZE = 100
+"Maximum number of prettified SQL statements kept by :data:`prettified_cache`."
+
+prettified_cache = LRUCache(PRETTIFIED_CACHE_SIZE)
+"""The cache of prettified SQL statements used when logging them.
+
+This is a :class:`~.cache.LRUCache` instance, keyed on the SQL text: the
+statements are prettified only when their log record is actually emitted.
+"""
+
+prettify_executor = None
+"""An optional :class:`concurrent.futures.Executor` used to prettify logged
+statements.
+
+By default SQL statements are prettified in the thread emitting their log
+records, that is usually the event loop one: for big statements it may take a
+while, stalling every other coroutine. When this is set to an executor, for
+example a :class:`~concurrent.futures.ThreadPoolExecutor`, the prettification
+happens there and the record is emitted as soon as it's done, possibly after
+those that follow it.
+"""
+
 logger = logging.getLogger(__name__)
 
 
-def _honor_column_default(params, column, default, key_getter):
-    key = key_getter(column)
+def _column_default(default):
+    if not default.is_sequence and default.is_scalar:
+        return default.arg
+    elif default.is_callable:
+        return default.arg(None)
+
+
+def _honor_column_default(params, key, default):
     val = params.get(key)
     if val is None:
-        if not default.is_sequence and default.is_scalar:
-            val = default.arg
-        else:
-            if default.is_callable:
-                val = default.arg(None)
-
+        val = _column_default(default)
         if val is not None:
             params[key] = val
 
@@ -69,42 +115,272 @@ def _format_elapsed_time(et):
     return "%.*g %s" % (precision, et / scale, unit)
 
 
-def _log_sql_statement(connection, operation, sql, args, logf=logger.debug):
-    from textwrap import indent
-    from asyncpg.pool import PoolConnectionProxy
+_prettify_lock = Lock()
+
+_prettify_failure_logged = False
+
+_PARAM_MARKER = re.compile(r'\x00(\d+)\x00')
+
+
+def _prettify_template(sql):
+    """Prettify `sql`, marking its parameters with their ordinal number.
+
+    The outcome is cached, and it is ``None`` if the prettification fails: the
+    first failure is logged at debug level.
+    """
+
+    global _prettify_failure_logged
+
     from pg_query import prettify
     from pg_query.printer import get_printer_for_node_tag, node_printer
     import pg_query.printers.dml  # noqa
 
-    try:
-        orig_paramref_printer = get_printer_for_node_tag(None, 'ParamRef')
+    # Serialize the prettification, as it temporarily replaces the global
+    # printer of parameter references
+    with _prettify_lock:
+        template = prettified_cache.get(sql, False)
+        if template is not False:
+            return template
+
         try:
-            @node_printer('ParamRef', override=True)
-            def replace_param_ref(node, output):
-                if 0 < node.number.value <= len(args):
-                    output.write(_format_arg(args[node.number.value - 1]))
-                else:
-                    orig_paramref_printer(node, output)
-            newsql = prettify(sql, compact_lists_margin=80, safety_belt=False)
-        finally:
-            node_printer('ParamRef', override=True)(orig_paramref_printer)
-    except Exception as e:
-        logger.error('Something wrong with SQL prettification: %s\n'
-                     '  arguments: %r', e, [_format_arg(a) for a in args])
-    else:
-        sql = newsql
+            orig_paramref_printer = get_printer_for_node_tag(None, 'ParamRef')
+            try:
+                @node_printer('ParamRef', override=True)
+                def mark_param_ref(node, output):
+                    output.write('\x00%d\x00' % node.number.value)
+                template = prettify(sql, compact_lists_margin=80, safety_belt=False)
+            finally:
+                node_printer('ParamRef', override=True)(orig_paramref_printer)
+        except Exception:
+            if not _prettify_failure_logged:
+                _prettify_failure_logged = True
+                logger.debug('Could not prettify SQL statement, logging it verbatim',
+                             exc_info=True)
+            template = None
+
+        prettified_cache.set(sql, template)
+        return template
+
+
+class _PrettifiedSQL:
+    """A SQL statement prettified on demand, that is only when the log record
+    carrying it is actually formatted.
+    """
+
+    __slots__ = ('sql', 'args', 'text')
+
+    def __init__(self, sql, args):
+        self.sql = sql
+        self.args = args
+        self.text = None
+
+    def __str__(self):
+        from textwrap import indent
+
+        if self.text is None:
+            args = self.args
+            template = _prettify_template(self.sql)
+            if template is None:
+                sql = '%s\n(could not prettify it, arguments: %s)' % (
+                    self.sql, ', '.join(_format_arg(a) for a in args))
+            else:
+                def replace(match):
+                    number = int(match.group(1))
+                    if 0 < number <= len(args):
+                        return _format_arg(args[number - 1])
+                    else:
+                        return '$%d' % number
+                sql = _PARAM_MARKER.sub(replace, template)
+            self.text = indent(sql, '    ')
+        return self.text
 
-    sql = indent(sql, '    ')
+
+def _log_sql_statement(connection, operation, sql, args, logf=logger.debug):
+    from asyncpg.pool import PoolConnectionProxy
 
     if isinstance(connection, PoolConnectionProxy):
         tx = connection._con._top_xact
     else:
         tx = connection._top_xact
 
-    logf('%s in transaction %0x:\n%s', operation, id(tx), sql)
+    sql = _PrettifiedSQL(sql, args)
+    executor = prettify_executor
+    if executor is None:
+        logf('%s in transaction %0x:\n%s', operation, id(tx), sql)
+    else:
+        future = get_event_loop().run_in_executor(executor, str, sql)
+        future.add_done_callback(
+            lambda f: logf('%s in transaction %0x:\n%s', operation, id(tx), sql))
+
 
+class _Execution:
+    """Track a single database call, taking care of its logging, of the
+    statistics and of the instrumentation hooks.
 
-def compile(stmt, pos_args=None, named_args=None, _d=PGDialect_asyncpg()):
+    `doing` describes the operation in the log messages, for example
+    ``'fetching rows'``. When `tracked` is false the call does not contribute
+    to the :data:`.statistics`.
+    """
+
+    __slots__ = ('connection', 'doing', 'sql', 'args', 'threshold', 'tracked', 'debug',
+                 'context', 't0')
+
+    def __init__(self, connection, operation, doing, sql, args, threshold,
+                 tracked=True, context_args=None):
+        self.connection = connection
+        self.doing = doing
+        self.sql = sql
+        self.args = args
+        self.threshold = threshold
+        self.tracked = tracked
+        self.debug = debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            _log_sql_statement(connection, doing[0].upper() + doing[1:], sql, args)
+        if hooks.active:
+            if context_args is None:
+                context_args = args
+            self.context = ExecutionContext(operation, connection, sql, context_args)
+            hooks.fire('before_execute', self.context)
+        else:
+            self.context = None
+        self.t0 = perf_counter()
+
+    def failed(self, error, message=None):
+        "Account for a failed execution, logging `message` as an error."
+
+        elapsed = perf_counter() - self.t0
+        if self.tracked and statistics.enabled:
+            statistics.record(self.sql, elapsed, error=True)
+        context = self.context
+        if context is not None:
+            context.elapsed = elapsed
+            context.error = error
+            hooks.fire('on_error', context)
+        if not self.debug:
+            if message is None:
+                message = 'Error "%s" %s' % (error, self.doing)
+            _log_sql_statement(self.connection, message, self.sql, self.args,
+                               logf=logger.error)
+
+    def finished(self, rows=None, message='Execution took %(elapsed)s',
+                 slow_message='Suspiciously SLOW query'):
+        """Account for a successful execution.
+
+        The `message` and the `slow_message` may refer to the number of
+        ``rows``, to the ``elapsed`` time and to the ``rate`` in rows per
+        second.
+        """
+
+        elapsed = perf_counter() - self.t0
+        if self.tracked and statistics.enabled:
+            statistics.record(self.sql, elapsed, rows)
+        context = self.context
+        if context is not None:
+            context.elapsed = elapsed
+            context.rows = rows
+            hooks.fire('after_execute', context)
+        threshold = self.threshold
+        if self.debug or elapsed > threshold:
+            details = {'rows': rows, 'elapsed': _format_elapsed_time(elapsed),
+                       'rate': rows / elapsed if rows and elapsed else 0}
+            if self.debug:
+                logf = logger.debug if elapsed < threshold else logger.warning
+                logf(message % details)
+            else:
+                _log_sql_statement(self.connection, slow_message % details,
+                                   self.sql, self.args, logf=logger.warning)
+
+
+class _CompiledStatement:
+    "The outcome of the compilation of a statement, as kept in the cache."
+
+    __slots__ = ('statement', 'compiled', 'sql', 'positiontup', 'defaults')
+
+    def __init__(self, statement, compiled):
+        # Keep a reference to the statement, so that its id() cannot be
+        # reused while the entry is in the cache
+        self.statement = statement
+        self.compiled = compiled
+        self.sql = compiled.string
+        self.positiontup = compiled.positiontup
+
+        # Honor column's default or unupdate setting: following code adapted
+        # from SA's DefaultExecutionContext._process_executesingle_defaults()
+        # logic
+
+        key_getter = compiled._key_getters_for_crud_column[2]
+        defaults = []
+        for c in compiled.insert_prefetch:
+            if c.default is not None:
+                defaults.append((key_getter(c), c.default))
+        for c in compiled.update_prefetch:
+            if c.onupdate is not None:
+                defaults.append((key_getter(c), c.onupdate))
+        self.defaults = tuple(defaults)
+
+    def params(self, named_args):
+        "Build the positional arguments tuple."
+
+        params = self.compiled.construct_params(named_args)
+        for key, default in self.defaults:
+            _honor_column_default(params, key, default)
+
+        return tuple(params[p] for p in self.positiontup)
+
+
+def cache_compilation(stmt):
+    """Mark an SQLAlchemy core statement to keep its compilation in the cache.
+
+    :param stmt: an SQLAlchemy :class:`Executable
+                 <sqlalchemy.sql.base.Executable>` statement
+    :return: a copy of `stmt`, whose compilation is kept in the
+             :data:`compiled_cache`
+
+    This is meant for statements built once and executed many times, for
+    example those defined at module level: the statements derived from the
+    returned one, for example adding a ``where()`` clause, are *not* marked.
+
+    .. warning:: The cache is keyed on the statement *identity*: once the
+                 marked statement has been executed, altering it in place, for
+                 example with ``append_whereclause()``, does not invalidate
+                 its compilation and the *stale* SQL will be executed. Use the
+                 generative methods, that return a new statement, instead.
+    """
+
+    stmt = stmt.execution_options()
+    # Stamp the statement with its own identity, as the execution options are
+    # inherited by the statements derived from it
+    stmt._execution_options = stmt._execution_options.union(
+        {'cache_compilation': id(stmt)})
+    return stmt
+
+
+def _compile(stmt, dialect, **kw):
+    """Compile `stmt` with the given `dialect`, going thru the cache when the
+    statement is marked by :func:`cache_compilation`.
+
+    Return the corresponding :class:`_CompiledStatement`.
+    """
+
+    options = getattr(stmt, '_execution_options', None)
+    if options is None or options.get('cache_compilation') != id(stmt):
+        return _CompiledStatement(stmt, stmt.compile(dialect=dialect, **kw))
+
+    # SA does not offer a structural key of the statement, so the best we can
+    # do is to reuse the compilation of the very same statement object
+    key = (dialect, id(stmt), tuple(sorted(kw.items())))
+    entry = compiled_cache.get(key)
+    if entry is None:
+        entry = _CompiledStatement(stmt, stmt.compile(dialect=dialect, **kw))
+        compiled_cache.set(key, entry)
+    return entry
+
+
+_dialect = PGDialect_asyncpg()
+"The dialect used to compile SQLAlchemy statements."
+
+
+def compile(stmt, pos_args=None, named_args=None, _d=_dialect):
     """Compile an SQLAlchemy core statement and extract its parameters.
 
     :param stmt: any SQLAlchemy core statement or a raw SQL instruction
@@ -126,30 +402,22 @@ def compile(stmt, pos_args=None, named_args=None, _d=PGDialect_asyncpg()):
 
     The result is suitable to be passed to the various methods of asyncpg's
     connection for execution.
+
+    The compilation of the statements marked by :func:`cache_compilation` is
+    kept in the :data:`compiled_cache`, so that executing the same statement
+    again costs only the extraction of its parameters.
+
+    .. warning:: The cache is keyed on the statement *identity*: do not alter
+                 a marked statement in place, for example with
+                 ``append_whereclause()``, after its execution, or the stale
+                 SQL will be executed.
     """
 
     if isinstance(stmt, str):
         return stmt, tuple(pos_args) if pos_args is not None else ()
     else:
-        compiled = stmt.compile(dialect=_d)
-        params = compiled.construct_params(named_args)
-
-        # Honor column's default or unupdate setting: following code adapted
-        # from SA's DefaultExecutionContext._process_executesingle_defaults()
-        # logic
-
-        key_getter = compiled._key_getters_for_crud_column[2]
-        for c in compiled.insert_prefetch:
-            default = c.default
-            if default is not None:
-                _honor_column_default(params, c, default, key_getter)
-
-        for c in compiled.update_prefetch:
-            default = c.onupdate
-            if default is not None:
-                _honor_column_default(params, c, default, key_getter)
-
-        return compiled.string, tuple(params[p] for p in compiled.positiontup)
+        entry = _compile(stmt, _d)
+        return entry.sql, entry.params(named_args)
 
 
 class UnexpectedResultError(RuntimeError):
@@ -187,33 +455,188 @@ async def execute(apgconn, stmt, pos_args=None, named_args=None,
     """
 
     sql, args = compile(stmt, pos_args, named_args)
-    debug = logger.isEnabledFor(logging.DEBUG)
-    if debug:
-        _log_sql_statement(apgconn, 'Executing', sql, args)
-    t0 = perf_counter()
+    execution = _Execution(apgconn, 'execute', 'executing', sql, args,
+                           warn_slow_query_threshold)
     try:
         result = await apgconn.execute(sql, *args, **kwargs)
     except Exception as e:
-        if not debug:
-            _log_sql_statement(apgconn, 'Error "%s" executing' % e,
-                               sql, args, logf=logger.error)
+        execution.failed(e)
         raise
+    if expected_result is not None and result != expected_result:
+        error = UnexpectedResultError(result, expected_result)
+        execution.failed(error, 'Unexpected result executing')
+        raise error
+    execution.finished()
+    return result
+
+
+async def executemany(apgconn, stmt, rows,
+                      warn_slow_query_threshold=SLOW_QUERY_THRESHOLD, **kwargs):
+    r"""Execute the given statement on a asyncpg connection once for each
+    set of arguments.
+
+    :param apgconn: an ASyncPG Connection__ instance
+    :param stmt: any SQLAlchemy core statement or a raw SQL instruction
+    :param rows: an iterable of mappings of named arguments when `stmt` is a
+                 SQLAlchemy statement, or of sequences of positional arguments
+                 when it is a raw SQL instruction
+    :param \*\*kwargs: any valid `executemany()`__ keyword argument
+
+    A SQLAlchemy `stmt` is compiled just once, using the keys of the first
+    row as the names of the parameters, much like what SQLAlchemy does with
+    its own ``executemany`` style execution: for example
+    ``table.insert()`` produces an ``INSERT`` of all the columns mentioned
+    by the first row, plus those with a default. Column defaults are honored
+    for each row, as :func:`.compile` does.
+
+    The whole batch is then handed to the asyncpg's ``executemany()``, that
+    pipelines its execution.
+
+    __ https://magicstack.github.io/asyncpg/devel/api/index.html#connection
+    __ https://magicstack.github.io/asyncpg/devel/api/\
+       index.html#asyncpg.connection.Connection.executemany
+    """
+
+    if isinstance(stmt, str):
+        sql = stmt
+        args = [tuple(row) for row in rows]
     else:
-        if expected_result is not None and result != expected_result:
-            if not debug:
-                _log_sql_statement(apgconn, 'Unexpected result executing',
-                                   sql, args, logf=logger.error)
-            raise UnexpectedResultError(result, expected_result)
-
-    elapsed = perf_counter() - t0
-    if debug or elapsed > warn_slow_query_threshold:
-        if debug:
-            logf = (logger.debug if elapsed < warn_slow_query_threshold
-                    else logger.warning)
-            logf('Execution took %s', _format_elapsed_time(elapsed))
+        rows = iter(rows)
+        try:
+            first = next(rows)
+        except StopIteration:
+            return
+        entry = _compile(stmt, _dialect,
+                         column_keys=tuple(first), inline=True)
+        sql = entry.sql
+        args = [entry.params(first)]
+        args.extend(entry.params(row) for row in rows)
+
+    if not args:
+        return
+
+    count = len(args)
+    execution = _Execution(apgconn, 'executemany',
+                           'executing batch of %d rows, the first' % count,
+                           sql, args[0], warn_slow_query_threshold, context_args=args)
+    try:
+        await apgconn.executemany(sql, args, **kwargs)
+    except Exception as e:
+        execution.failed(e)
+        raise
+    execution.finished(count, 'Execution of %(rows)d rows took %(elapsed)s'
+                       ' (%(rate).0f rows/sec)',
+                       'Suspiciously SLOW batch of %(rows)d rows (%(rate).0f rows/sec),'
+                       ' the first')
+
+
+def _copy_records_maker(table, columns):
+    """Compute the columns to copy and return a function to build each record.
+
+    Columns not explicitly mentioned but with a client side default, either a
+    scalar value or a Python function, are appended to the `columns`.
+    """
+
+    if columns is None:
+        autoinc = table._autoincrement_column
+        columns = [c for c in table.columns
+                   if c is not autoinc and c.server_default is None]
+    else:
+        columns = [table.columns[c] if isinstance(c, str) else c
+                   for c in columns]
+
+    explicit = set(columns)
+    columns.extend(c for c in table.columns
+                   if c not in explicit
+                   and c.default is not None
+                   and (c.default.is_scalar or c.default.is_callable))
+
+    keys = tuple(c.key for c in columns)
+    defaults = tuple((i, c.default) for i, c in enumerate(columns)
+                     if c.default is not None
+                     and (c.default.is_scalar or c.default.is_callable))
+    ncolumns = len(columns)
+
+    def make_record(record):
+        if isinstance(record, Mapping):
+            get = record.get
+            values = [get(key) for key in keys]
         else:
-            _log_sql_statement(apgconn, 'Suspiciously SLOW query', sql, args,
-                               logf=logger.warning)
+            values = list(record)
+            if len(values) < ncolumns:
+                values.extend([None] * (ncolumns - len(values)))
+        for i, default in defaults:
+            if values[i] is None:
+                values[i] = _column_default(default)
+        return values
+
+    return [c.name for c in columns], make_record
+
+
+async def copy_records(apgconn, table, records, columns=None,
+                       warn_slow_query_threshold=SLOW_QUERY_THRESHOLD, **kwargs):
+    r"""Bulk load `records` into `table` using the ``COPY`` binary protocol.
+
+    :param apgconn: an asyncpg Connection__ instance
+    :param table: a SQLAlchemy :class:`Table <sqlalchemy.schema.Table>`
+    :param records: an iterable or an asynchronous iterable of either mappings
+                    keyed on the column keys or sequences of values, in the
+                    same order of the `columns`
+    :param columns: a possibly empty sequence of column keys or
+                    :class:`Column <sqlalchemy.schema.Column>`\ s
+    :param \*\*kwargs: any valid `copy_records_to_table()`__ keyword argument
+    :return: a string with the status of the ``COPY`` command
+
+    When `columns` is ``None``, all the columns of the `table` are loaded,
+    except those valued by the server, that is the autoincrement primary key
+    and columns having a ``server_default``.
+
+    As :func:`.compile` does for ``INSERT``\ s, scalar and callable column
+    defaults are applied client-side, replacing ``None`` values: columns
+    carrying such defaults are loaded even when not explicitly mentioned in
+    `columns`.
+
+    The records are consumed lazily and streamed to the server by asyncpg's
+    `copy_records_to_table()`__, so huge loads can be performed in constant
+    memory when `records` is a generator.
+
+    __ https://magicstack.github.io/asyncpg/devel/api/index.html#connection
+    __ https://magicstack.github.io/asyncpg/devel/api/\
+       index.html#asyncpg.connection.Connection.copy_records_to_table
+    __ https://magicstack.github.io/asyncpg/devel/api/\
+       index.html#asyncpg.connection.Connection.copy_records_to_table
+    """
+
+    names, make_record = _copy_records_maker(table, columns)
+    sql = 'COPY %s (%s) FROM STDIN' % (table.fullname, ', '.join(names))
+    count = 0
+
+    if hasattr(records, '__aiter__'):
+        async def rows():
+            nonlocal count
+            async for record in records:
+                count += 1
+                yield make_record(record)
+    else:
+        def rows():
+            nonlocal count
+            for record in records:
+                count += 1
+                yield make_record(record)
+
+    execution = _Execution(apgconn, 'copy_records', 'copying records', sql, (),
+                           warn_slow_query_threshold)
+    try:
+        result = await apgconn.copy_records_to_table(
+            table.name, records=rows(), columns=names, schema_name=table.schema,
+            **kwargs)
+    except Exception as e:
+        execution.failed(e)
+        raise
+    execution.finished(count, 'Copied %(rows)d records in %(elapsed)s'
+                       ' (%(rate).0f records/sec)',
+                       'Suspiciously SLOW copy of %(rows)d records'
+                       ' (%(rate).0f records/sec)')
     return result
 
 
@@ -233,25 +656,20 @@ async def prepare(apgconn, stmt, **kwargs):
     """
 
     sql, args = compile(stmt)
-    debug = logger.isEnabledFor(logging.DEBUG)
-    if debug:
-        _log_sql_statement(apgconn, 'Preparing', sql, args)
-        t0 = perf_counter()
+    execution = _Execution(apgconn, 'prepare', 'preparing', sql, args,
+                           SLOW_QUERY_THRESHOLD, tracked=False)
     try:
         result = await apgconn.prepare(sql, **kwargs)
     except Exception as e:
-        if not debug:
-            _log_sql_statement(apgconn, 'Error "%s" preparing' % e,
-                               sql, args, logf=logger.error)
+        execution.failed(e)
         raise
-    if debug:
-        t1 = perf_counter()
-        logger.debug('Preparation took %s', _format_elapsed_time(t1 - t0))
+    execution.finished(message='Preparation took %(elapsed)s')
     return result
 
 
 async def fetchall(apgconn, stmt, pos_args=None, named_args=None,
-                   warn_slow_query_threshold=SLOW_QUERY_THRESHOLD, **kwargs):
+                   warn_slow_query_threshold=SLOW_QUERY_THRESHOLD, raw_json=False,
+                   **kwargs):
     r"""Execute the given statement on a asyncpg connection and return
     resulting records.
 
@@ -259,6 +677,8 @@ async def fetchall(apgconn, stmt, pos_args=None, named_args=None,
     :param stmt: any SQLAlchemy core statement or a raw SQL instruction
     :param pos_args: a possibly empty sequence of positional arguments
     :param named_args: a possibly empty mapping of named arguments
+    :param raw_json: when true, the values of the ``json`` and ``jsonb`` columns
+                     are returned as :class:`~.types.RawJSON` instances
     :param \*\*kwargs: any valid `fetch()`__ keyword argument
     :return: a list of `Record`__ instances
 
@@ -274,32 +694,196 @@ async def fetchall(apgconn, stmt, pos_args=None, named_args=None,
     """
 
     sql, args = compile(stmt, pos_args, named_args)
-    debug = logger.isEnabledFor(logging.DEBUG)
-    if debug:
-        _log_sql_statement(apgconn, 'Fetching rows', sql, args)
-    t0 = perf_counter()
+    decoding = _RawJSONDecoding(apgconn) if raw_json else None
+    execution = _Execution(apgconn, 'fetchall', 'fetching rows', sql, args,
+                           warn_slow_query_threshold)
     try:
-        result = await apgconn.fetch(sql, *args, **kwargs)
+        if decoding is None:
+            result = await apgconn.fetch(sql, *args, **kwargs)
+        else:
+            with decoding:
+                result = await apgconn.fetch(sql, *args, **kwargs)
     except Exception as e:
-        if not debug:
-            _log_sql_statement(apgconn, 'Error "%s" fetching rows' % e,
-                               sql, args, logf=logger.error)
+        execution.failed(e)
         raise
-    elapsed = perf_counter() - t0
-    if debug or elapsed > warn_slow_query_threshold:
-        if debug:
-            logf = (logger.debug if elapsed < warn_slow_query_threshold
-                    else logger.warning)
-            logf('Fetched %d records in %s',
-                 len(result), _format_elapsed_time(elapsed))
-        else:
-            _log_sql_statement(apgconn, 'Suspiciously SLOW query', sql, args,
-                               logf=logger.warning)
+    execution.finished(len(result), 'Fetched %(rows)d records in %(elapsed)s')
     return result
 
 
+async def iterate(apgconn, stmt, pos_args=None, named_args=None, prefetch=None,
+                  warn_slow_query_threshold=SLOW_QUERY_THRESHOLD, **kwargs):
+    r"""Execute the given statement on a asyncpg connection and asynchronously
+    iterate over the resulting records.
+
+    :param apgconn: an asyncpg Connection__ instance
+    :param stmt: any SQLAlchemy core statement or a raw SQL instruction
+    :param pos_args: a possibly empty sequence of positional arguments
+    :param named_args: a possibly empty mapping of named arguments
+    :param prefetch: the number of rows fetched at a time from the server, by
+                     default asyncpg's own default
+    :param \*\*kwargs: any valid `cursor()`__ keyword argument
+    :return: an asynchronous generator of `Record`__ instances
+
+    The `stmt` is first compiled with :func:`.compile` and then executed on
+    the `apgconn` connection with the needed parameters, thru a server side
+    cursor, so that the whole resultset is never kept in memory.
+
+    Since cursors require a transaction, when the connection is not already
+    in one a new transaction is started, and committed at the end of the
+    iteration.
+
+    The slow query warning and the debug logging consider the time spent by
+    the whole iteration, including the time taken by the consumer.
+
+    .. note:: When the iteration is interrupted before its end, explicitly
+              call the ``aclose()`` method of the generator to release the
+              eventual transaction as soon as possible.
+
+    __ https://magicstack.github.io/asyncpg/devel/api/index.html#connection
+    __ https://magicstack.github.io/asyncpg/devel/api/\
+       index.html#asyncpg.connection.Connection.cursor
+    __ https://magicstack.github.io/asyncpg/devel/api/\
+       index.html#asyncpg.Record
+    """
+
+    sql, args = compile(stmt, pos_args, named_args)
+    if prefetch is not None:
+        kwargs['prefetch'] = prefetch
+    message = 'Iterated over %(rows)d records in %(elapsed)s (%(rate).0f records/sec)'
+    execution = _Execution(apgconn, 'iterate', 'iterating rows', sql, args,
+                           warn_slow_query_threshold)
+    count = 0
+    try:
+        if apgconn.is_in_transaction():
+            async for record in apgconn.cursor(sql, *args, **kwargs):
+                count += 1
+                yield record
+        else:
+            async with apgconn.transaction():
+                async for record in apgconn.cursor(sql, *args, **kwargs):
+                    count += 1
+                    yield record
+    except GeneratorExit:
+        execution.finished(count, message)
+        raise
+    except Exception as e:
+        execution.failed(e)
+        raise
+    execution.finished(count, message,
+                       'Suspiciously SLOW iteration over %(rows)d records'
+                       ' (%(rate).0f records/sec)')
+
+
+def _keyset_indexes(stmt, keyset):
+    "Return the positions of the `keyset` columns among those selected by `stmt`."
+
+    result_columns = _compile(stmt, _dialect).compiled._result_columns
+    indexes = []
+    for column in keyset:
+        for index, (keyname, name, objects, type) in enumerate(result_columns):
+            if any(o is column or (isinstance(o, Label) and o.element is column)
+                   for o in objects):
+                indexes.append(index)
+                break
+        else:
+            raise ValueError('The keyset column %s is not among the selected ones'
+                             % column)
+    return indexes
+
+
+async def fetch_batches(apgconn, stmt, pos_args=None, named_args=None, batch_size=1000,
+                        keyset=None, warn_slow_query_threshold=SLOW_QUERY_THRESHOLD,
+                        **kwargs):
+    r"""Execute the given statement on a asyncpg connection and asynchronously
+    iterate over the resulting records, in batches.
+
+    :param apgconn: an asyncpg Connection__ instance
+    :param stmt: any SQLAlchemy core statement or a raw SQL instruction
+    :param pos_args: a possibly empty sequence of positional arguments
+    :param named_args: a possibly empty mapping of named arguments
+    :param batch_size: the maximum number of records in each batch
+    :param keyset: either ``None`` or a sequence of columns of `stmt` that
+                   identify a unique record
+    :param \*\*kwargs: any valid `fetch()`__ keyword argument
+    :return: an asynchronous generator of lists of `Record`__ instances
+
+    When `keyset` is ``None`` the `stmt` is executed thru a server side
+    cursor, as :func:`iterate` does, fetching `batch_size` records at a time.
+
+    Otherwise `stmt` must be a SQLAlchemy ``SELECT`` and each batch is fetched
+    by an independent query, ordered by the `keyset` columns and restricted
+    to the records following the last one of the previous batch: in this
+    *keyset pagination* mode no long running transaction is needed. The
+    `keyset` columns must be among the selected ones, possibly labelled, and
+    any ordering of the original `stmt` is replaced.
+
+    __ https://magicstack.github.io/asyncpg/devel/api/index.html#connection
+    __ https://magicstack.github.io/asyncpg/devel/api/\
+       index.html#asyncpg.cursor.Cursor.fetch
+    __ https://magicstack.github.io/asyncpg/devel/api/\
+       index.html#asyncpg.Record
+    """
+
+    if keyset is not None:
+        names = ['_keyset_%d' % i for i in range(len(keyset))]
+        first = stmt.order_by(None).order_by(*keyset).limit(batch_size)
+        following = first.where(tuple_(*keyset) > tuple_(*(
+            bindparam(name, type_=column.type) for name, column in zip(names, keyset))))
+        # Pick the values by position, as the names may be ambiguous or labelled
+        indexes = _keyset_indexes(first, keyset)
+        named_args = dict(named_args) if named_args else {}
+        batch = await fetchall(apgconn, first, pos_args, named_args,
+                               warn_slow_query_threshold, **kwargs)
+        while batch:
+            yield batch
+            if len(batch) < batch_size:
+                break
+            last = batch[-1]
+            named_args.update((name, last[index])
+                              for name, index in zip(names, indexes))
+            batch = await fetchall(apgconn, following, pos_args, named_args,
+                                   warn_slow_query_threshold, **kwargs)
+        return
+
+    sql, args = compile(stmt, pos_args, named_args)
+    message = 'Fetched %(rows)d records in %(elapsed)s (%(rate).0f records/sec)'
+    execution = _Execution(apgconn, 'fetch_batches',
+                           'fetching batches of %d rows' % batch_size, sql, args,
+                           warn_slow_query_threshold)
+    count = 0
+
+    async def batches():
+        cursor = await apgconn.cursor(sql, *args)
+        while True:
+            batch = await cursor.fetch(batch_size, **kwargs)
+            if not batch:
+                break
+            yield batch
+
+    try:
+        if apgconn.is_in_transaction():
+            async for batch in batches():
+                count += len(batch)
+                yield batch
+        else:
+            async with apgconn.transaction():
+                async for batch in batches():
+                    count += len(batch)
+                    yield batch
+    except GeneratorExit:
+        execution.finished(count, message)
+        raise
+    except Exception as e:
+        execution.failed(e)
+        raise
+    execution.finished(count, message,
+                       'Suspiciously SLOW fetch of %(rows)d records in batches'
+                       ' (%(rate).0f records/sec)')
+
+
 async def fetchone(apgconn, stmt, pos_args=None, named_args=None,
-                   warn_slow_query_threshold=SLOW_QUERY_THRESHOLD, **kwargs):
+                   warn_slow_query_threshold=SLOW_QUERY_THRESHOLD, raw_json=False,
+                   **kwargs):
     r"""Execute the given statement on a asyncpg connection and return the
     first row.
 
@@ -307,6 +891,8 @@ async def fetchone(apgconn, stmt, pos_args=None, named_args=None,
     :param stmt: any SQLAlchemy core statement or a raw SQL instruction
     :param pos_args: a possibly empty sequence of positional arguments
     :param named_args: a possibly empty mapping of named arguments
+    :param raw_json: when true, the values of the ``json`` and ``jsonb`` columns
+                     are returned as :class:`~.types.RawJSON` instances
     :param \*\*kwargs: any valid `fetchrow()`__ keyword argument
     :return: either ``None`` or a `Record`__ instance
 
@@ -322,33 +908,28 @@ async def fetchone(apgconn, stmt, pos_args=None, named_args=None,
     """
 
     sql, args = compile(stmt, pos_args, named_args)
-    debug = logger.isEnabledFor(logging.DEBUG)
-    if debug:
-        _log_sql_statement(apgconn, 'Fetching row', sql, args)
-    t0 = perf_counter()
+    decoding = _RawJSONDecoding(apgconn) if raw_json else None
+    execution = _Execution(apgconn, 'fetchone', 'fetching row', sql, args,
+                           warn_slow_query_threshold)
     try:
-        result = await apgconn.fetchrow(sql, *args, **kwargs)
+        if decoding is None:
+            result = await apgconn.fetchrow(sql, *args, **kwargs)
+        else:
+            with decoding:
+                result = await apgconn.fetchrow(sql, *args, **kwargs)
     except Exception as e:
-        if not debug:
-            _log_sql_statement(apgconn, 'Error "%s" fetching row' % e,
-                               sql, args, logf=logger.error)
+        execution.failed(e)
         raise
-    elapsed = perf_counter() - t0
-    if debug or elapsed > warn_slow_query_threshold:
-        if debug:
-            logf = (logger.debug if elapsed < warn_slow_query_threshold
-                    else logger.warning)
-            logf('Fetched %s in %s',
-                 'no records' if result is None else 'one record',
-                 _format_elapsed_time(elapsed))
-        else:
-            _log_sql_statement(apgconn, 'Suspiciously SLOW query', sql, args,
-                               logf=logger.warning)
+    if result is None:
+        execution.finished(0, 'Fetched no records in %(elapsed)s')
+    else:
+        execution.finished(1, 'Fetched one record in %(elapsed)s')
     return result
 
 
 async def scalar(apgconn, stmt, pos_args=None, named_args=None,
-                 warn_slow_query_threshold=SLOW_QUERY_THRESHOLD, **kwargs):
+                 warn_slow_query_threshold=SLOW_QUERY_THRESHOLD, raw_json=False,
+                 **kwargs):
     r"""Execute the given statement on a asyncpg connection and return a
     single column of the first row.
 
@@ -356,6 +937,8 @@ async def scalar(apgconn, stmt, pos_args=None, named_args=None,
     :param stmt: any SQLAlchemy core statement or a raw SQL instruction
     :param pos_args: a possibly empty sequence of positional arguments
     :param named_args: a possibly empty mapping of named arguments
+    :param raw_json: when true, the values of the ``json`` and ``jsonb`` columns
+                     are returned as :class:`~.types.RawJSON` instances
     :param \*\*kwargs: any valid `fetchval()`__ keyword argument
     :return: the value of the specified column of the first record, or
              ``None`` if the query does not return any rows
@@ -383,24 +966,17 @@ async def scalar(apgconn, stmt, pos_args=None, named_args=None,
     """
 
     sql, args = compile(stmt, pos_args, named_args)
-    debug = logger.isEnabledFor(logging.DEBUG)
-    if debug:
-        _log_sql_statement(apgconn, 'Fetching scalar', sql, args)
-    t0 = perf_counter()
+    decoding = _RawJSONDecoding(apgconn) if raw_json else None
+    execution = _Execution(apgconn, 'scalar', 'fetching scalar', sql, args,
+                           warn_slow_query_threshold)
     try:
-        result = await apgconn.fetchval(sql, *args, **kwargs)
+        if decoding is None:
+            result = await apgconn.fetchval(sql, *args, **kwargs)
+        else:
+            with decoding:
+                result = await apgconn.fetchval(sql, *args, **kwargs)
     except Exception as e:
-        if not debug:
-            _log_sql_statement(apgconn, 'Error "%s" fetching scalar' % e,
-                               sql, args, logf=logger.error)
+        execution.failed(e)
         raise
-    elapsed = perf_counter() - t0
-    if debug or elapsed > warn_slow_query_threshold:
-        if debug:
-            logf = (logger.debug if elapsed < warn_slow_query_threshold
-                    else logger.warning)
-            logf('Fetched value in %s', _format_elapsed_time(elapsed))
-        else:
-            _log_sql_statement(apgconn, 'Suspiciously SLOW query', sql, args,
-                               logf=logger.warning)
+    execution.finished(0 if result is None else 1, 'Fetched value in %(elapsed)s')
     return result
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Instrumentation hooks
+# :Created:   sab 17 ott 2026 15:02:18 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+EVENTS = ('before_execute', 'after_execute', 'on_error')
+"The names of the events fired around each database call."
+
+
+class ExecutionContext:
+    """The details of a single database call, passed to the hooks.
+
+    :param operation: the name of the function, for example ``'fetchall'``
+    :param connection: the asyncpg connection
+    :param sql: the SQL statement
+    :param args: the positional arguments of the statement
+
+    The `elapsed` time in seconds is set before firing the ``after_execute``
+    and ``on_error`` events, as is the number of `rows` returned or processed,
+    when known; the `error` is set before firing ``on_error``.
+
+    The very same instance is passed to all the hooks fired for a given call,
+    so a ``before_execute`` hook may stash something, for example a tracing
+    span, in the `extra` dictionary and pick it up later, in the
+    ``after_execute`` or ``on_error`` hook.
+    """
+
+    __slots__ = ('operation', 'connection', 'sql', 'args', 'elapsed', 'rows', 'error',
+                 'extra')
+
+    def __init__(self, operation, connection, sql, args):
+        self.operation = operation
+        self.connection = connection
+        self.sql = sql
+        self.args = args
+        self.elapsed = None
+        self.rows = None
+        self.error = None
+        self.extra = {}
+
+    @property
+    def transaction_id(self):
+        "An identifier of the current transaction, the same used in the logs."
+
+        from asyncpg.pool import PoolConnectionProxy
+
+        connection = self.connection
+        if isinstance(connection, PoolConnectionProxy):
+            connection = connection._con
+        return id(getattr(connection, '_top_xact', None))
+
+
+class Hooks:
+    """The registry of the instrumentation hooks.
+
+    Each hook is a plain function, called with an :class:`ExecutionContext`
+    instance as its only argument: it is executed synchronously, so it must
+    be quick. Exceptions raised by hooks are logged and then ignored.
+
+    When no hook is registered, `active` is ``False`` and the functions in
+    :mod:`.funcs` do not even build the context.
+    """
+
+    __slots__ = ('active',) + EVENTS
+
+    def __init__(self):
+        self.clear()
+
+    def register(self, event, hook):
+        "Register `hook` to be called on `event`, one of :data:`EVENTS`."
+
+        if event not in EVENTS:
+            raise ValueError('Unknown event %r' % event)
+        setattr(self, event, getattr(self, event) + (hook,))
+        self.active = True
+
+    def unregister(self, event, hook):
+        "Remove `hook` from those called on `event`."
+
+        if event not in EVENTS:
+            raise ValueError('Unknown event %r' % event)
+        setattr(self, event, tuple(h for h in getattr(self, event) if h != hook))
+        self.active = any(getattr(self, e) for e in EVENTS)
+
+    def clear(self):
+        "Unregister all hooks."
+
+        for event in EVENTS:
+            setattr(self, event, ())
+        self.active = False
+
+    def fire(self, event, context):
+        "Call the hooks registered on `event` passing them the `context`."
+
+        for hook in getattr(self, event):
+            try:
+                hook(context)
+            except Exception:
+                logger.exception('Error in %s hook %r', event, hook)
+
+
+hooks = Hooks()
+"The global :class:`Hooks` registry used by the :mod:`.funcs` functions."
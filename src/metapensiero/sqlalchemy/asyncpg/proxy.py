@@ -6,27 +6,293 @@
 # :Copyright: © 2017 Lele Gaifax
 #
 
+from asyncio import gather
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from hashlib import sha1
 from logging import getLogger
+from operator import itemgetter
 
-from sqlalchemy import func, select
+from sqlalchemy import and_, bindparam, func, or_, select, tuple_
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.sql.expression import Selectable
+from sqlalchemy.sql.expression import ClauseElement, Select, Selectable
+from sqlalchemy.sql.util import find_tables
 
 from metapensiero.sqlalchemy.proxy.core import ProxiedQuery
-from metapensiero.sqlalchemy.proxy.sorters import apply_sorters
+from metapensiero.sqlalchemy.proxy.sorters import (Direction, apply_sorters,
+                                                   extract_sorters)
+from metapensiero.sqlalchemy.proxy.utils import col_by_name
+
+from .cache import LRUCache
+from .connection import Connection
+from .funcs import _dialect, _keyset_indexes, compile
+from .types import RawJSON, json_decode, json_encode
 
 
 logger = getLogger(__name__)
 
 
-class AsyncpgProxiedQuery(ProxiedQuery):
+COUNT_STRATEGIES = ('separate', 'window')
+"The available strategies to compute the total count of records."
+
+TOTAL_COUNT_LABEL = '_total_count_'
+"The label of the window column carrying the total count of records."
+
+COUNT_POLICIES = ('exact', 'estimated', 'cached')
+"The available policies to compute the count of records."
+
+EXACT_COUNT_THRESHOLD = 1000
+"""With the ``estimated`` count policy, the exact count is computed anyway when
+the planner estimates less than this number of records.
+"""
+
+ROW_CONVERTERS_CACHE_SIZE = 32
+"Maximum number of row converters kept by each proxy, see :meth:`getRowConverter`."
+
+COUNT_CACHE_SIZE = 1000
+"Maximum number of counts kept by :data:`count_cache`."
+
+COUNT_CACHE_TTL = 60
+"Number of seconds after which a count kept in :data:`count_cache` expires."
+
+count_cache = LRUCache(COUNT_CACHE_SIZE, COUNT_CACHE_TTL)
+"""The cache of the counts used by the ``cached`` count policy.
+
+This is a :class:`~.cache.LRUCache` instance keyed on the SQL of the count
+query and its arguments: change its ``ttl`` to tune the staleness of the
+counts.
+"""
+
+
+def _encode_keyset_token(values):
+    return urlsafe_b64encode(json_encode(values).encode('utf-8')).decode('ascii')
+
+
+def _decode_keyset_token(token):
+    try:
+        values = json_decode(urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except (BinasciiError, UnicodeError, ValueError):
+        values = None
+    if not isinstance(values, list):
+        raise ValueError('Invalid keyset token: %r' % token)
+    return values
+
+
+_missing = object()
+
+
+def _is_pool(dbconn):
+    return hasattr(dbconn, 'acquire')
+
+
+class _Acquired:
+    """Asynchronous context manager that yields a :class:`.Connection`,
+    acquiring it from `dbconn` when that is a pool.
     """
+
+    __slots__ = ('dbconn', 'acquisition')
+
+    def __init__(self, dbconn):
+        self.dbconn = dbconn
+        self.acquisition = None
+
+    async def __aenter__(self):
+        if not _is_pool(self.dbconn):
+            return self.dbconn
+        self.acquisition = self.dbconn.acquire()
+        return Connection(await self.acquisition.__aenter__())
+
+    async def __aexit__(self, *exc):
+        if self.acquisition is not None:
+            return await self.acquisition.__aexit__(*exc)
+
+
+class AsyncpgProxiedQuery(ProxiedQuery):
+    r"""
     An asyncpg variant of the `ProxiedQuery`__.
 
+    :param query: the SQLAlchemy statement
+    :param metadata: a dictionary with extra information about the fields
+    :param count_strategy: how the total count of records is computed when
+                           both the ``count`` and the ``result`` are requested,
+                           one of :data:`COUNT_STRATEGIES`
+    :param snapshot: whether the concurrent count and page queries must see
+                     the same snapshot of the data, allowed only when the
+                     proxy is called with a pool of connections
+    :param count_policy: how the count is computed, one of
+                         :data:`COUNT_POLICIES`
+    :param result_cache: either ``None`` or a :class:`~.resultcache.ResultCache`
+                         instance
+    :param raw_json: whether the values of the ``json`` and ``jsonb`` columns
+                     shall be returned as :class:`~.types.RawJSON` instances
+
+    With the default ``separate`` strategy the count is computed by a
+    dedicated query, executed before the one fetching the page of records.
+
+    With the ``window`` strategy the page and the total count are fetched by
+    a single statement, that carries an additional ``count(*) OVER ()``
+    column, stripped from the result. This does not work when the query is
+    not a plain ``SELECT``, when it is a ``SELECT DISTINCT`` or when it
+    already has its own limit or offset: in these cases, as well as when the
+    result is not requested as dictionaries (asyncpg's ``Record``\ s are
+    immutable), the proxy falls back to the ``separate`` strategy. The same
+    happens when the requested page is empty and `start` is not zero, as
+    there is no row carrying the count.
+
+    The `dbconn` passed when calling the proxy may also be an asyncpg
+    Pool__, or any other object with a compatible ``acquire()`` method: in
+    this case, when the count and the page of records are fetched by
+    separate queries, these are executed concurrently on two different
+    connections. When `snapshot` is true, both queries are executed in a
+    ``REPEATABLE READ`` transaction sharing the same `snapshot`__, so that
+    the count is consistent with the page even in presence of concurrent
+    changes. Beware that each call holds two connections at the same time:
+    size the pool accordingly, or concurrent calls may wait for each other.
+    Requesting both the count and the records from a `snapshot` proxy with a
+    single connection raises a ``ValueError``: use an explicit ``REPEATABLE
+    READ`` transaction instead.
+
+    With the default ``exact`` `count_policy` the count is always computed
+    by a ``count(*)`` query. With the ``estimated`` policy the count is the
+    number of records estimated by the planner, as reported by ``EXPLAIN``,
+    unless that is below :data:`EXACT_COUNT_THRESHOLD`. With the ``cached``
+    policy the exact count is kept in the :data:`count_cache`, and reused
+    until it expires. The ``window`` strategy is used only with the ``exact``
+    policy. When requested, the metadata carries an ``estimated_count``
+    boolean flag.
+
+    Beside the arguments understood by the original proxy, it accepts a
+    ``keys`` slot name: when specified, the records are returned as plain
+    tuples and the list of their keys is put in that slot, sparing the cost
+    of building a dictionary for each record, and making its serialization
+    more compact.
+
+    It accepts also an ``after`` argument, that activates the *keyset
+    pagination* mode, where the page is selected by a condition on the sort
+    columns instead of by an ``OFFSET``, making the cost of each page
+    independent from its position: its value is either an empty string, to
+    get the first page, or the opaque token returned in the ``next`` slot
+    (or in the slot specified by the ``next`` argument) of the previous page,
+    ``None`` when there are no more records. See :meth:`applyKeyset` for the
+    details.
+
+    When a `result_cache` is given, the outcome of each call is kept there,
+    keyed on the SQL of the query and on all the arguments of the call, and
+    reused until it expires or until it is explicitly invalidated, for
+    example with ``await proxy.result_cache.invalidate('users')`` after a
+    change to the ``users`` table. Use it only for read-only queries, and
+    treat the results as immutable, as they are shared among the callers.
+
+    When `raw_json` is true, the JSON documents are not decoded: they are
+    returned as :class:`~.types.RawJSON` instances, that
+    :func:`~.types.json_encode` inserts verbatim in its output, sparing both
+    the parsing and the serialization when the result is sent as is to the
+    client.
+
     __ http://metapensierosqlalchemyproxy.readthedocs.io/en/latest/\
        core.html#metapensiero.sqlalchemy.proxy.core.ProxiedQuery
+    __ https://magicstack.github.io/asyncpg/devel/api/index.html#connection-pools
+    __ https://www.postgresql.org/docs/current/functions-admin.html\
+       #FUNCTIONS-SNAPSHOT-SYNCHRONIZATION
     """
 
+    def __init__(self, query, metadata=None, count_strategy='separate', snapshot=False,
+                 count_policy='exact', result_cache=None, raw_json=False):
+        if count_strategy not in COUNT_STRATEGIES:
+            raise ValueError('Invalid count strategy: %r' % count_strategy)
+        if count_policy not in COUNT_POLICIES:
+            raise ValueError('Invalid count policy: %r' % count_policy)
+        super().__init__(query, metadata)
+        self.count_strategy = count_strategy
+        self.snapshot = snapshot
+        self.count_policy = count_policy
+        self._row_converters = LRUCache(ROW_CONVERTERS_CACHE_SIZE)
+        self.result_cache = result_cache
+        self.raw_json = raw_json
+        self._tables = None
+
+    def getRowConverter(self, query, astuples=False):
+        """Return a function that converts a ``Record`` of `query` to a plain
+        dictionary, or to a tuple when `astuples` is true.
+
+        :param query: a SQLAlchemy core statement
+        :param astuples: whether the function shall return tuples instead of
+                         dictionaries
+        :return: a tuple of two items, the keys and the function
+
+        The records may carry additional trailing columns. The function is
+        built once for each distinct set of selected columns and cached in the
+        proxy.
+        """
+
+        columns = tuple((c.name, c.key) for c in self.getColumns(query))
+        ckey = (columns, astuples)
+        entry = self._row_converters.get(ckey)
+        if entry is None:
+            fn2key = dict(columns)
+            keys = tuple(fn2key.values())
+            # Like accessing the record by name, pick the last column with a
+            # given name
+            names = [fn for fn, key in columns]
+            indexes = tuple(len(names) - 1 - names[::-1].index(fn) for fn in fn2key)
+            if indexes == tuple(range(len(indexes))):
+                nkeys = len(keys)
+                if astuples:
+                    def convert(record):
+                        return record[:nkeys]
+                else:
+                    def convert(record):
+                        return dict(zip(keys, record))
+            else:
+                if len(indexes) == 1:
+                    index = indexes[0]
+
+                    def getter(record):
+                        return (record[index],)
+                else:
+                    getter = itemgetter(*indexes)
+                if astuples:
+                    convert = getter
+                else:
+                    def convert(record):
+                        return dict(zip(keys, getter(record)))
+            entry = keys, convert
+            self._row_converters.set(ckey, entry)
+        return entry
+
+    def canCountWithWindow(self, query, asdict):
+        """Determine whether the ``window`` strategy can be applied to `query`.
+
+        The strategy is not applicable when the `count_policy` is not ``exact``.
+
+        :param query: a SQLAlchemy core statement
+        :type asdict: bool or str
+        :param asdict: whether the result is requested as plain dictionaries
+                       or tuples
+        :return: a boolean
+        """
+
+        return (asdict
+                and self.count_policy == 'exact'
+                and isinstance(query, Select)
+                and not query._distinct
+                and query._limit_clause is None
+                and query._offset_clause is None)
+
+    def getCountQuery(self, query):
+        """Build the query that counts the records matched by `query`.
+
+        :param query: a SQLAlchemy core statement
+        :return: a SQLAlchemy ``SELECT`` statement
+        """
+
+        if not isinstance(query, Selectable):
+            raise ValueError('Query must be a Selectable')
+
+        pivot = next(query.inner_columns)
+        simple = query.with_only_columns([pivot]).order_by(None)
+        return select([func.count()], from_obj=simple.alias('cnt'))
+
     async def getCount(self, dbconn, query):
         """Async reimplementation of superclass' ``getCount()``.
 
@@ -36,33 +302,204 @@ class AsyncpgProxiedQuery(ProxiedQuery):
         :return: an integer, the count of matching records
         """
 
+        tquery = self.getCountQuery(query)
+        count = await dbconn.scalar(tquery, named_args=self.params)
+        return count
+
+    def getKeysetColumns(self, query):
+        """Determine the columns that uniquely identify a record of `query`.
+
+        :param query: a SQLAlchemy core statement
+        :return: a list of columns
+
+        This uses the same heuristic as ``getMetadata()``, that is the primary
+        key of the first table, that must be among the selected columns.
+        """
+
+        pk = []
+        pkt = None
+        for c in self.getColumns(query):
+            if (getattr(c, 'table', False) is not False
+                    and getattr(c, 'primary_key', False)):
+                if pkt is None:
+                    pkt = c.table
+                if c.table is pkt:
+                    pk.append(c)
+        if pkt is None or len(pk) != len(pkt.primary_key):
+            raise ValueError('Cannot determine the unique key of the query, needed by'
+                             ' the keyset pagination')
+        return pk
+
+    def applyKeyset(self, query, args, after):
+        r"""Order `query` for the keyset pagination, restricting it to the
+        records following the `after` token.
+
+        :param query: a SQLAlchemy core statement
+        :param args: a dictionary, from which the sorters are extracted
+        :param after: either an empty string or a token as returned by
+                      :meth:`getKeysetToken`
+        :return: a tuple of two items, the altered query and the positions of
+                 the columns carrying the values of the keys
+
+        The query is ordered by the requested sorters, followed by the columns
+        returned by :meth:`getKeysetColumns` as tie breakers. The sort columns
+        must not contain ``NULL``\ s. When a sort column is not among the
+        selected ones it is added, labelled ``_keyset_N``.
+
+        The token does not carry the sort specification: when the sorters
+        change, the pagination must restart from the first page.
+        """
+
+        order = []
+        for sorter in extract_sorters(args):
+            col = col_by_name(query, sorter.property)
+            if col is not None:
+                order.append((col, sorter.direction is Direction.DESC))
+            else:
+                logger.warning('Requested sort by %r, which does not exist in %s',
+                               sorter.property, query)
+        for col in self.getKeysetColumns(query):
+            if not any(c is col for c, _ in order):
+                order.append((col, False))
+
+        selected = list(query.inner_columns)
+        keys = []
+        for i, (col, desc) in enumerate(order):
+            if any(c is col for c in selected):
+                keys.append(col)
+            else:
+                label = col.label('_keyset_%d' % i)
+                query = query.column(label)
+                keys.append(label)
+
+        query = query.order_by(*[col.desc() if desc else col for col, desc in order])
+
+        if after:
+            values = _decode_keyset_token(after)
+            if len(values) != len(order):
+                raise ValueError('Invalid keyset token: %r' % after)
+            binds = [bindparam(None, value, type_=col.type)
+                     for (col, desc), value in zip(order, values)]
+            if all(desc == order[0][1] for col, desc in order):
+                columns = tuple_(*[col for col, desc in order])
+                values = tuple_(*binds)
+                condition = columns < values if order[0][1] else columns > values
+            else:
+                conditions = []
+                for i, ((col, desc), bind) in enumerate(zip(order, binds)):
+                    previous = [c == b for (c, d), b in zip(order[:i], binds)]
+                    previous.append(col < bind if desc else col > bind)
+                    conditions.append(and_(*previous))
+                condition = or_(*conditions)
+            query = query.where(condition)
+
+        # The values are picked by position, as the names of the columns may
+        # be ambiguous or labelled
+        return query, _keyset_indexes(query, keys)
+
+    def getKeysetToken(self, record, indexes):
+        """Build the token to fetch the records following `record`.
+
+        :param record: an asyncpg ``Record``
+        :param indexes: the positions of the key columns, as returned by
+                        :meth:`applyKeyset`
+        :return: an opaque string
+        """
+
+        return _encode_keyset_token([record[index] for index in indexes])
+
+    async def getEstimatedCount(self, dbconn, query):
+        """Ask the planner an estimate of the number of matching records.
+
+        :param dbconn: an object carrying a method ``scalar()``, based on
+                       :func:`.funcs.scalar`
+        :param query: a SQLAlchemy core statement
+        :return: an integer, the estimated count of matching records
+        """
+
         if not isinstance(query, Selectable):
             raise ValueError('Query must be a Selectable')
 
-        pivot = next(query.inner_columns)
-        simple = query.with_only_columns([pivot])
-        tquery = select([func.count()], from_obj=simple.alias('cnt'))
-        count = await dbconn.scalar(tquery, named_args=self.params)
+        sql, args = compile(query.order_by(None), named_args=self.params)
+        plan = await dbconn.scalar('EXPLAIN (FORMAT JSON) ' + sql, args)
+        # The plan is a string with the default codecs, a RawJSON when the
+        # connection returns the JSON values undecoded
+        if isinstance(plan, (str, RawJSON)):
+            plan = json_decode(str(plan))
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    async def getCachedCount(self, dbconn, query):
+        """Return the count of matching records, going thru the :data:`count_cache`.
+
+        :param dbconn: an object carrying a method ``scalar()``, based on
+                       :func:`.funcs.scalar`
+        :param query: a SQLAlchemy core statement
+        :return: an integer, the count of matching records
+        """
+
+        sql, args = compile(self.getCountQuery(query), named_args=self.params)
+        key = (sql, args)
+        try:
+            count = count_cache.get(key)
+        except TypeError:
+            # Some argument is not hashable, for example a list
+            key = count = None
+        if count is None:
+            count = await dbconn.scalar(sql, args)
+            if key is not None:
+                count_cache.set(key, count)
         return count
 
+    async def computeCount(self, dbconn, query):
+        """Compute the count of matching records, according to the `count_policy`.
+
+        :param dbconn: an object carrying a method ``scalar()``, based on
+                       :func:`.funcs.scalar`
+        :param query: a SQLAlchemy core statement
+        :return: a tuple of two items, the count and a boolean flag that is
+                 ``True`` when it is an estimate
+        """
+
+        policy = self.count_policy
+        if policy == 'estimated':
+            count = await self.getEstimatedCount(dbconn, query)
+            if count >= EXACT_COUNT_THRESHOLD:
+                return count, True
+        elif policy == 'cached':
+            return await self.getCachedCount(dbconn, query), False
+        return await self.getCount(dbconn, query), False
+
+    async def fetchRecords(self, dbconn, query):
+        """Fetch the records of `query`, honoring the `raw_json` option.
+
+        :param dbconn: an object carrying a method ``fetchall()``, based on
+                       :func:`.funcs.fetchall`
+        :param query: a SQLAlchemy core statement
+        :return: a list of records
+        """
+
+        if self.raw_json:
+            return await dbconn.fetchall(query, named_args=self.params, raw_json=True)
+        return await dbconn.fetchall(query, named_args=self.params)
+
     async def getResult(self, dbconn, query, asdict):
-        """Async reimplementation of superclass' ``getResult()``.
+        r"""Async reimplementation of superclass' ``getResult()``.
 
         :param dbconn: an object carrying a method ``fetchall()``, based on
                        :func:`.funcs.fetchall`
         :param query: a SQLAlchemy core statement
-        :type asdict: bool
+        :type asdict: bool or str
         :param asdict: whether to return plain dictionaries instead of
-                       asyncpg's native ``Record``\ s
+                       asyncpg's native ``Record``\ s, or ``'tuples'`` to
+                       return plain tuples
         :return: an integer, the count of matching records
         """
 
         if isinstance(query, Selectable):
-            rows = await dbconn.fetchall(query, named_args=self.params)
+            rows = await self.fetchRecords(dbconn, query)
             if asdict:
-                fn2key = dict((c.name, c.key) for c in self.getColumns(query))
-                result = [dict((fn2key[fn], r[fn]) for fn in fn2key)
-                          for r in rows]
+                keys, convert = self.getRowConverter(query, asdict == 'tuples')
+                result = [convert(r) for r in rows]
             else:
                 result = rows
         else:
@@ -70,35 +507,216 @@ class AsyncpgProxiedQuery(ProxiedQuery):
             result = None
         return result
 
+    async def getWindowedResultAndCount(self, dbconn, query, asdict, start, limit):
+        r"""Fetch a page of records together with the total count, in a single
+        statement, implementing the ``window`` strategy.
+
+        :param dbconn: an object carrying the methods ``fetchall()`` and
+                       ``scalar()``, based on :func:`.funcs.fetchall` and
+                       :func:`.funcs.scalar`
+        :param query: a SQLAlchemy ``SELECT`` statement
+        :type asdict: bool or str
+        :param asdict: whether to return plain dictionaries instead of
+                       asyncpg's native ``Record``\ s, or ``'tuples'`` to
+                       return plain tuples
+        :param start: the index of the first record of the page, if any
+        :param limit: the size of the page, if any
+        :return: a tuple of two items, the total count of matching records and
+                 the page of records
+        """
+
+        wquery = query.column(func.count().over().label(TOTAL_COUNT_LABEL))
+        if start:
+            wquery = wquery.offset(start)
+        if limit:
+            wquery = wquery.limit(limit)
+        rows = await self.fetchRecords(dbconn, wquery)
+
+        if rows:
+            count = rows[0][TOTAL_COUNT_LABEL]
+        elif start:
+            count = await self.getCount(dbconn, query)
+        else:
+            count = 0
+
+        if asdict:
+            keys, convert = self.getRowConverter(query, asdict == 'tuples')
+            rows = [convert(r) for r in rows]
+
+        return count, rows
+
+    async def getResultAndCount(self, dbconn, query, asdict, start, limit):
+        r"""Fetch a page of records together with the total count.
+
+        :param dbconn: either an object carrying the methods ``fetchall()``
+                       and ``scalar()``, based on :func:`.funcs.fetchall` and
+                       :func:`.funcs.scalar`, or a pool of connections
+        :param query: a SQLAlchemy core statement
+        :type asdict: bool or str
+        :param asdict: whether to return plain dictionaries instead of
+                       asyncpg's native ``Record``\ s, or ``'tuples'`` to
+                       return plain tuples
+        :param start: the index of the first record of the page, if any
+        :param limit: the size of the page, if any
+        :return: a tuple of three items, the total count of matching records,
+                 a boolean flag that is ``True`` when the count is an estimate
+                 and the page of records
+        """
+
+        if self.snapshot and not _is_pool(dbconn):
+            raise ValueError('The snapshot can be shared only by the connections'
+                             ' of a pool')
+
+        if self.count_strategy == 'window' and self.canCountWithWindow(query, asdict):
+            async with _Acquired(dbconn) as conn:
+                count, rows = await self.getWindowedResultAndCount(conn, query, asdict,
+                                                                   start, limit)
+                return count, False, rows
+
+        pquery = query
+        if start:
+            pquery = pquery.offset(start)
+        if limit:
+            pquery = pquery.limit(limit)
+
+        if not _is_pool(dbconn):
+            count, estimated = await self.computeCount(dbconn, query)
+            rows = await self.getResult(dbconn, pquery, asdict)
+            return count, estimated, rows
+
+        async with dbconn.acquire() as capgc, dbconn.acquire() as rapgc:
+            cconn = Connection(capgc)
+            rconn = Connection(rapgc)
+            if not self.snapshot:
+                (count, estimated), rows = await gather(
+                    self.computeCount(cconn, query),
+                    self.getResult(rconn, pquery, asdict))
+                return count, estimated, rows
+
+            async with capgc.transaction(isolation='repeatable_read', readonly=True):
+                snapshot = await cconn.scalar('SELECT pg_export_snapshot()')
+                async with rapgc.transaction(isolation='repeatable_read', readonly=True):
+                    await rconn.execute("SET TRANSACTION SNAPSHOT '%s'" % snapshot)
+                    (count, estimated), rows = await gather(
+                        self.computeCount(cconn, query),
+                        self.getResult(rconn, pquery, asdict))
+                    return count, estimated, rows
+
+    def getResultCacheKey(self, conditions, args):
+        """Compute the key of the result of a call in the `result_cache`.
+
+        :param conditions: a list of SQLAlchemy expressions
+        :param args: a dictionary
+        :return: a string
+        """
+
+        # Proxies sharing the same cache may differ in the shape of the result
+        parts = [compile(self.query), self.count_strategy, self.count_policy,
+                 self.raw_json]
+        # The conditions are new objects at each call, and are not statements:
+        # compile them directly
+        for c in conditions:
+            if isinstance(c, ClauseElement):
+                compiled = c.compile(dialect=_dialect)
+                c = (compiled.string, sorted(compiled.params.items()))
+            parts.append(c)
+        parts.extend(sorted(args.items()))
+        return sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    def getResultCacheTables(self):
+        "Return the tables the query depends on."
+
+        if self._tables is None:
+            self._tables = sorted({t.fullname for t in find_tables(self.query)})
+        return self._tables
+
     async def __call__(self, dbconn, *conditions, **args):
         "Async reimplementation of superclass' ``__call__()``."
 
+        cache = self.result_cache
+        if cache is None:
+            return await self._call(dbconn, conditions, args)
+
+        key = self.getResultCacheKey(conditions, args)
+        return await cache.fetch(key, self.getResultCacheTables(),
+                                 lambda: self._call(dbconn, conditions, args))
+
+    async def _call(self, dbconn, conditions, args):
+        keysslot = args.pop('keys', None)
+        after = args.pop('after', _missing)
+        nextslot = args.pop('next', 'next')
+
         (query, result, asdict,
          resultslot, successslot, messageslot, countslot, metadataslot,
          start, limit) = self.prepareQueryFromConditionsAndArgs(dbconn,
                                                                 conditions,
                                                                 args)
 
+        if keysslot in (False, 'False', 'None', 'false', ''):
+            keysslot = None
+        elif keysslot is not None:
+            if keysslot in (True, 'True', 'true'):
+                keysslot = 'keys'
+            keysslot = resultslot is not True and resultslot and keysslot
+            if keysslot:
+                asdict = 'tuples'
+
+        estimated = False
         try:
-            if limit != 0:
-                if countslot:
-                    count = await self.getCount(dbconn, query)
-                    result[countslot] = count
+            if limit != 0 and after is not _missing:
+                async with _Acquired(dbconn) as conn:
+                    if countslot:
+                        count, estimated = await self.computeCount(conn, query)
+                        result[countslot] = count
 
-                if resultslot:
-                    query = apply_sorters(query, args)
-                    if start:
-                        query = query.offset(start)
+                    kquery, indexes = self.applyKeyset(query, args, after)
                     if limit:
-                        query = query.limit(limit)
-                    rows = await self.getResult(dbconn, query, asdict)
-                    result[resultslot] = rows
+                        kquery = kquery.limit(limit)
+                    records = await self.fetchRecords(conn, kquery)
+                    if resultslot:
+                        if asdict:
+                            keys, convert = self.getRowConverter(query,
+                                                                 asdict == 'tuples')
+                            rows = [convert(r) for r in records]
+                        else:
+                            rows = records
+                        result[resultslot] = rows
+                    if resultslot is not True and nextslot:
+                        if limit and len(records) == limit:
+                            result[nextslot] = self.getKeysetToken(records[-1], indexes)
+                        else:
+                            result[nextslot] = None
+            elif limit != 0 and countslot and resultslot:
+                query = apply_sorters(query, args)
+                count, estimated, rows = await self.getResultAndCount(
+                    dbconn, query, asdict, start, limit)
+                result[countslot] = count
+                result[resultslot] = rows
+            elif limit != 0:
+                async with _Acquired(dbconn) as conn:
+                    if countslot:
+                        count, estimated = await self.computeCount(conn, query)
+                        result[countslot] = count
+
+                    if resultslot:
+                        query = apply_sorters(query, args)
+                        if start:
+                            query = query.offset(start)
+                        if limit:
+                            query = query.limit(limit)
+                        rows = await self.getResult(conn, query, asdict)
+                        result[resultslot] = rows
 
             if metadataslot:
                 result[metadataslot] = self.getMetadata(query,
                                                         countslot,
                                                         resultslot,
                                                         successslot)
+                if countslot:
+                    result[metadataslot]['estimated_count'] = estimated
+
+            if keysslot:
+                result[keysslot] = list(self.getRowConverter(query, True)[0])
 
             result[successslot] = True
             result[messageslot] = 'Ok'
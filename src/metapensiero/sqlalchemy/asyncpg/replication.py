@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Routing to read replicas
+# :Created:   sab 17 ott 2026 19:48:27 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+from time import monotonic
+
+from sqlalchemy.sql.selectable import SelectBase
+
+from .connection import Connection
+from .database import Database
+
+
+ROUTING_STRATEGIES = ('round-robin', 'least-outstanding')
+"The available strategies to pick the replica that will execute a read."
+
+
+def is_read_only(stmt):
+    """Tell whether `stmt` can be executed on a replica.
+
+    :param stmt: either a string or a SQLAlchemy statement
+    :return: a boolean
+
+    Only SQLAlchemy ``SELECT`` statements without a locking clause are
+    considered read only: plain SQL strings may do anything.
+    """
+
+    return (isinstance(stmt, SelectBase)
+            and getattr(stmt, '_for_update_arg', None) is None)
+
+
+class _Target:
+    "A pool of connections, with its statistics."
+
+    __slots__ = ('name', 'pool', 'requests', 'outstanding', 'errors', 'elapsed')
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.requests = self.outstanding = self.errors = 0
+        self.elapsed = 0.0
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'outstanding': self.outstanding,
+            'errors': self.errors,
+            'elapsed': self.elapsed,
+            'average': self.elapsed / self.requests if self.requests else 0.0,
+        }
+
+
+class _Acquisition:
+    """Asynchronous context manager that acquires a connection from the pool
+    of a target, tracking its usage.
+    """
+
+    __slots__ = ('database', 'target', 'write', 'acquisition', 'started')
+
+    def __init__(self, database, target, write):
+        self.database = database
+        self.target = target
+        self.write = write
+        self.acquisition = None
+        self.started = None
+
+    async def __aenter__(self):
+        target = self.target
+        target.outstanding += 1
+        self.started = monotonic()
+        self.acquisition = target.pool.acquire()
+        try:
+            return await self.acquisition.__aenter__()
+        except BaseException:
+            self._done(True)
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            return await self.acquisition.__aexit__(exc_type, exc, tb)
+        finally:
+            self._done(exc_type is not None)
+
+    def _done(self, failed):
+        target = self.target
+        now = monotonic()
+        target.outstanding -= 1
+        target.requests += 1
+        target.elapsed += now - self.started
+        if failed:
+            target.errors += 1
+        if self.write:
+            self.database.last_write = now
+
+
+class ReplicatedDatabase(Database):
+    """A :class:`~.database.Database` that routes reads to a set of replicas.
+
+    :param pool: the asyncpg Pool__ connected to the primary server
+    :param replicas: a sequence of pools, each connected to a replica
+    :param strategy: how a replica is picked, one of
+                     :data:`ROUTING_STRATEGIES`
+    :param read_your_writes: the number of seconds after a write during which
+                             reads are still routed to the primary
+    :param coalescer: either ``None`` or a :class:`~.coalescer.Coalescer`
+                      instance
+
+    The statements executed by :meth:`~.database.Database.fetchall()`,
+    :meth:`~.database.Database.fetchone()`,
+    :meth:`~.database.Database.scalar()`,
+    :meth:`~.database.Database.fetch_columns()` and by the iterators go to a
+    replica when they are :func:`read only <is_read_only>`. Everything else,
+    including whatever is executed within a
+    :meth:`~.database.Database.transaction()`, goes to the primary.
+
+    With the ``round-robin`` `strategy` the replicas are used in turn, while
+    with the ``least-outstanding`` one the replica with the lowest number of
+    in-flight requests is picked.
+
+    Since replicas lag behind the primary, a client may not immediately see
+    its own changes: the `read_your_writes` window, measured from the end of
+    the last write executed by *this instance*, works around that. For the
+    same reason the reads executed by the primary are never coalesced, as
+    they could join one started before the write.
+
+    __ https://magicstack.github.io/asyncpg/current/api/index.html\
+       #connection-pools
+    """
+
+    __slots__ = ('strategy', 'read_your_writes', 'last_write', 'primary', 'replicas',
+                 '_next')
+
+    def __init__(self, pool, replicas, strategy='round-robin', read_your_writes=0,
+                 coalescer=None):
+        if strategy not in ROUTING_STRATEGIES:
+            raise ValueError('Invalid routing strategy: %r' % strategy)
+        super().__init__(pool, coalescer)
+        self.strategy = strategy
+        self.read_your_writes = read_your_writes
+        self.last_write = None
+        self.primary = _Target('primary', pool)
+        self.replicas = [_Target('replica%d' % i, replica)
+                         for i, replica in enumerate(replicas, 1)]
+        self._next = 0
+
+    @classmethod
+    async def create(cls, dsn=None, *, replicas=(), strategy='round-robin',
+                     read_your_writes=0, init=None, coalescer=None,
+                     json_backend='nssjson', **kwargs):
+        r"""Create the pools of connections and return an instance wrapping them.
+
+        :param dsn: the connection arguments of the primary, in the `libpq
+                    connection URI format`__
+        :param replicas: a sequence of connection URIs, one for each replica
+        :param strategy: one of :data:`ROUTING_STRATEGIES`
+        :param read_your_writes: the duration of the window after a write
+        :param init: an optional coroutine function, called on each new
+                     connection after :func:`~.types.register_custom_codecs`
+        :param coalescer: either ``None`` or a :class:`~.coalescer.Coalescer`
+                          instance
+        :param json_backend: the name of one of the
+                             :data:`~.types.JSON_BACKENDS`
+        :param \*\*kwargs: any valid `create_pool()`__ keyword argument, used
+                           for all the pools
+
+        __ https://www.postgresql.org/docs/current/libpq-connect.html#LIBPQ-CONNSTRING
+        __ https://magicstack.github.io/asyncpg/current/api/index.html\
+           #asyncpg.pool.create_pool
+        """
+
+        pool = await cls._create_pool(dsn, init, json_backend, kwargs)
+        replicas = [await cls._create_pool(replica, init, json_backend, kwargs)
+                    for replica in replicas]
+        return cls(pool, replicas, strategy, read_your_writes, coalescer)
+
+    def _acquire(self, stmt=None, readonly=False):
+        if (readonly and self.replicas and is_read_only(stmt)
+                and not self._recently_written()):
+            return _Acquisition(self, self._pick_replica(), False)
+        # Only the statements executed by a writing method are writes: reads
+        # may go to the primary also when they are plain SQL strings
+        return _Acquisition(self, self.primary, not readonly)
+
+    async def _run(self, method, stmt, *args, readonly=False, **kwargs):
+        acquisition = self._acquire(stmt, readonly)
+        async with acquisition as apgc:
+            if acquisition.target is self.primary:
+                connection = Connection(apgc)
+            else:
+                connection = self._connection(apgc)
+            return await getattr(connection, method)(stmt, *args, **kwargs)
+
+    def _recently_written(self):
+        return (self.last_write is not None
+                and monotonic() - self.last_write < self.read_your_writes)
+
+    def _pick_replica(self):
+        replicas = self.replicas
+        if self.strategy == 'round-robin':
+            replica = replicas[self._next % len(replicas)]
+            self._next += 1
+        else:
+            replica = min(replicas, key=lambda r: r.outstanding)
+        return replica
+
+    async def close(self):
+        "Gracefully close the pools of the primary and of the replicas."
+
+        await super().close()
+        for replica in self.replicas:
+            await replica.pool.close()
+
+    def stats(self):
+        """Return a dictionary with the counters of each target.
+
+        The keys are ``'primary'``, ``'replica1'``, ``'replica2'`` and so on,
+        each associated with the number of `requests`, the `outstanding` ones,
+        the number of `errors`, the total `elapsed` seconds and their
+        `average`. The elapsed time is the one spent holding a connection of
+        the target, thus it includes the consumption of the iterators.
+        """
+
+        return {target.name: target.stats()
+                for target in [self.primary] + self.replicas}
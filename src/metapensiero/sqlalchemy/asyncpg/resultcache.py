@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Cache of query results
+# :Created:   sab 17 ott 2026 17:12:09 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+from .cache import LRUCache
+from .coalescer import Coalescer
+
+
+def _table_name(table):
+    return table if isinstance(table, str) else table.fullname
+
+
+class MemoryBackend:
+    """The default in-memory storage of a :class:`ResultCache`.
+
+    :param size: the maximum number of results kept
+
+    Any other backend must implement the same asynchronous methods: a
+    shared one, for example on top of Redis, will need to serialize the
+    results.
+    """
+
+    __slots__ = ('_results', '_tables')
+
+    def __init__(self, size=1000):
+        self._results = LRUCache(size)
+        self._tables = {}
+
+    async def get(self, key):
+        "Return the result associated with `key`, or ``None`` if missing."
+
+        return self._results.get(key)
+
+    async def set(self, key, result, ttl, tables):
+        """Associate `result` to `key` for `ttl` seconds, recording that it
+        depends on the given `tables` names.
+        """
+
+        results = self._results
+        results.set(key, result, ttl)
+        for table in tables:
+            keys = self._tables.setdefault(table, set())
+            keys.add(key)
+            if len(keys) > results.size:
+                # Forget the keys evicted in the meantime
+                self._tables[table] = {k for k in keys if k in results}
+
+    async def invalidate(self, tables):
+        "Forget all the results that depend on any of the given `tables` names."
+
+        for table in tables:
+            for key in self._tables.pop(table, ()):
+                self._results.pop(key)
+
+    async def clear(self):
+        "Forget all the results."
+
+        self._results.clear()
+        self._tables.clear()
+
+
+class ResultCache:
+    """A cache of query results.
+
+    :param backend: the storage of the results, by default a
+                    :class:`MemoryBackend`
+    :param ttl: the number of seconds after which a result expires
+
+    Each result is associated with the names of the tables it depends on, so
+    that it can be explicitly invalidated when any of them changes.
+
+    Concurrent requests of the same missing result share the same execution:
+    only the first one actually computes it, the others wait for its
+    outcome. Beside the `hits` and the `misses`, the instance keeps track of
+    the number of these `coalesced` requests.
+    """
+
+    __slots__ = ('backend', 'ttl', 'hits', 'misses', '_coalescer', '_generation')
+
+    def __init__(self, backend=None, ttl=60):
+        self.backend = MemoryBackend() if backend is None else backend
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._coalescer = Coalescer()
+        self._generation = 0
+
+    @property
+    def coalesced(self):
+        "The number of requests that waited for the outcome of an identical one."
+
+        return self._coalescer.coalesced
+
+    async def fetch(self, key, tables, compute):
+        r"""Return the result associated with `key`, computing it if needed.
+
+        :param key: a string
+        :param tables: a sequence of table names, or SQLAlchemy ``Table``\ s
+        :param compute: a function returning an awaitable that computes the
+                        result
+        :return: the possibly cached result
+
+        A ``None`` result is never cached.
+        """
+
+        result = await self.backend.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        return await self._coalescer.run(key, lambda: self._compute(key, tables, compute))
+
+    async def _compute(self, key, tables, compute):
+        self.misses += 1
+        generation = self._generation
+        result = await compute()
+        # Do not store a result that may have been invalidated meanwhile
+        if result is not None and generation == self._generation:
+            await self.backend.set(key, result, self.ttl,
+                                   [_table_name(t) for t in tables])
+        return result
+
+    async def invalidate(self, *tables):
+        r"""Forget the results depending on any of the given `tables`.
+
+        :param tables: table names or SQLAlchemy ``Table``\ s
+        """
+
+        self._generation += 1
+        await self.backend.invalidate([_table_name(t) for t in tables])
+
+    async def clear(self):
+        "Forget all the results, resetting the counters too."
+
+        self._generation += 1
+        self.hits = self.misses = 0
+        self._coalescer.calls = self._coalescer.coalesced = 0
+        await self.backend.clear()
+
+    def stats(self):
+        "Return a dictionary with the current counters."
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+        }
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Execution statistics
+# :Created:   sab 17 ott 2026 14:05:52 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+from bisect import bisect_left
+
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+"""Upper bounds, in seconds, of the latency histogram buckets: an additional
+bucket collects the executions slower than the last bound.
+"""
+
+
+class StatementStatistics:
+    "Execution statistics of a single SQL statement."
+
+    __slots__ = ('calls', 'errors', 'rows', 'total_time', 'min_time', 'max_time',
+                 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_time = 0.0
+        self.min_time = None
+        self.max_time = None
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    @property
+    def mean_time(self):
+        "The average execution time."
+
+        return self.total_time / self.calls if self.calls else None
+
+    def merge(self, other):
+        "Accumulate `other` statistics into this instance."
+
+        self.calls += other.calls
+        self.errors += other.errors
+        self.rows += other.rows
+        self.total_time += other.total_time
+        if other.min_time is not None:
+            if self.min_time is None or other.min_time < self.min_time:
+                self.min_time = other.min_time
+            if self.max_time is None or other.max_time > self.max_time:
+                self.max_time = other.max_time
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def as_dict(self):
+        "Return a plain dictionary with the statistics."
+
+        histogram = {bound: count
+                     for bound, count in zip(LATENCY_BUCKETS, self.histogram)}
+        histogram[float('inf')] = self.histogram[-1]
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'rows': self.rows,
+            'total_time': self.total_time,
+            'min_time': self.min_time,
+            'max_time': self.max_time,
+            'mean_time': self.mean_time,
+            'histogram': histogram,
+        }
+
+
+class StatisticsRegistry:
+    """In-process registry of per-statement execution statistics.
+
+    :param max_statements: the maximum number of distinct statements tracked
+
+    The statistics are keyed on the compiled SQL text: recording an execution
+    costs a dictionary lookup and a few arithmetic operations, while the
+    *normalization* of the SQL, that collapses whitespace differences, is
+    performed only by :meth:`snapshot`.
+
+    Executions of statements exceeding the `max_statements` limit are not
+    tracked, but simply counted in `dropped`.
+
+    The registry is disabled by default, set its `enabled` attribute to
+    ``True`` to activate it.
+    """
+
+    __slots__ = ('enabled', 'max_statements', 'dropped', '_statements')
+
+    def __init__(self, max_statements=1000):
+        self.enabled = False
+        self.max_statements = max_statements
+        self.dropped = 0
+        self._statements = {}
+
+    def record(self, sql, elapsed, rows=None, error=False):
+        """Record an execution of `sql`.
+
+        :param sql: the SQL statement
+        :param elapsed: the execution time, in seconds
+        :param rows: the number of returned or processed rows, if known
+        :param error: whether the execution failed
+        """
+
+        stats = self._statements.get(sql)
+        if stats is None:
+            if len(self._statements) >= self.max_statements:
+                self.dropped += 1
+                return
+            stats = self._statements[sql] = StatementStatistics()
+        stats.calls += 1
+        if error:
+            stats.errors += 1
+        if rows is not None:
+            stats.rows += rows
+        stats.total_time += elapsed
+        if stats.min_time is None or elapsed < stats.min_time:
+            stats.min_time = elapsed
+        if stats.max_time is None or elapsed > stats.max_time:
+            stats.max_time = elapsed
+        stats.histogram[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    def snapshot(self):
+        """Return the current statistics.
+
+        :return: a dictionary keyed on the normalized SQL statements, ordered
+                 by decreasing total execution time, where each value is a
+                 dictionary as returned by :meth:`StatementStatistics.as_dict`
+        """
+
+        merged = {}
+        for sql, stats in list(self._statements.items()):
+            key = ' '.join(sql.split())
+            total = merged.get(key)
+            if total is None:
+                total = merged[key] = StatementStatistics()
+            total.merge(stats)
+        return {sql: stats.as_dict()
+                for sql, stats in sorted(merged.items(),
+                                         key=lambda item: item[1].total_time,
+                                         reverse=True)}
+
+    def reset(self):
+        "Forget all the collected statistics."
+
+        self._statements = {}
+        self.dropped = 0
+
+
+statistics = StatisticsRegistry()
+"The global :class:`StatisticsRegistry` fed by the :mod:`.funcs` functions."
@@ -7,10 +7,16 @@
 #
 
 from collections.abc import Hashable
+from datetime import date, datetime, time
 from decimal import Decimal
+import re
+from threading import local
+from uuid import UUID
+from weakref import WeakKeyDictionary
 
 from asyncpg.types import Range
 from nssjson import JSONDecoder, JSONEncoder
+from sqlalchemy import Text, cast, func
 
 
 class Interval(Hashable):
@@ -51,6 +57,35 @@ class Interval(Hashable):
         return (self.months, self.days, self.microseconds)
 
 
+class RawJSON:
+    """An already encoded JSON document, spliced verbatim by :func:`json_encode`.
+
+    :param encoded: the UTF-8 encoded JSON text, either ``bytes``, a
+                    ``memoryview`` or a ``str``
+
+    Instances of this class are returned in place of the decoded values of
+    the ``json`` and ``jsonb`` columns when the `raw_json` option is enabled,
+    see :func:`~.funcs.fetchall()`, and they are accepted as values of those
+    columns too.
+    """
+
+    __slots__ = ('encoded',)
+
+    def __init__(self, encoded):
+        self.encoded = encoded
+
+    def __bytes__(self):
+        encoded = self.encoded
+        return encoded.encode('utf-8') if isinstance(encoded, str) else bytes(encoded)
+
+    def __str__(self):
+        encoded = self.encoded
+        return encoded if isinstance(encoded, str) else str(encoded, 'utf-8')
+
+    def __repr__(self):
+        return 'RawJSON(%r)' % str(self)
+
+
 def _daterange_serializer(obj):
     "nssjson serializer of PG DateRange."
 
@@ -70,13 +105,93 @@ def _daterange_serializer(obj):
     raise TypeError('Unable to serialize %r instance' % type(obj))
 
 
-json_encode = JSONEncoder(separators=(',', ':'),
-                          use_decimal=True,
-                          iso_datetime=True,
-                          utc_datetime=True,
-                          handle_uuid=True,
-                          default=_daterange_serializer).encode
-"Custom JSON encoder that knows about PG `daterange`."
+def _json_encoder(default):
+    return JSONEncoder(separators=(',', ':'),
+                       use_decimal=True,
+                       iso_datetime=True,
+                       utc_datetime=True,
+                       handle_uuid=True,
+                       default=default).encode
+
+
+_RAW_JSON_MARKER = re.compile(r'"\\u0000RawJSON([0-9a-f]+):(\d+)"')
+
+_RAW_JSON_MARKER_BYTES = re.compile(_RAW_JSON_MARKER.pattern.encode('ascii'))
+
+
+class _RawJSONSplicer:
+    """Replace each :class:`RawJSON` met by an encoder with a marker string, to
+    splice its content in place of the marker in the encoded outcome.
+    """
+
+    __slots__ = ('raws', 'token')
+
+    def __init__(self):
+        self.raws = []
+        self.token = '%x' % id(self)
+
+    def marker(self, obj):
+        raws = self.raws
+        raws.append(obj)
+        return '\x00RawJSON%s:%d' % (self.token, len(raws) - 1)
+
+    def splice(self, encoded):
+        "Replace the markers in the `encoded` string with the raw documents."
+
+        if not self.raws:
+            return encoded
+
+        def replace(match):
+            if match.group(1) != self.token:
+                return match.group(0)
+            return str(self.raws[int(match.group(2))])
+
+        return _RAW_JSON_MARKER.sub(replace, encoded)
+
+    def splice_bytes(self, encoded):
+        "Replace the markers in the `encoded` bytes with the raw documents."
+
+        if not self.raws:
+            return encoded
+
+        token = self.token.encode('ascii')
+
+        def replace(match):
+            if match.group(1) != token:
+                return match.group(0)
+            return bytes(self.raws[int(match.group(2))])
+
+        return _RAW_JSON_MARKER_BYTES.sub(replace, encoded)
+
+
+_splicers = local()
+"Carry the :class:`_RawJSONSplicer` of the encoding in progress in each thread."
+
+
+def _raw_json_marker(obj):
+    return _splicers.current.marker(obj)
+
+
+def _shared_serializer(obj):
+    if isinstance(obj, RawJSON):
+        return _raw_json_marker(obj)
+    return _daterange_serializer(obj)
+
+
+_encode = _json_encoder(_shared_serializer)
+
+
+def json_encode(value):
+    """Custom JSON encoder that knows about PG `daterange`.
+
+    :class:`RawJSON` values are inserted as is, without being decoded.
+    """
+
+    if isinstance(value, RawJSON):
+        return str(value)
+    splicer = _splicers.current = _RawJSONSplicer()
+    return splicer.splice(_encode(value))
+
 
 json_decode = JSONDecoder(parse_float=Decimal,
                           iso_datetime=True,
@@ -84,34 +199,254 @@ json_decode = JSONDecoder(parse_float=Decimal,
 "Custom JSON decoder that knows about PG `daterange`."
 
 
-def _json_encode(value):
-    return json_encode(value).encode('utf-8')
+def _json_default(obj):
+    "Serializer of the types unknown to the JSON backends other than nssjson."
+
+    if isinstance(obj, RawJSON):
+        return _raw_json_marker(obj)
+    elif isinstance(obj, Range):
+        return _daterange_serializer(obj)
+    elif isinstance(obj, Decimal):
+        return float(obj)
+    elif isinstance(obj, (date, datetime, time)):
+        return obj.isoformat()
+    elif isinstance(obj, UUID):
+        return str(obj)
+
+    raise TypeError('Unable to serialize %r instance' % type(obj))
+
+
+def _nssjson_backend():
+    def dumps(value):
+        return json_encode(value).encode('utf-8')
+
+    def loads(data):
+        return json_decode(str(data, 'utf-8'))
+
+    return dumps, loads
+
+
+def _orjson_backend():
+    from orjson import dumps, loads
+
+    def encode(value):
+        splicer = _splicers.current = _RawJSONSplicer()
+        return splicer.splice_bytes(dumps(value, default=_json_default))
 
+    return encode, loads
 
-def _jsonb_encode(value):
-    return b'\x01' + json_encode(value).encode('utf-8')
 
+def _ujson_backend():
+    from ujson import dumps, loads
 
-def _json_decode(value):
-    return json_decode(value.decode('utf-8'))
+    def encode(value):
+        splicer = _splicers.current = _RawJSONSplicer()
+        return splicer.splice(
+            dumps(value, ensure_ascii=False, default=_json_default)).encode('utf-8')
 
+    def decode(data):
+        # ujson 6 does not accept arbitrary buffers anymore
+        return loads(str(data, 'utf-8'))
 
-def _jsonb_decode(value):
-    return json_decode(value[1:].decode('utf-8'))
+    return encode, decode
 
 
-async def register_custom_codecs(con):
-    """Register our custom codecs on the asyncpg connection `con`.
+def _json_backend():
+    from json import JSONEncoder, loads
+
+    dumps = JSONEncoder(ensure_ascii=False, separators=(',', ':'),
+                        default=_json_default).encode
+
+    def encode(value):
+        splicer = _splicers.current = _RawJSONSplicer()
+        return splicer.splice(dumps(value)).encode('utf-8')
+
+    def decode(data):
+        return loads(str(data, 'utf-8'))
+
+    return encode, decode
+
+
+JSON_BACKENDS = {
+    'nssjson': _nssjson_backend,
+    'orjson': _orjson_backend,
+    'ujson': _ujson_backend,
+    'json': _json_backend,
+}
+"""The available JSON backends, each mapped to a function that returns the
+couple of functions that serialize a value to ``bytes`` and load it back from
+a ``memoryview``. All of them insert the :class:`RawJSON` values verbatim."""
+
+
+def json_codecs(backend='nssjson', raw=False):
+    """Build the codecs of the PostgreSQL ``json`` and ``jsonb`` types.
+
+    :param backend: the name of one of the :data:`JSON_BACKENDS`
+    :param raw: whether the decoders shall return :class:`RawJSON`
+                instances
+    :return: a tuple of four functions, the encoder and the decoder of the
+             ``json`` type and the same of the ``jsonb`` type
+    """
+
+    try:
+        dumps, loads = JSON_BACKENDS[backend]()
+    except KeyError:
+        raise ValueError('Unknown JSON backend: %r' % backend) from None
+
+    if raw:
+        def json_decode(data):
+            return RawJSON(data)
+
+        def jsonb_decode(data):
+            # Skip the format version byte
+            return RawJSON(memoryview(data)[1:])
+
+        def json_encode(value):
+            if isinstance(value, str):
+                return value.encode('utf-8')
+            elif isinstance(value, (bytes, RawJSON)):
+                return bytes(value)
+            return dumps(value)
+    else:
+        def json_decode(data):
+            return loads(data)
+
+        def jsonb_decode(data):
+            return loads(memoryview(data)[1:])
+
+        def json_encode(value):
+            if isinstance(value, RawJSON):
+                return bytes(value)
+            return dumps(value)
+
+    def jsonb_encode(value):
+        return b'\x01' + json_encode(value)
+
+    return json_encode, json_decode, jsonb_encode, jsonb_decode
+
+
+_json_encode, _json_decode, _jsonb_encode, _jsonb_decode = json_codecs()
+
+
+class _CodecsState:
+    "The mutable state of the codecs registered on a connection."
+
+    __slots__ = ('raw_json',)
+
+    def __init__(self, raw_json):
+        self.raw_json = raw_json
+
+
+_codecs_states = WeakKeyDictionary()
+"The state of the codecs of each asyncpg connection, see register_custom_codecs()."
+
+
+def _unwrap(con):
+    "Return the asyncpg connection possibly wrapped by `con`."
+
+    # Our _PreparingConnection
+    con = getattr(con, 'apgc', con)
+    # asyncpg's PoolConnectionProxy
+    return getattr(con, '_con', con)
+
+
+class _RawJSONDecoding:
+    """Context manager that temporarily enables the :class:`RawJSON` decoding
+    of the ``json`` and ``jsonb`` values fetched by `con`.
+
+    :param con: an asyncpg connection, where :func:`register_custom_codecs`
+                has been applied
+
+    asyncpg executes one statement at a time on each connection, so the
+    switch affects only the statement executed within the block.
+    """
+
+    __slots__ = ('state', 'previous')
+
+    def __init__(self, con):
+        try:
+            self.state = _codecs_states[_unwrap(con)]
+        except (KeyError, TypeError):
+            raise RuntimeError('The custom codecs are not registered on %r'
+                               % con) from None
+
+    def __enter__(self):
+        state = self.state
+        self.previous = state.raw_json
+        state.raw_json = True
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.state.raw_json = self.previous
+
+
+def raw_json(column):
+    """Fetch the value of a ``json`` or ``jsonb`` `column` without decoding it.
+
+    :param column: a SQLAlchemy column or expression
+    :return: an expression, labelled as the `column`, that PostgreSQL
+             converts to the UTF-8 ``bytea`` of the JSON text
+
+    This can be used to pass thru a document from the database to an HTTP
+    response, without the cost of decoding and encoding it again.
+
+    .. note:: The value is fetched as plain ``bytes``, that
+              :func:`json_encode` cannot serialize: to embed it in a larger
+              document wrap it in a :class:`RawJSON`, or rather use the
+              `raw_json` argument of :func:`~.funcs.fetchall()` and the
+              like, that returns :class:`RawJSON` instances for all the
+              ``json`` and ``jsonb`` columns of the statement.
+    """
+
+    return func.convert_to(cast(column, Text), 'UTF8').label(column.name)
+
+
+async def register_custom_codecs(con, json_backend='nssjson', always_raw_json=False):
+    r"""Register our custom codecs on the asyncpg connection `con`.
+
+    :param con: an asyncpg connection
+    :param json_backend: the name of one of the :data:`JSON_BACKENDS`
+    :param always_raw_json: when true, the values of ``json`` and ``jsonb``
+                            are always returned as :class:`RawJSON`
+                            instances, and strings and bytes are passed as
+                            is, as they were already encoded
 
     This function should be passed as the ``init`` argument to
-    :func:`asyncpg.create_pool()`.
+    :func:`asyncpg.create_pool()`, possibly thru :func:`functools.partial`
+    to specify the other arguments.
+
+    The default ``nssjson`` backend has the greatest fidelity, as it loads
+    numbers as :class:`~decimal.Decimal`\ s and revives ISO dates,
+    timestamps and UUIDs. The others are faster but load plain numbers and
+    strings, and dump :class:`~decimal.Decimal`\ s as floats: ``orjson`` and
+    ``ujson`` are optional dependencies, while ``json`` is the one in the
+    standard library.
+
+    When only *some* statements shall return the values undecoded, see the
+    `raw_json` argument of :func:`~.funcs.fetchall()` and the like, or
+    :func:`raw_json` for single columns.
     """
 
+    json_encoder, json_decode, jsonb_encoder, jsonb_decode = json_codecs(
+        json_backend, always_raw_json)
+    state = _codecs_states[_unwrap(con)] = _CodecsState(always_raw_json)
+    if always_raw_json:
+        json_decoder = json_decode
+        jsonb_decoder = jsonb_decode
+    else:
+        _, raw_json_decode, _, raw_jsonb_decode = json_codecs(json_backend, True)
+
+        def json_decoder(data):
+            return raw_json_decode(data) if state.raw_json else json_decode(data)
+
+        def jsonb_decoder(data):
+            return raw_jsonb_decode(data) if state.raw_json else jsonb_decode(data)
+
     await con.set_builtin_type_codec('hstore', codec_name='pg_contrib.hstore')
     await con.set_type_codec('json', schema='pg_catalog', format='binary',
-                             encoder=_json_encode, decoder=_json_decode)
+                             encoder=json_encoder, decoder=json_decoder)
     await con.set_type_codec('jsonb', schema='pg_catalog', format='binary',
-                             encoder=_jsonb_encode, decoder=_jsonb_decode)
+                             encoder=jsonb_encoder, decoder=jsonb_decoder)
     await con.set_type_codec('interval', schema='pg_catalog', format='tuple',
                              encoder=lambda i: i._encode(),
                              decoder=Interval._decode)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Tests for the LRU cache
+# :Created:   sab 17 ott 2026 17:12:38 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+import pytest
+
+from metapensiero.sqlalchemy.asyncpg import cache
+
+
+# All test coroutines will be treated as marked
+pytestmark = pytest.mark.asyncio
+
+
+async def test_cache_ttl(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(cache, 'monotonic', lambda: now)
+
+    lru = cache.LRUCache(10, ttl=5)
+    lru.set('a', 1)
+    assert lru.get('a') == 1
+    now += 10
+    assert lru.get('a') is None
+    assert 'a' not in lru
+    assert lru.misses == 1
+
+    lru.ttl = None
+    lru.set('b', 2)
+    now += 10
+    assert lru.get('b') == 2
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Columnar results tests
+# :Created:   sab 17 ott 2026 12:34:18 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+from array import array
+from datetime import date
+import sys
+
+import pytest
+import sqlalchemy as sa
+
+
+# All test coroutines will be treated as marked
+pytestmark = pytest.mark.asyncio
+
+
+def since_column(users):
+    return sa.cast(sa.case([(users.c.name == 'admin', sa.null())],
+                           else_=sa.func.lower(users.c.validity)),
+                   sa.Date).label('since')
+
+
+async def test_fetch_columns(connection, users):
+    numpy = pytest.importorskip('numpy')
+
+    q = (sa.select([users.c.id, users.c.name, users.c.max_renew,
+                    sa.func.lower(users.c.validity).label('since')])
+         .order_by(users.c.id))
+    result = await connection.fetch_columns(q, batch_size=3)
+    assert set(result) == {'id', 'name', 'max_renew', 'since'}
+    assert result['id'].dtype == numpy.int64
+    assert not isinstance(result['id'], numpy.ma.MaskedArray)
+    assert list(result['name']) == ['admin', 'secretary', 'ceo', 'inter']
+    assert isinstance(result['max_renew'], numpy.ma.MaskedArray)
+    assert result['max_renew'].mask.tolist() == [True, False, True, False]
+
+    q = sa.select([users.c.id, since_column(users)])
+    result = await connection.fetch_columns(q.order_by(users.c.id))
+    since = result['since']
+    assert since.dtype == numpy.dtype('datetime64[D]')
+    assert since.mask.tolist() == [True, False, False, False]
+    assert since[1] == numpy.datetime64('2017-11-30')
+
+    result = await connection.fetch_columns(q.where(users.c.id < 0))
+    assert len(result['id']) == 0
+
+
+async def test_fetch_columns_without_numpy(connection, users, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+
+    q = (sa.select([users.c.id,
+                    since_column(users),
+                    sa.cast(users.c.id, sa.Float).label('fid')])
+         .order_by(users.c.id))
+    result = await connection.fetch_columns(q)
+    assert isinstance(result['id'], array)
+    assert isinstance(result['fid'], array)
+    assert result['since'][0] is None
+    assert result['since'][1] == date(2017, 11, 30)
@@ -11,7 +11,7 @@ from datetime import datetime
 import pytest
 import sqlalchemy as sa
 
-from metapensiero.sqlalchemy.asyncpg import compile
+from metapensiero.sqlalchemy.asyncpg import cache_compilation, compile
 
 
 # All test coroutines will be treated as marked
@@ -147,3 +147,185 @@ async def test_compile_unknown_type():
     sql, args = compile(query, named_args={'bar': 1})
     assert sql.replace('\n', '') == 'SELECT foo($1) AS foo_1'
     assert args[0] == 1
+
+
+async def test_compile_cache():
+    from metapensiero.sqlalchemy.asyncpg.funcs import compiled_cache
+
+    compiled_cache.clear()
+    query = cache_compilation(sa.select([table.c.id])
+                              .where(table.c.name == sa.sql.bindparam('some_name')))
+    sql1, args1 = compile(query, named_args={'some_name': 'lele'})
+    sql2, args2 = compile(query, named_args={'some_name': 'rosy'})
+    assert sql1 == sql2
+    assert args1 == ('lele',)
+    assert args2 == ('rosy',)
+    assert compiled_cache.misses == 1
+    assert compiled_cache.hits == 1
+
+
+async def test_compile_cache_defaults():
+    from metapensiero.sqlalchemy.asyncpg.funcs import compiled_cache
+
+    compiled_cache.clear()
+    query = cache_compilation(table.update().where(table.c.id == 1).values(name='lele'))
+    sql, args1 = compile(query)
+    sql, args2 = compile(query)
+    assert compiled_cache.hits == 1
+    assert args1[0] == args2[0] == 'lele'
+    assert isinstance(args2[1], datetime)
+    assert args1[1] is not args2[1]
+
+
+async def test_compile_cache_size():
+    from metapensiero.sqlalchemy.asyncpg.funcs import compiled_cache
+
+    compiled_cache.clear()
+    size = compiled_cache.size
+    compiled_cache.size = 2
+    try:
+        queries = [cache_compilation(sa.select([table.c.id]).where(table.c.id == i))
+                   for i in range(3)]
+        for i, query in enumerate(queries):
+            sql, args = compile(query)
+            assert args == (i,)
+        assert len(compiled_cache) == 2
+        assert compiled_cache.evictions == 1
+        compiled_cache.size = 0
+        assert len(compiled_cache) == 0
+        compile(queries[0])
+        assert len(compiled_cache) == 0
+    finally:
+        compiled_cache.size = size
+
+
+async def test_compile_cache_opt_in():
+    from metapensiero.sqlalchemy.asyncpg.funcs import compiled_cache
+
+    compiled_cache.clear()
+    query = sa.select([table.c.id])
+    compile(query)
+    query.append_whereclause(table.c.id == 1)
+    sql, args = compile(query)
+    assert args == (1,)
+    assert len(compiled_cache) == 0
+
+    cached = cache_compilation(query)
+    compile(cached)
+    derived = cached.where(table.c.name == 'lele')
+    sql, args = compile(derived)
+    assert args == (1, 'lele')
+    assert len(compiled_cache) == 1
+
+
+async def test_executemany_defaults():
+    from metapensiero.sqlalchemy.asyncpg import executemany
+
+    class FakeConnection:
+        _top_xact = None
+
+        async def executemany(self, sql, args):
+            self.sql = sql
+            self.args = args
+
+    conn = FakeConnection()
+    await executemany(conn, table.insert(), [dict(id=1, name='lele'),
+                                             dict(id=2, name='rosy', gender='F')])
+    assert conn.sql.replace('\n', '') == (
+        "INSERT INTO test (id, name, gender)"
+        " VALUES ($1::INTEGER, $2::VARCHAR, $3::VARCHAR)")
+    assert conn.args == [(1, 'lele', 'M'), (2, 'rosy', 'F')]
+
+
+async def test_copy_records_defaults():
+    from metapensiero.sqlalchemy.asyncpg import copy_records
+
+    class FakeConnection:
+        _top_xact = None
+
+        async def copy_records_to_table(self, table_name, records, columns,
+                                        schema_name):
+            self.table_name = table_name
+            self.columns = columns
+            self.records = list(records)
+            return 'COPY %d' % len(self.records)
+
+    conn = FakeConnection()
+    result = await copy_records(conn, table, [dict(id=1, name='lele'),
+                                              (2, 'rosy', 'F')])
+    assert result == 'COPY 2'
+    assert conn.table_name == 'test'
+    assert conn.columns == ['id', 'name', 'gender', 'updated']
+    assert conn.records == [[1, 'lele', 'M', None], [2, 'rosy', 'F', None]]
+
+    result = await copy_records(conn, table, [dict(name='lele')], columns=['name'])
+    assert conn.columns == ['name', 'gender']
+    assert conn.records == [['lele', 'M']]
+
+
+async def test_compile_expanding_in():
+    query = sa.select([table.c.id]) \
+              .where(table.c.id.in_(sa.bindparam('ids', expanding=True)))
+    sql, args = compile(query, named_args={'ids': [1, 2, 3]})
+    assert sql.replace('\n', '') == \
+        "SELECT test.id FROM test WHERE test.id = ANY ($1::INTEGER[])"
+    assert args == ([1, 2, 3],)
+
+    query = sa.select([table.c.id]) \
+              .where(table.c.name.notin_(sa.bindparam('names', expanding=True)))
+    sql, args = compile(query, named_args={'names': ['a', 'b']})
+    assert sql.replace('\n', '') == \
+        "SELECT test.id FROM test WHERE test.name <> ALL ($1::VARCHAR[])"
+    assert args == (['a', 'b'],)
+
+
+async def test_compile_in_as_any(monkeypatch):
+    from metapensiero.sqlalchemy.asyncpg.dialect import PGDialect_asyncpg
+
+    query = sa.select([table.c.id]).where(table.c.id.in_([1, 2]))
+    sql, args = compile(query)
+    assert sql.replace('\n', '') == \
+        "SELECT test.id FROM test WHERE test.id IN ($1::INTEGER, $2::INTEGER)"
+
+    monkeypatch.setattr(PGDialect_asyncpg, 'in_as_any', True)
+
+    for count in (2, 1000):
+        query = sa.select([table.c.id]) \
+                  .where(table.c.id.in_(list(range(count)))) \
+                  .where(table.c.name.notin_(['a', 'b']))
+        sql, args = compile(query)
+        assert sql.replace('\n', '') == \
+            "SELECT test.id FROM test WHERE test.id = ANY ($1::INTEGER[])" \
+            " AND test.name <> ALL ($2::VARCHAR[])"
+        assert args == (list(range(count)), ['a', 'b'])
+
+    # Lists containing expressions are not affected
+    query = sa.select([table.c.id]).where(table.c.id.in_([1, table.c.id + 1]))
+    sql, args = compile(query)
+    assert sql.replace('\n', '') == \
+        "SELECT test.id FROM test WHERE test.id IN ($1::INTEGER, test.id + $2::INTEGER)"
+    assert args == (1, 1)
+
+
+@pytest.mark.parametrize('count', [10, 100, 1000, 2000])
+async def test_compile_many_params(count, monkeypatch):
+    from metapensiero.sqlalchemy.asyncpg.funcs import _dialect
+
+    render_type = _dialect.type_compiler.process
+    rendered = []
+
+    def process(type, **kw):
+        rendered.append(type)
+        return render_type(type, **kw)
+
+    monkeypatch.setattr(_dialect.type_compiler, 'process', process)
+
+    values = list(range(count))
+    query = sa.select([table.c.id]).where(table.c.id.in_(values))
+    sql, args = compile(query)
+
+    assert args == tuple(values)
+    assert sql.count('::INTEGER') == count
+    assert sql.rstrip().endswith('$%d::INTEGER)' % count)
+    # The cast of the shared type is rendered just once
+    assert len(rendered) == 1
@@ -6,6 +6,8 @@
 # :Copyright: © 2017 Lele Gaifax
 #
 
+import asyncio
+
 import pytest
 import sqlalchemy as sa
 
@@ -46,3 +48,290 @@ async def test_prepare(connection, users):
     q = sa.select([users.c.id]).where(users.c.name == 'admin')
     stmt = await connection.prepare(q)
     assert stmt.get_parameters()[0].name == 'varchar'
+
+
+async def test_prepared_statements(pool, users):
+    from metapensiero.sqlalchemy.asyncpg import Connection
+
+    q = sa.select([users.c.id]).where(users.c.name == sa.bindparam('name'))
+    async with pool.acquire() as apgc:
+        connection = Connection(apgc, prepared_statements_cache_size=2)
+        cache = connection.prepared_statements
+        assert await connection.scalar(q, named_args={'name': 'admin'})
+        assert await connection.fetchone(q, named_args={'name': 'ceo'})
+        assert len(await connection.fetchall(q, named_args={'name': 'foo'})) == 0
+        assert cache.misses == 1
+        assert cache.hits == 2
+
+        tx = connection.transaction()
+        await tx.start()
+        try:
+            i = users.insert().values(name='foo', password='bar')
+            assert await connection.execute(i) == 'INSERT 0 1'
+            u = users.update().where(users.c.name == 'foo').values(password='baz')
+            assert await connection.execute(u) == 'UPDATE 1'
+            assert cache.evictions == 1
+        finally:
+            await tx.rollback()
+
+
+async def test_prepared_statements_invalidation(pool):
+    from metapensiero.sqlalchemy.asyncpg import Connection
+
+    async with pool.acquire() as apgc:
+        connection = Connection(apgc, prepared_statements_cache_size=10)
+        await connection.execute('CREATE TEMPORARY TABLE psi (a integer)')
+        try:
+            await connection.execute('INSERT INTO psi VALUES ($1)', (1,))
+            q = 'SELECT * FROM psi WHERE a = $1'
+            assert (await connection.fetchone(q, (1,)))['a'] == 1
+            await connection.execute('ALTER TABLE psi ADD COLUMN b integer')
+            assert (await connection.fetchone(q, (1,)))['b'] is None
+            assert connection.prepared_statements.invalidations == 1
+        finally:
+            await connection.execute('DROP TABLE psi')
+
+
+async def test_no_prepared_statements(connection):
+    assert connection.prepared_statements is None
+
+
+async def test_executemany(connection, users):
+    i = users.insert()
+    tx = connection.transaction()
+    await tx.start()
+    try:
+        await connection.executemany(i, [dict(name='foo%d' % n, password='bar')
+                                         for n in range(10)])
+        q = sa.select([sa.func.count()]).where(users.c.name.like('foo%'))
+        assert await connection.scalar(q) == 10
+
+        u = (users.update()
+             .where(users.c.name == sa.bindparam('oldname'))
+             .values(password=sa.bindparam('newpassword')))
+        await connection.executemany(u, [dict(oldname='foo%d' % n, newpassword='baz')
+                                         for n in range(5)])
+        q = sa.select([sa.func.count()]).where(users.c.password == 'baz')
+        assert await connection.scalar(q) == 5
+
+        await connection.executemany('DELETE FROM users WHERE name = $1',
+                                     [('foo%d' % n,) for n in range(5)])
+        q = sa.select([sa.func.count()]).where(users.c.name.like('foo%'))
+        assert await connection.scalar(q) == 5
+
+        await connection.executemany(i, [])
+    finally:
+        await tx.rollback()
+
+
+async def test_copy_records(connection, users):
+    tx = connection.transaction()
+    await tx.start()
+    try:
+        result = await connection.copy_records(
+            users, [dict(name='foo%d' % n, password='bar') for n in range(10)])
+        assert result == 'COPY 10'
+
+        async def records():
+            for n in range(5):
+                yield ('bar%d' % n, 'foo')
+
+        result = await connection.copy_records(users, records(),
+                                               columns=('name', users.c.password))
+        assert result == 'COPY 5'
+
+        q = sa.select([sa.func.count()]).where(users.c.name.like('foo%'))
+        assert await connection.scalar(q) == 10
+        q = sa.select([sa.func.count()]).where(users.c.password == 'foo')
+        assert await connection.scalar(q) == 5
+    finally:
+        await tx.rollback()
+
+
+async def test_iterate(connection, users):
+    q = sa.select([users.c.id]).order_by(users.c.id)
+    ids = [r['id'] async for r in connection.iterate(q, prefetch=2)]
+    assert len(ids) == 4
+    assert ids == sorted(ids)
+    assert not connection.apgc.is_in_transaction()
+
+    async with connection.transaction():
+        ids = [r['id'] async for r in connection.iterate(q)]
+        assert len(ids) == 4
+        assert connection.apgc.is_in_transaction()
+
+    rows = connection.iterate(q)
+    async for row in rows:
+        break
+    await rows.aclose()
+    assert not connection.apgc.is_in_transaction()
+
+
+async def test_fetch_batches(connection, users):
+    q = sa.select([users.c.id, users.c.name]).order_by(users.c.id)
+    batches = [b async for b in connection.fetch_batches(q, batch_size=3)]
+    assert [len(b) for b in batches] == [3, 1]
+    assert not connection.apgc.is_in_transaction()
+
+
+async def test_fetch_batches_keyset(connection, users):
+    q = sa.select([users.c.id, users.c.name]).where(users.c.name != sa.bindparam('name'))
+    batches = [b async for b in connection.fetch_batches(q, named_args={'name': 'ceo'},
+                                                         batch_size=2,
+                                                         keyset=[users.c.name])]
+    assert [len(b) for b in batches] == [2, 1]
+    assert [r['name'] for b in batches for r in b] == ['admin', 'inter', 'secretary']
+
+    batches = [b async for b in connection.fetch_batches(q, named_args={'name': 'ceo'},
+                                                         batch_size=3,
+                                                         keyset=[users.c.name])]
+    assert [len(b) for b in batches] == [3]
+
+
+async def test_fetch_batches_keyset_labels(connection, users):
+    q = sa.select([users.c.name.label('username'), users.c.id])
+    batches = [b async for b in connection.fetch_batches(q, batch_size=3,
+                                                         keyset=[users.c.name])]
+    assert [[r['username'] for r in b] for b in batches] == [
+        ['admin', 'ceo', 'inter'], ['secretary']]
+
+    q = sa.select([users.c.name, users.c.id]).apply_labels()
+    batches = [b async for b in connection.fetch_batches(q, batch_size=3,
+                                                         keyset=[users.c.name])]
+    assert [len(b) for b in batches] == [3, 1]
+
+    # Two columns named "id": the keyset one is picked by position
+    q = sa.select([(-users.c.id).label('id'), users.c.id])
+    batches = [b async for b in connection.fetch_batches(q, batch_size=3,
+                                                         keyset=[users.c.id])]
+    assert [[r[1] for r in b] for b in batches] == [[1, 2, 3], [4]]
+
+    with pytest.raises(ValueError):
+        [b async for b in connection.fetch_batches(q, keyset=[users.c.name])]
+
+
+async def test_coalescer(pool, users):
+    from metapensiero.sqlalchemy.asyncpg import Connection, hooks
+    from metapensiero.sqlalchemy.asyncpg.coalescer import Coalescer
+
+    coalescer = Coalescer()
+    operations = []
+
+    def collect(context):
+        operations.append(context.operation)
+
+    q = sa.select([users.c.name, sa.func.pg_sleep(0.05)]).where(
+        users.c.id == sa.bindparam('id'))
+
+    async def read(id):
+        async with pool.acquire() as apgc:
+            connection = Connection(apgc, coalescer=coalescer)
+            return await connection.fetchall(q, named_args={'id': id})
+
+    hooks.register('before_execute', collect)
+    try:
+        results = await asyncio.gather(*[read(1) for i in range(4)])
+        assert all(r is results[0] for r in results)
+        assert results[0][0]['name'] == 'admin'
+        assert operations == ['fetchall']
+        assert coalescer.stats() == {'calls': 4, 'coalesced': 3, 'inflight': 0}
+
+        async with pool.acquire() as apgc:
+            connection = Connection(apgc, coalescer=coalescer)
+            async with connection.transaction():
+                assert await connection.scalar(sa.select([users.c.name]).where(
+                    users.c.id == 1)) == 'admin'
+        assert coalescer.calls == 4
+    finally:
+        hooks.clear()
+
+
+async def test_coalescer_cancelled_leader():
+    from metapensiero.sqlalchemy.asyncpg.coalescer import Coalescer
+
+    coalescer = Coalescer()
+    computations = []
+
+    async def compute():
+        computations.append(None)
+        await asyncio.sleep(0.05)
+        return len(computations)
+
+    leader = asyncio.ensure_future(coalescer.run('key', compute))
+    await asyncio.sleep(0)
+    followers = [asyncio.ensure_future(coalescer.run('key', compute)) for i in range(2)]
+    await asyncio.sleep(0.01)
+    leader.cancel()
+
+    # The followers are not affected, one of them computes the outcome again
+    assert await asyncio.gather(*followers) == [2, 2]
+    assert leader.cancelled()
+    assert coalescer.stats() == {'calls': 3, 'coalesced': 1, 'inflight': 0}
+
+
+async def test_batch(connection, users):
+    from metapensiero.sqlalchemy.asyncpg import hooks
+
+    operations = []
+
+    def collect(context):
+        operations.append(context.operation)
+
+    byid = sa.select([users.c.name, users.c.password]).where(
+        users.c.id == sa.bindparam('id'))
+    hooks.register('before_execute', collect)
+    try:
+        async with connection.batch() as batch:
+            admin = batch.fetchone(byid, named_args={'id': 1})
+            ceo = batch.scalar(sa.select([users.c.name]).where(
+                users.c.id == sa.bindparam('id')), named_args={'id': 3})
+            missing = batch.fetchone(byid, named_args={'id': 0})
+            names = batch.fetchall(sa.select([users.c.id, users.c.name])
+                                   .order_by(users.c.name.desc()))
+            none = batch.fetchall(sa.select([users.c.id]).where(users.c.id == 0))
+            assert not admin.done()
+        assert operations == ['fetchone']
+    finally:
+        hooks.clear()
+
+    assert await admin == {'name': 'admin', 'password': 'nimda'}
+    assert await ceo == 'ceo'
+    assert await missing is None
+    assert [r['name'] for r in await names] == ['secretary', 'inter', 'ceo', 'admin']
+    assert await none == []
+
+    # Only the placeholders are renumbered, not the literals looking alike
+    dollars = sa.select([sa.literal_column("'$1'").label('dollars'), users.c.name]) \
+                .where(users.c.id == sa.bindparam('id'))
+    async with connection.batch() as batch:
+        admin = batch.fetchone(byid, named_args={'id': 1})
+        ceo = batch.fetchone(dollars, named_args={'id': 3})
+    assert (await admin)['name'] == 'admin'
+    assert await ceo == {'dollars': '$1', 'name': 'ceo'}
+    assert '$2::INTEGER' in batch.compile()[0]
+
+    batch = connection.batch()
+    assert await batch.execute() == []
+    with pytest.raises(RuntimeError):
+        batch.scalar(sa.select([users.c.id]))
+
+
+async def test_batch_fallback(connection, users):
+    async with connection.batch() as batch:
+        count = batch.scalar(sa.select([sa.func.count()]).select_from(users))
+        # asyncpg cannot decode a range within an anonymous record
+        user = batch.fetchone(sa.select([users.c.name, users.c.validity])
+                              .where(users.c.id == 2))
+    assert await count == 4
+    assert (await user)['validity'].lower.year == 2017
+
+
+async def test_batch_errors(connection, users):
+    with pytest.raises(ValueError):
+        connection.batch().fetchall('SELECT 1')
+
+    with pytest.raises(ZeroDivisionError):
+        async with connection.batch() as batch:
+            count = batch.scalar(sa.select([sa.func.count()]).select_from(users))
+            1 / 0
+    assert count.cancelled()
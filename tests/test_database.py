@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Pool-aware interface tests
+# :Created:   sab 17 ott 2026 19:14:36 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+import pytest
+import sqlalchemy as sa
+
+from metapensiero.sqlalchemy.asyncpg import Database
+
+from conftest import EXTENDED_CONN_ARGS
+
+
+# All test coroutines will be treated as marked
+pytestmark = pytest.mark.asyncio
+
+
+async def test_statements(pool, users):
+    db = Database(pool)
+
+    q = sa.select([users.c.name]).where(users.c.id == sa.bindparam('id'))
+    assert await db.scalar(q, named_args={'id': 1}) == 'admin'
+    assert (await db.fetchone(q, named_args={'id': 2}))['name'] == 'secretary'
+    assert len(await db.fetchall(users.select())) == 4
+    assert await db.execute(users.update().values(password='nimda')
+                            .where(users.c.id == 0)) == 'UPDATE 0'
+
+    names = [r['name'] async for r in db.iterate(users.select().order_by(users.c.id))]
+    assert names == ['admin', 'secretary', 'ceo', 'inter']
+
+    records = db.cursor(users.select())
+    async for record in records:
+        break
+    await records.aclose()
+
+    batches = [len(b) async for b in db.fetch_batches(users.select(), batch_size=3)]
+    assert batches == [3, 1]
+
+    # All the connections went back to the pool
+    assert pool._queue.qsize() == pool._maxsize
+
+
+async def test_transaction(pool, users):
+    db = Database(pool)
+
+    with pytest.raises(RuntimeError):
+        async with db.transaction() as conn:
+            await conn.execute(users.delete().where(users.c.id == 1))
+            assert await conn.scalar(sa.select([sa.func.count()]).select_from(users)) == 3
+            raise RuntimeError('Rollback!')
+
+    assert await db.scalar(sa.select([sa.func.count()]).select_from(users)) == 4
+
+    async with db.transaction(isolation='serializable') as conn:
+        assert conn.apgc.is_in_transaction()
+
+
+async def test_create(pool):
+    db = await Database.create(database='sasyncpg_test', min_size=1, max_size=1,
+                               **EXTENDED_CONN_ARGS)
+    try:
+        # The custom codecs are registered on each connection
+        result = await db.scalar("SELECT '{\"a\": 1.5}'::jsonb")
+        assert str(result['a']) == '1.5'
+    finally:
+        await db.close()
+
+    db = await Database.create(database='sasyncpg_test', min_size=1, max_size=1,
+                               json_backend='json', **EXTENDED_CONN_ARGS)
+    try:
+        result = await db.scalar("SELECT '{\"a\": 1.5}'::jsonb")
+        assert result['a'] == 1.5
+    finally:
+        await db.close()
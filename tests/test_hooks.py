@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Instrumentation hooks tests
+# :Created:   sab 17 ott 2026 15:31:47 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+import asyncpg.exceptions
+import pytest
+import sqlalchemy as sa
+
+from metapensiero.sqlalchemy.asyncpg import hooks
+from metapensiero.sqlalchemy.asyncpg.hooks import Hooks
+
+
+# All test coroutines will be treated as marked
+pytestmark = pytest.mark.asyncio
+
+
+async def test_registry():
+    registry = Hooks()
+    assert not registry.active
+
+    def hook(context):
+        pass
+
+    registry.register('after_execute', hook)
+    assert registry.active
+    assert registry.after_execute == (hook,)
+
+    registry.unregister('after_execute', hook)
+    assert not registry.active
+
+    with pytest.raises(ValueError):
+        registry.register('before_commit', hook)
+
+
+async def test_hooks(connection, users):
+    events = []
+
+    def before(context):
+        context.extra['seen'] = True
+        events.append(('before', context.operation, context.sql))
+
+    def after(context):
+        assert context.extra['seen']
+        assert context.elapsed > 0
+        assert context.transaction_id
+        events.append(('after', context.operation, context.rows))
+
+    def error(context):
+        events.append(('error', context.operation, type(context.error)))
+
+    def broken(context):
+        raise RuntimeError('Ouch')
+
+    hooks.register('before_execute', before)
+    hooks.register('after_execute', after)
+    hooks.register('after_execute', broken)
+    hooks.register('on_error', error)
+    try:
+        q = sa.select([users.c.id]).where(users.c.name != sa.bindparam('name'))
+        result = await connection.fetchall(q, named_args={'name': 'admin'})
+        await connection.scalar(sa.select([sa.func.count(users.c.id)]))
+        with pytest.raises(asyncpg.exceptions.UndefinedTableError):
+            await connection.execute('SELECT * FROM nonexisting')
+        async for record in connection.iterate(q, named_args={'name': 'admin'}):
+            pass
+    finally:
+        hooks.clear()
+
+    assert events[0][:2] == ('before', 'fetchall')
+    assert events[1] == ('after', 'fetchall', len(result))
+    assert events[2][:2] == ('before', 'scalar')
+    assert events[3] == ('after', 'scalar', 1)
+    assert events[4] == ('before', 'execute', 'SELECT * FROM nonexisting')
+    assert events[5] == ('error', 'execute', asyncpg.exceptions.UndefinedTableError)
+    assert events[6][:2] == ('before', 'iterate')
+    assert events[7] == ('after', 'iterate', len(result))
+    assert len(events) == 8
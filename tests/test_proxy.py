@@ -85,3 +85,263 @@ async def test_filters(connection, users):
 
     assert len(result) == 1
     assert result[0]['name'] == 'secretary'
+
+
+async def test_window_count(connection, users):
+    from metapensiero.sqlalchemy.asyncpg import hooks
+
+    proxy = AsyncpgProxiedQuery(users.select(), count_strategy='window')
+
+    operations = []
+
+    def collect(context):
+        operations.append(context.operation)
+
+    hooks.register('before_execute', collect)
+    try:
+        result = await proxy(connection, result='rows', count='count', asdict=True,
+                             sorters=[dict(property="name")], limit=2)
+        assert operations == ['fetchall']
+        assert result['count'] == 4
+        assert [r['name'] for r in result['rows']] == ['admin', 'ceo']
+        assert '_total_count_' not in result['rows'][0]
+
+        del operations[:]
+        result = await proxy(connection, result='rows', count='count', asdict=True,
+                             start=10, limit=2)
+        assert operations == ['fetchall', 'scalar']
+        assert result['count'] == 4
+        assert result['rows'] == []
+
+        del operations[:]
+        result = await proxy(connection, result='rows', count='count', limit=2)
+        assert operations == ['scalar', 'fetchall']
+        assert result['count'] == 4
+    finally:
+        hooks.clear()
+
+
+async def test_window_count_fallback(connection, users):
+    proxy = AsyncpgProxiedQuery(users.select().distinct(), count_strategy='window')
+    assert not proxy.canCountWithWindow(proxy.query, True)
+
+    result = await proxy(connection, result='rows', count='count', asdict=True, limit=1)
+    assert result['count'] == 4
+    assert len(result['rows']) == 1
+
+    with pytest.raises(ValueError):
+        AsyncpgProxiedQuery(users.select(), count_strategy='magic')
+
+
+async def test_concurrent_count(pool, users):
+    from metapensiero.sqlalchemy.asyncpg import hooks
+
+    transactions = {}
+
+    def collect(context):
+        transactions[context.operation] = context.transaction_id
+
+    hooks.register('before_execute', collect)
+    try:
+        proxy = AsyncpgProxiedQuery(users.select())
+        result = await proxy(pool, result='rows', count='count', limit=2)
+        assert result['count'] == 4
+        assert len(result['rows']) == 2
+        assert set(transactions) == {'scalar', 'fetchall'}
+
+        transactions.clear()
+        proxy = AsyncpgProxiedQuery(users.select(), snapshot=True)
+        result = await proxy(pool, result='rows', count='count', asdict=True,
+                             sorters=[dict(property="name")], start=3)
+        assert result['count'] == 4
+        assert [r['name'] for r in result['rows']] == ['secretary']
+        assert set(transactions) == {'scalar', 'execute', 'fetchall'}
+        assert transactions['scalar'] != transactions['fetchall']
+
+        result = await proxy(pool, limit=1)
+        assert len(result) == 1
+    finally:
+        hooks.clear()
+
+
+async def test_snapshot_without_pool(connection, users):
+    proxy = AsyncpgProxiedQuery(users.select(), snapshot=True)
+    with pytest.raises(ValueError):
+        await proxy(connection, result='rows', count='count', limit=2)
+
+    result = await proxy(connection, limit=1)
+    assert len(result) == 1
+
+
+async def test_estimated_count(connection, users, monkeypatch):
+    from metapensiero.sqlalchemy.asyncpg import proxy as proxy_module
+
+    proxy = AsyncpgProxiedQuery(users.select(), count_policy='estimated')
+
+    result = await proxy(connection, result='rows', count='count', metadata='metadata')
+    assert result['count'] == 4
+    assert result['metadata']['estimated_count'] is False
+
+    monkeypatch.setattr(proxy_module, 'EXACT_COUNT_THRESHOLD', 0)
+    result = await proxy(connection, result='rows', count='count', metadata='metadata',
+                         filters=[dict(property="name", value="admin", operator="=")])
+    assert result['metadata']['estimated_count'] is True
+    assert isinstance(result['count'], int)
+    assert len(result['rows']) == 1
+
+
+async def test_estimated_count_raw_json(pool, users, monkeypatch):
+    from asyncpg import connect
+    from metapensiero.sqlalchemy.asyncpg import Connection, register_custom_codecs
+    from metapensiero.sqlalchemy.asyncpg import proxy as proxy_module
+
+    from conftest import EXTENDED_CONN_ARGS
+
+    monkeypatch.setattr(proxy_module, 'EXACT_COUNT_THRESHOLD', 0)
+    proxy = AsyncpgProxiedQuery(users.select(), count_policy='estimated')
+    apgc = await connect(database='sasyncpg_test', **EXTENDED_CONN_ARGS)
+    try:
+        await register_custom_codecs(apgc, always_raw_json=True)
+        result = await proxy(Connection(apgc), result=False, count='count',
+                             metadata='metadata')
+        assert result['metadata']['estimated_count'] is True
+        assert isinstance(result['count'], int)
+    finally:
+        await apgc.close()
+
+
+async def test_cached_count(connection, users):
+    from metapensiero.sqlalchemy.asyncpg.proxy import count_cache
+
+    count_cache.clear()
+    proxy = AsyncpgProxiedQuery(users.select(), count_policy='cached')
+
+    result = await proxy(connection, result=False, count='count')
+    assert result['count'] == 4
+    assert count_cache.misses == 1
+
+    result = await proxy(connection, result='rows', count='count', metadata='metadata',
+                         limit=1)
+    assert result['count'] == 4
+    assert result['metadata']['estimated_count'] is False
+    assert count_cache.hits == 1
+
+    result = await proxy(connection, result=False, count='count',
+                         filters=[dict(property="name", value="admin", operator="=")])
+    assert result['count'] == 1
+    assert count_cache.misses == 2
+    count_cache.clear()
+
+
+async def test_row_converter(connection, users):
+    import sqlalchemy as sa
+
+    proxy = AsyncpgProxiedQuery(sa.select([users.c.id, users.c.name]))
+
+    result = await proxy(connection, result='rows', keys='keys',
+                         sorters=[dict(property="name")])
+    assert result['keys'] == ['id', 'name']
+    assert [r[1] for r in result['rows']] == ['admin', 'ceo', 'inter', 'secretary']
+    assert isinstance(result['rows'][0], tuple)
+
+    result = await proxy(connection, asdict=True, sorters=[dict(property="name")])
+    assert result[0]['name'] == 'admin'
+    assert len(proxy._row_converters) == 2
+
+    proxy = AsyncpgProxiedQuery(sa.select([users.c.name, users.c.id.label('name')]),
+                                count_strategy='window')
+    result = await proxy(connection, asdict=True)
+    assert list(result[0]) == ['name']
+    assert isinstance(result[0]['name'], int)
+
+    result = await proxy(connection, result='rows', keys=True, count='count', limit=1)
+    assert result['keys'] == ['name']
+    assert result['count'] == 4
+    assert isinstance(result['rows'][0][0], int)
+
+
+async def test_keyset_pagination(connection, users):
+    import sqlalchemy as sa
+
+    proxy = AsyncpgProxiedQuery(sa.select([users.c.id, users.c.name]))
+
+    names = []
+    after = ''
+    while after is not None:
+        result = await proxy(connection, result='rows', asdict=True, after=after,
+                             sorters=[dict(property="name", direction="DESC")], limit=3)
+        names.extend(r['name'] for r in result['rows'])
+        assert all(set(r) == {'id', 'name'} for r in result['rows'])
+        after = result['next']
+    assert names == ['secretary', 'inter', 'ceo', 'admin']
+
+    result = await proxy(connection, result='rows', count='count', keys='keys', limit=2,
+                         after='', sorters=[dict(property="password")])
+    assert result['count'] == 4
+    assert result['keys'] == ['id', 'name']
+    assert [r[1] for r in result['rows']] == ['admin', 'inter']
+
+    result = await proxy(connection, result='rows', limit=2, after=result['next'],
+                         sorters=[dict(property="password"),
+                                  dict(property="id", direction="DESC")])
+    assert [r['name'] for r in result['rows']] == ['secretary', 'ceo']
+
+    with pytest.raises(ValueError):
+        await proxy(connection, limit=2, after='garbage')
+
+
+async def test_keyset_pagination_labels(connection, users):
+    import sqlalchemy as sa
+
+    async def pages(proxy, column, **args):
+        values = []
+        after = ''
+        while after is not None:
+            result = await proxy(connection, result='rows', after=after, limit=1, **args)
+            values.extend(r[column] for r in result['rows'])
+            after = result['next']
+        return values
+
+    proxy = AsyncpgProxiedQuery(sa.select([users.c.id, users.c.name]).apply_labels())
+    assert await pages(proxy, 'users_name') == ['admin', 'secretary', 'ceo', 'inter']
+
+    # Both columns are named "id": the key is the first one
+    others = users.alias('others')
+    query = sa.select([users.c.id, others.c.id]) \
+              .select_from(users.join(others, others.c.id == users.c.id + 1))
+    proxy = AsyncpgProxiedQuery(query)
+    assert await pages(proxy, 0) == [1, 2, 3]
+
+
+async def test_raw_json(connection, users):
+    from metapensiero.sqlalchemy.asyncpg import RawJSON, json_encode
+
+    tx = connection.transaction()
+    await tx.start()
+    try:
+        await connection.execute(users.update()
+                                 .where(users.c.name == 'admin')
+                                 .values(details={'roles': ['all']}))
+
+        query = users.select().where(users.c.name == 'admin')
+        proxy = AsyncpgProxiedQuery(query, raw_json=True)
+
+        result = await proxy(connection, result='rows', asdict=True)
+        details = result['rows'][0]['details']
+        assert isinstance(details, RawJSON)
+        assert '"details":{"roles": ["all"]}' in json_encode(result)
+
+        proxy = AsyncpgProxiedQuery(query, count_strategy='window', raw_json=True)
+        result = await proxy(connection, result='rows', count='count', asdict=True,
+                             limit=1)
+        assert str(result['rows'][0]['details']) == '{"roles": ["all"]}'
+
+        result = await proxy(connection, result='rows', asdict=True, limit=1,
+                             sorters=[dict(property='id')], after='')
+        assert str(result['rows'][0]['details']) == '{"roles": ["all"]}'
+
+        proxy = AsyncpgProxiedQuery(query)
+        result = await proxy(connection, result='rows', asdict=True)
+        assert result['rows'][0]['details'] == {'roles': ['all']}
+    finally:
+        await tx.rollback()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Read replicas routing tests
+# :Created:   sab 17 ott 2026 20:06:12 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+import asyncio
+
+import pytest
+import sqlalchemy as sa
+
+from metapensiero.sqlalchemy.asyncpg.replication import ReplicatedDatabase, is_read_only
+
+
+# All test coroutines will be treated as marked
+pytestmark = pytest.mark.asyncio
+
+
+class StubPool:
+    "Pretend to be a distinct server, counting the acquired connections."
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.acquired = 0
+
+    def acquire(self):
+        self.acquired += 1
+        return self.pool.acquire()
+
+    async def close(self):
+        pass
+
+
+def stub_pools(pool, count):
+    return StubPool(pool), [StubPool(pool) for i in range(count)]
+
+
+async def test_is_read_only(users):
+    assert is_read_only(users.select())
+    assert is_read_only(sa.union(users.select(), users.select()))
+    assert not is_read_only(users.select().with_for_update())
+    assert not is_read_only(users.insert().values(name='foo'))
+    assert not is_read_only('SELECT 1')
+
+
+async def test_invalid_strategy(pool):
+    with pytest.raises(ValueError):
+        ReplicatedDatabase(pool, [], strategy='random')
+
+
+async def test_round_robin(pool, users):
+    primary, replicas = stub_pools(pool, 2)
+    db = ReplicatedDatabase(primary, replicas)
+
+    q = sa.select([users.c.name]).where(users.c.id == 1)
+    for i in range(4):
+        assert await db.scalar(q) == 'admin'
+    assert [r.acquired for r in replicas] == [2, 2]
+    assert primary.acquired == 0
+
+    assert len([r async for r in db.iterate(users.select())]) == 4
+    assert [r.acquired for r in replicas] == [3, 2]
+
+    assert await db.scalar('SELECT 1') == 1
+    assert await db.fetchone(q.with_for_update())
+    assert await db.execute(users.update().values(password='nimda')
+                            .where(users.c.id == 0)) == 'UPDATE 0'
+    async with db.transaction() as conn:
+        assert await conn.scalar(q) == 'admin'
+    assert primary.acquired == 4
+    assert [r.acquired for r in replicas] == [3, 2]
+
+    stats = db.stats()
+    assert sorted(stats) == ['primary', 'replica1', 'replica2']
+    assert stats['primary']['requests'] == 4
+    assert stats['replica1']['requests'] == 3
+    assert stats['replica2']['outstanding'] == 0
+    assert stats['replica2']['average'] > 0
+
+
+async def test_least_outstanding(pool, users):
+    primary, replicas = stub_pools(pool, 2)
+    db = ReplicatedDatabase(primary, replicas, strategy='least-outstanding')
+
+    slow = sa.select([sa.func.pg_sleep(0.1)])
+    fast = sa.select([users.c.name]).where(users.c.id == 1)
+
+    async def reads():
+        # The slow query keeps the first replica busy, so the following ones
+        # are routed to the other
+        await asyncio.sleep(0.02)
+        for i in range(3):
+            assert await db.scalar(fast) == 'admin'
+
+    await asyncio.gather(db.scalar(slow), reads())
+    assert [r.acquired for r in replicas] == [1, 3]
+    assert db.stats()['replica1']['elapsed'] >= 0.1
+
+
+async def test_read_your_writes(pool, users):
+    primary, replicas = stub_pools(pool, 1)
+    db = ReplicatedDatabase(primary, replicas, read_your_writes=0.1)
+
+    q = sa.select([users.c.name]).where(users.c.id == 1)
+    assert await db.scalar(q) == 'admin'
+    assert replicas[0].acquired == 1
+
+    await db.execute(users.update().values(password='nimda').where(users.c.id == 0))
+    assert await db.scalar(q) == 'admin'
+    assert primary.acquired == 2
+    assert replicas[0].acquired == 1
+
+    await asyncio.sleep(0.1)
+    assert await db.scalar(q) == 'admin'
+    assert replicas[0].acquired == 2
+
+
+async def test_read_your_writes_coalescing(pool, users):
+    from metapensiero.sqlalchemy.asyncpg.coalescer import Coalescer
+
+    coalescer = Coalescer()
+    primary, replicas = stub_pools(pool, 1)
+    db = ReplicatedDatabase(primary, replicas, read_your_writes=10, coalescer=coalescer)
+
+    # Plain SQL reads go to the primary, but are not writes
+    assert await db.fetchall('SELECT 1')
+    assert db.last_write is None
+
+    q = sa.select([users.c.name, sa.func.pg_sleep(0.1)]).where(users.c.id == 1)
+
+    async def write_then_read():
+        await asyncio.sleep(0.02)
+        await db.execute(users.update().values(password='nimda').where(users.c.id == 0))
+        return await db.fetchall(q)
+
+    # The read after the write must not join the one in-flight on the replica
+    await asyncio.gather(db.fetchall(q), write_then_read())
+    assert coalescer.coalesced == 0
+    assert replicas[0].acquired == 1
+    assert primary.acquired == 3
+
+
+async def test_errors(pool):
+    primary, replicas = stub_pools(pool, 1)
+    db = ReplicatedDatabase(primary, replicas)
+
+    with pytest.raises(Exception):
+        await db.scalar(sa.select([sa.func.no_such_function()]))
+    assert db.stats()['replica1']['errors'] == 1
+    assert db.stats()['replica1']['outstanding'] == 0
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Result cache tests
+# :Created:   sab 17 ott 2026 17:48:30 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+import asyncio
+
+import pytest
+
+from metapensiero.sqlalchemy.asyncpg.proxy import AsyncpgProxiedQuery
+from metapensiero.sqlalchemy.asyncpg.resultcache import MemoryBackend, ResultCache
+
+
+# All test coroutines will be treated as marked
+pytestmark = pytest.mark.asyncio
+
+
+async def test_single_flight():
+    cache = ResultCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return ['result']
+
+    results = await asyncio.gather(*[cache.fetch('key', ['t'], compute)
+                                     for i in range(5)])
+    assert results == [['result']] * 5
+    assert len(calls) == 1
+    assert cache.stats() == {'hits': 0, 'misses': 1, 'coalesced': 4}
+
+    assert await cache.fetch('key', ['t'], compute) == ['result']
+    assert cache.hits == 1
+
+    await cache.invalidate('t')
+    assert await cache.fetch('key', ['t'], compute) == ['result']
+    assert len(calls) == 2
+
+
+async def test_errors_and_races():
+    cache = ResultCache(MemoryBackend(size=10))
+
+    async def failure():
+        await asyncio.sleep(0.01)
+        raise RuntimeError('Ouch')
+
+    results = await asyncio.gather(cache.fetch('key', ['t'], failure),
+                                   cache.fetch('key', ['t'], failure),
+                                   return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        return ['stale']
+
+    # An invalidation happening while computing the result prevents its caching
+    fetch = asyncio.ensure_future(cache.fetch('key', ['t'], compute))
+    await asyncio.sleep(0)
+    await cache.invalidate('t')
+    assert await fetch == ['stale']
+    assert await cache.backend.get('key') is None
+
+
+async def test_proxy(connection, users):
+    from metapensiero.sqlalchemy.asyncpg import hooks
+
+    cache = ResultCache(ttl=10)
+    proxy = AsyncpgProxiedQuery(users.select(), result_cache=cache)
+    assert proxy.getResultCacheTables() == ['users']
+
+    operations = []
+
+    def collect(context):
+        operations.append(context.operation)
+
+    hooks.register('before_execute', collect)
+    try:
+        first = await proxy(connection, result='rows', count='count', limit=2)
+        again = await proxy(connection, result='rows', count='count', limit=2)
+        assert again is first
+        assert operations == ['scalar', 'fetchall']
+
+        other = await proxy(connection, result='rows', count='count', limit=3)
+        assert len(other['rows']) == 3
+        assert len(operations) == 4
+
+        await cache.invalidate(users)
+        await proxy(connection, result='rows', count='count', limit=2)
+        assert len(operations) == 6
+
+        # The per-call conditions do not pollute the cache of compiled statements
+        from metapensiero.sqlalchemy.asyncpg.funcs import compiled_cache
+
+        size = len(compiled_cache)
+        key = proxy.getResultCacheKey([users.c.id == 1], {})
+        assert len(compiled_cache) == size
+        assert key == proxy.getResultCacheKey([users.c.id == 1], {})
+        assert key != proxy.getResultCacheKey([users.c.id == 2], {})
+
+        # Proxies with different options do not share their results
+        for options in (dict(raw_json=True), dict(count_policy='estimated'),
+                        dict(count_strategy='window')):
+            other = AsyncpgProxiedQuery(users.select(), result_cache=cache, **options)
+            assert other.getResultCacheKey([], {}) != proxy.getResultCacheKey([], {})
+    finally:
+        hooks.clear()
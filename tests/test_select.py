@@ -6,6 +6,7 @@
 # :Copyright: © 2016, 2017 Lele Gaifax
 #
 
+import asyncio
 import logging
 import pytest
 import sqlalchemy as sa
@@ -57,6 +58,22 @@ async def test_fetchone(pool, users):
         assert result['name'] == 'secretary'
 
 
+async def test_in_as_any(pool, users, monkeypatch):
+    from metapensiero.sqlalchemy.asyncpg.dialect import PGDialect_asyncpg
+
+    q = (sa.select([users.c.name])
+         .where(users.c.id.in_(sa.bindparam('ids', expanding=True)))
+         .order_by(users.c.name))
+    async with pool.acquire() as conn:
+        result = await asyncpg.fetchall(conn, q, named_args={'ids': [1, 3]})
+        assert [r['name'] for r in result] == ['admin', 'ceo']
+        assert await asyncpg.fetchall(conn, q, named_args={'ids': []}) == []
+
+        monkeypatch.setattr(PGDialect_asyncpg, 'in_as_any', True)
+        q = sa.select([sa.func.count()]).where(users.c.name.notin_(['admin', 'ceo']))
+        assert await asyncpg.scalar(conn, q) == 2
+
+
 async def test_slow_select(pool):
     from metapensiero.sqlalchemy.asyncpg.funcs import logger
 
@@ -78,3 +95,83 @@ async def test_slow_select(pool):
         assert handler.logs[1].levelname == 'WARNING'
     finally:
         logger.removeHandler(handler)
+
+
+async def test_lazy_prettification(pool, users):
+    from concurrent.futures import ThreadPoolExecutor
+    from metapensiero.sqlalchemy.asyncpg import funcs
+
+    class MyLogHandler(logging.Handler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.logs = []
+
+        def handle(self, record):
+            # When an executor is used, the statement must be already prettified
+            if funcs.prettify_executor is not None:
+                if record.args and isinstance(record.args[-1], funcs._PrettifiedSQL):
+                    assert record.args[-1].text is not None
+            self.logs.append(record)
+
+    handler = MyLogHandler()
+    funcs.logger.addHandler(handler)
+    funcs.prettified_cache.clear()
+    try:
+        q = sa.select([users.c.id]).where(users.c.name == sa.bindparam('name'))
+        async with pool.acquire() as conn:
+            await asyncpg.fetchone(conn, q, named_args={'name': 'admin'})
+            await asyncpg.fetchone(conn, q, named_args={'name': 'ceo'})
+        assert "'admin'" in handler.logs[0].getMessage()
+        assert "'ceo'" in handler.logs[2].getMessage()
+        assert funcs.prettified_cache.misses == 1
+        assert len(funcs.prettified_cache) == 1
+
+        handler.logs = []
+        funcs.prettify_executor = ThreadPoolExecutor(1)
+        try:
+            async with pool.acquire() as conn:
+                await asyncpg.fetchone(conn, q, named_args={'name': 'inter'})
+                await asyncio.sleep(0.1)
+        finally:
+            funcs.prettify_executor.shutdown()
+            funcs.prettify_executor = None
+        assert len(handler.logs) == 2
+        statement = [r for r in handler.logs
+                     if r.args and isinstance(r.args[-1], funcs._PrettifiedSQL)]
+        assert len(statement) == 1
+        assert "'inter'" in statement[0].getMessage()
+    finally:
+        funcs.logger.removeHandler(handler)
+
+
+async def test_prettification_failure(monkeypatch):
+    import pg_query
+    from metapensiero.sqlalchemy.asyncpg import funcs
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('Boom')
+
+    monkeypatch.setattr(pg_query, 'prettify', fail)
+    monkeypatch.setattr(funcs, '_prettify_failure_logged', False)
+
+    logs = []
+
+    class MyLogHandler(logging.Handler):
+        def handle(self, record):
+            logs.append(record)
+
+    handler = MyLogHandler()
+    funcs.logger.addHandler(handler)
+    level = funcs.logger.level
+    funcs.logger.setLevel(logging.DEBUG)
+    funcs.prettified_cache.clear()
+    try:
+        assert 'could not prettify' in str(funcs._PrettifiedSQL('SELECT 1', ()))
+        assert 'could not prettify' in str(funcs._PrettifiedSQL('SELECT 2', ()))
+        assert len(logs) == 1
+        assert logs[0].levelname == 'DEBUG'
+        assert logs[0].exc_info[0] is RuntimeError
+    finally:
+        funcs.logger.removeHandler(handler)
+        funcs.logger.setLevel(level)
+        funcs.prettified_cache.clear()
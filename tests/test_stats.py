@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# :Project:   metapensiero.sqlalchemy.asyncpg -- Execution statistics tests
+# :Created:   sab 17 ott 2026 14:35:02 CEST
+# :Author:    Lele Gaifax <lele@metapensiero.it>
+# :License:   GNU General Public License version 3 or later
+# :Copyright: © 2026 Lele Gaifax
+#
+
+import pytest
+import sqlalchemy as sa
+
+from metapensiero.sqlalchemy.asyncpg import compile, statistics
+from metapensiero.sqlalchemy.asyncpg.stats import StatisticsRegistry
+
+
+# All test coroutines will be treated as marked
+pytestmark = pytest.mark.asyncio
+
+
+async def test_registry():
+    registry = StatisticsRegistry(max_statements=3)
+    registry.record('SELECT 1', 0.002, 1)
+    registry.record('SELECT  1', 0.0005, 1)
+    registry.record('SELECT 2', 2.0, error=True)
+    registry.record('SELECT 3', 0.1, 1)
+    assert registry.dropped == 1
+
+    snapshot = registry.snapshot()
+    assert list(snapshot) == ['SELECT 2', 'SELECT 1']
+    one = snapshot['SELECT 1']
+    assert one['calls'] == 2
+    assert one['rows'] == 2
+    assert one['errors'] == 0
+    assert one['min_time'] == 0.0005
+    assert one['max_time'] == 0.002
+    assert one['mean_time'] == pytest.approx(0.00125)
+    assert one['histogram'][0.001] == 1
+    assert one['histogram'][0.005] == 1
+    two = snapshot['SELECT 2']
+    assert two['errors'] == 1
+    assert two['histogram'][5.0] == 1
+
+    registry.reset()
+    assert registry.snapshot() == {}
+    assert registry.dropped == 0
+
+
+async def test_statistics(connection, users):
+    q = sa.select([users.c.id]).where(users.c.name != sa.bindparam('name'))
+    statistics.reset()
+    statistics.enabled = True
+    try:
+        await connection.fetchall(q, named_args={'name': 'admin'})
+        await connection.fetchone(q, named_args={'name': 'ceo'})
+        with pytest.raises(Exception):
+            await connection.scalar('SELECT foo FROM bar')
+    finally:
+        statistics.enabled = False
+
+    snapshot = statistics.snapshot()
+    assert len(snapshot) == 2
+    sql, args = compile(q, named_args={'name': 'admin'})
+    stats = snapshot[' '.join(sql.split())]
+    assert stats['calls'] == 2
+    assert stats['rows'] == 4
+    assert snapshot['SELECT foo FROM bar']['errors'] == 1
+
+    statistics.reset()
+    await connection.fetchall(q, named_args={'name': 'admin'})
+    assert statistics.snapshot() == {}
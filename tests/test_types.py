@@ -153,3 +153,186 @@ async def test_jsonb(pool, users):
             assert details['stage'] == '[2017-01-31,2017-03-31)'
         finally:
             await tx.rollback()
+
+
+@pytest.mark.parametrize('backend', ['nssjson', 'orjson', 'ujson', 'json'])
+async def test_json_backends(backend):
+    from uuid import UUID
+    from metapensiero.sqlalchemy.asyncpg.types import json_codecs
+
+    if backend in ('orjson', 'ujson'):
+        pytest.importorskip(backend)
+
+    document = {'height': Decimal("1.69"),
+                'birthdate': date(1968, 3, 18),
+                'id': UUID('12345678-1234-5678-1234-567812345678'),
+                'stage': asyncpg.Range(date(2017, 1, 31), date(2017, 3, 31)),
+                'name': 'Lele'}
+
+    json_encode, json_decode, jsonb_encode, jsonb_decode = json_codecs(backend)
+    data = jsonb_encode(document)
+    assert data[0] == 1
+    assert jsonb_decode(data) == json_decode(json_encode(document))
+
+    result = jsonb_decode(data)
+    assert result['name'] == 'Lele'
+    assert result['stage'] == '[2017-01-31,2017-03-31)'
+    if backend == 'nssjson':
+        assert result['height'] == Decimal("1.69")
+        assert result['birthdate'] == date(1968, 3, 18)
+        assert result['id'] == document['id']
+    else:
+        assert result['height'] == 1.69
+        assert result['birthdate'] == '1968-03-18'
+        assert result['id'] == str(document['id'])
+
+
+async def test_unknown_json_backend():
+    from metapensiero.sqlalchemy.asyncpg.types import json_codecs
+
+    with pytest.raises(ValueError):
+        json_codecs('simplejson')
+
+
+async def test_raw_json(pool, users):
+    from asyncpg import connect
+    from metapensiero.sqlalchemy.asyncpg import raw_json, register_custom_codecs
+
+    from conftest import EXTENDED_CONN_ARGS
+
+    u = (users.update()
+         .where(users.c.name == 'secretary')
+         .values(details={'height': Decimal("1.69")}))
+    q = (sa.select([raw_json(users.c.details), users.c.details])
+         .where(users.c.name == 'secretary'))
+
+    async with pool.acquire() as conn:
+        tx = conn.transaction()
+        await tx.start()
+        try:
+            assert await asyncpg.execute(conn, u) == 'UPDATE 1'
+            raw, details = await asyncpg.fetchone(conn, q)
+            assert raw == b'{"height": 1.69}'
+            assert details == {'height': Decimal("1.69")}
+            assert asyncpg.json_encode({'raw': asyncpg.RawJSON(raw)}) == \
+                '{"raw":{"height": 1.69}}'
+        finally:
+            await tx.rollback()
+
+    conn = await connect(database='sasyncpg_test', **EXTENDED_CONN_ARGS)
+    try:
+        await register_custom_codecs(conn, json_backend='json', always_raw_json=True)
+        tx = conn.transaction()
+        await tx.start()
+        try:
+            assert await asyncpg.execute(conn, u) == 'UPDATE 1'
+            result = await asyncpg.fetchone(conn, q)
+            assert bytes(result['details']) == b'{"height": 1.69}'
+
+            u = (users.update()
+                 .where(users.c.name == 'secretary')
+                 .values(details='{"height": 1.70}'))
+            assert await asyncpg.execute(conn, u) == 'UPDATE 1'
+            result = await asyncpg.fetchone(conn, q)
+            assert bytes(result['details']) == b'{"height": 1.70}'
+
+            # The per-call switch is harmless
+            result = await asyncpg.fetchone(conn, q, raw_json=True)
+            assert str(result['details']) == '{"height": 1.70}'
+        finally:
+            await tx.rollback()
+    finally:
+        await conn.close()
+
+
+async def test_json_encode_raw_json():
+    from metapensiero.sqlalchemy.asyncpg import RawJSON, json_encode
+
+    assert json_encode(RawJSON('{"a": 1}')) == '{"a": 1}'
+
+    document = {'name': 'Lele',
+                'details': RawJSON(b'{"height": 1.69}'),
+                'history': [RawJSON(memoryview(b'x[1, 2]')[1:]), RawJSON('null')],
+                'stage': asyncpg.Range(date(2017, 1, 31), date(2017, 3, 31)),
+                'marker': '\x00RawJSON0:0'}
+    assert asyncpg.json_decode(json_encode(document)) == {
+        'name': 'Lele',
+        'details': {'height': Decimal('1.69')},
+        'history': [[1, 2], None],
+        'stage': '[2017-01-31,2017-03-31)',
+        'marker': '\x00RawJSON0:0'}
+    assert repr(RawJSON(b'[]')) == "RawJSON('[]')"
+
+
+@pytest.mark.parametrize('backend', ['nssjson', 'json'])
+async def test_json_codecs_raw_json(backend):
+    from metapensiero.sqlalchemy.asyncpg import RawJSON
+    from metapensiero.sqlalchemy.asyncpg.types import json_codecs
+
+    json_encode, json_decode, jsonb_encode, jsonb_decode = json_codecs(backend)
+    assert jsonb_encode(RawJSON('{"a":1}')) == b'\x01{"a":1}'
+    assert json_decode(json_encode({'a': RawJSON('[1]')})) == {'a': [1]}
+
+
+@pytest.mark.parametrize('backend', ['nssjson', 'orjson', 'ujson', 'json'])
+async def test_json_backends_splice_raw_json(backend):
+    from metapensiero.sqlalchemy.asyncpg import RawJSON
+    from metapensiero.sqlalchemy.asyncpg.types import json_codecs
+
+    if backend in ('orjson', 'ujson'):
+        pytest.importorskip(backend)
+
+    json_encode, json_decode, jsonb_encode, jsonb_decode = json_codecs(backend)
+    document = [{'a': RawJSON('{"b": [1, 2]}')}, {'c': RawJSON(b'null'), 'd': 'x'}]
+    # The raw documents are inserted verbatim, keeping their original spacing
+    assert json_encode(document) == b'[{"a":{"b": [1, 2]}},{"c":null,"d":"x"}]'
+
+
+async def test_raw_json_per_call(pool, users, connection):
+    from asyncpg import connect
+    from metapensiero.sqlalchemy.asyncpg import RawJSON
+
+    from conftest import EXTENDED_CONN_ARGS
+
+    u = (users.update()
+         .where(users.c.name == 'secretary')
+         .values(details={'height': Decimal("1.69")}))
+    q = (sa.select([users.c.name, users.c.details])
+         .where(users.c.name == 'secretary'))
+
+    tx = connection.transaction()
+    await tx.start()
+    try:
+        assert await connection.execute(u) == 'UPDATE 1'
+
+        result = await connection.fetchone(q, raw_json=True)
+        assert isinstance(result['details'], RawJSON)
+        assert bytes(result['details']) == b'{"height": 1.69}'
+        assert asyncpg.json_encode(dict(result)) == \
+            '{"name":"secretary","details":{"height": 1.69}}'
+
+        result = await connection.fetchall(q, raw_json=True)
+        assert str(result[0]['details']) == '{"height": 1.69}'
+        assert str(await connection.scalar(q.with_only_columns([users.c.details]),
+                                           raw_json=True)) == '{"height": 1.69}'
+
+        # The switch affects only that call
+        result = await connection.fetchone(q)
+        assert result['details'] == {'height': Decimal("1.69")}
+
+        # RawJSON values can be written too
+        u = (users.update()
+             .where(users.c.name == 'secretary')
+             .values(details=RawJSON(b'{"height": 1.70}')))
+        assert await connection.execute(u) == 'UPDATE 1'
+        result = await connection.fetchone(q)
+        assert result['details'] == {'height': Decimal("1.70")}
+    finally:
+        await tx.rollback()
+
+    conn = await connect(database='sasyncpg_test', **EXTENDED_CONN_ARGS)
+    try:
+        with pytest.raises(RuntimeError):
+            await asyncpg.fetchall(conn, q, raw_json=True)
+    finally:
+        await conn.close()